@@ -0,0 +1,108 @@
+# bot_apps/cards.py
+"""
+Карточки игр: текст, готовая HTML-подпись и клавиатура "Купить".
+
+Карточка строится один раз на версию строки игры (catalog_cache.product_version)
+и дальше отдаётся из словаря. Карточка с акцией, у которой есть дата окончания,
+строится заново после этой даты.
+"""
+import html
+import logging
+import math
+from collections import namedtuple
+from datetime import datetime
+
+from bot_apps import catalog_cache
+from bot_apps import keyboards as kb
+from bot_apps.models import Product
+
+logger = logging.getLogger(__name__)
+
+Card = namedtuple('Card', [
+    'id', 'game_name', 'text', 'caption', 'markup', 'image_urls', 'final_price', 'sale_text',
+])
+
+# Подпись названия в карточке по виду товара
+NAME_LABELS = {'steam': "Игра", 'windows': "Windows", 'office': "Office"}
+# Подписи полей attributes; неизвестные поля выводятся как есть
+ATTRIBUTE_LABELS = {'version': "Версия", 'edition': "Редакция"}
+
+_cards: dict[int, tuple[int, float, Card]] = {}   # id -> (версия игры, годна до (epoch), карточка)
+
+
+def apply_sale(game: Product) -> dict:
+    """
+    Итоговая цена и текст скидки/акции. Цену считает SQLite (effective_price);
+    акцию, конец которой уже прошёл, но планировщик ещё не снял, не учитываем.
+    """
+    price = float(game.price)
+    discount = game.discount or 0
+    now = datetime.now().timestamp()
+
+    sale_active = bool(game.sale_active) and bool(game.sale_not)
+    sale_end_ts = game.sale_end_ts
+    if sale_active and sale_end_ts is not None and sale_end_ts <= now:
+        sale_active = False
+
+    valid_until = math.inf
+    if sale_active:
+        final_price = game.effective_price
+        end_date = datetime.fromtimestamp(sale_end_ts).strftime("%Y-%m-%d") if sale_end_ts else "скоро"
+        sale_text = f"АКЦИЯ! {game.sale_not.strip()} до {end_date}"
+        if sale_end_ts is not None:
+            valid_until = sale_end_ts
+    elif game.sale_active and game.sale_percent is not None:
+        # Истёкшая акция ещё сидит в строке и в effective_price — цена без неё
+        final_price = price * (1 - discount / 100) if discount > 0 else price
+        sale_text = f"Скидка {discount}%" if discount > 0 else ""
+    else:
+        final_price = game.effective_price
+        sale_text = f"Скидка {discount}%" if discount > 0 else ""
+
+    return {
+        "final_price": round(final_price, 2),
+        "sale_text": sale_text,
+        "valid_until": valid_until,
+    }
+
+
+async def render(game: Product) -> Card:
+    """Карточка игры из кэша, а если игра или её акция изменились — строит заново."""
+    product_id = game.id
+    cached = _cards.get(product_id)
+    if (cached is not None and cached[0] == catalog_cache.product_version(product_id)
+            and datetime.now().timestamp() < cached[1]):
+        return cached[2]
+
+    sale = apply_sale(game)
+
+    text = (
+        f"*ID*: {product_id}\n"
+        f"*{NAME_LABELS.get(game.product_type, 'Товар')}*: {game.game_name}\n"
+        f"*Цена*: ${sale['final_price']:.2f}"
+    )
+    if sale['sale_text']:
+        text += f"\n{sale['sale_text']}"
+    if game.genre:
+        text += f"\n*Жанр*: {game.genre}"
+    if game.region:
+        text += f"\n*Регион*: {game.region or 'Глобальный'}"
+    for name, value in game.attribute_map().items():
+        text += f"\n*{ATTRIBUTE_LABELS.get(name, name)}*: {value}"
+
+    card = Card(
+        id=product_id,
+        game_name=game.game_name,
+        text=text,
+        caption=html.escape(text),
+        markup=kb.get_game_actions_keyboard(product_id, item_type="game"),
+        image_urls=tuple(url.strip() for url in (game.image_urls or '').split(',') if url.strip()),
+        final_price=sale['final_price'],
+        sale_text=sale['sale_text'],
+    )
+    _cards[product_id] = (catalog_cache.product_version(product_id), sale['valid_until'], card)
+    return card
+
+
+async def render_all(games: list[Product]) -> list[Card]:
+    return [await render(game) for game in games]
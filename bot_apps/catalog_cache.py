@@ -0,0 +1,182 @@
+# bot_apps/catalog_cache.py
+"""
+Каталог steam_keys в памяти процесса.
+
+Загружается при старте, дальше чтения каталога (страницы каталога, фильтры,
+поиск) идут отсюда. Каждая запись в steam_keys обязана вызвать refresh()
+или remove() для изменённой игры — иначе кэш отстанет от базы.
+Вместе с кэшем обновляются индекс нечёткого поиска (fuzzy_search)
+и распределение цен (price_index).
+Игры хранятся как models.Product.
+"""
+import asyncio
+import bisect
+import logging
+
+from bot_apps import fuzzy_search, pool, price_index
+from bot_apps.models import PRODUCT_COLUMNS, Product, product_factory
+
+logger = logging.getLogger(__name__)
+
+_products: dict[int, Product] = {}   # id -> игра (все игры, и без остатка тоже)
+_in_stock_ids: list[int] = []        # отсортированные id игр с count > 0
+_in_stock_by_type: dict[str, list[int]] = {}   # вид товара -> такой же список только его id
+_versions: dict[int, int] = {}       # id -> значение version при последнем изменении игры
+_loaded = False
+_load_lock = asyncio.Lock()
+# id -> замок refresh(): чтение и применение строки одной игры идут по очереди,
+# иначе старое чтение может лечь в кэш поверх нового. Замков не больше, чем игр.
+_refresh_locks: dict[int, asyncio.Lock] = {}
+# Растёт при любом изменении каталога — ключ для кэшей, построенных поверх него
+version = 0
+# Растёт, только когда меняется состав витрины: товар добавлен или удалён,
+# появился в наличии или закончился, сменил название, жанр или вид. Остаток и
+# цена его не трогают — ключ для кэшей поиска и жанров, которым они не важны.
+listing_version = 0
+
+PRODUCT_BY_ID_SQL = f'SELECT {PRODUCT_COLUMNS} FROM steam_keys WHERE id = ?'
+
+
+async def load():
+    """(Пере)загружает весь каталог одним запросом."""
+    global _loaded, version, listing_version
+    async with _load_lock:
+        async with pool.connection() as db:
+            cursor = await db.execute(f'SELECT {PRODUCT_COLUMNS} FROM steam_keys ORDER BY id')
+            cursor.row_factory = product_factory
+            products = await cursor.fetchall()
+
+        version += 1
+        listing_version += 1
+        _products.clear()
+        _in_stock_ids.clear()
+        _in_stock_by_type.clear()
+        _versions.clear()
+        for product in products:
+            _products[product.id] = product
+            _versions[product.id] = version
+            if product.in_stock:
+                _in_stock_ids.append(product.id)
+                _in_stock_by_type.setdefault(product.product_type, []).append(product.id)
+        fuzzy_search.rebuild((product.id, product.game_name) for product in products)
+        price_index.rebuild(products)
+        _loaded = True
+        logger.info(f"Каталог загружен в память: {len(_products)} игр, в наличии {len(_in_stock_ids)}")
+
+
+async def ensure_loaded():
+    if not _loaded:
+        await load()
+
+
+def invalidate():
+    """Полный сброс: следующее чтение перечитает каталог из базы."""
+    global _loaded
+    _loaded = False
+
+
+def _set_listed(ids: list[int], product_id: int, listed: bool):
+    """Добавляет id в отсортированный список или убирает из него."""
+    pos = bisect.bisect_left(ids, product_id)
+    present = pos < len(ids) and ids[pos] == product_id
+    if listed and not present:
+        ids.insert(pos, product_id)
+    elif not listed and present:
+        del ids[pos]
+
+
+def _listed_as(product: Product) -> tuple:
+    """Поля, изменение которых меняет listing_version."""
+    return product.game_name, product.genre, product.product_type, product.in_stock
+
+
+def _put(product: Product):
+    global version, listing_version
+    version += 1
+    product_id = product.id
+    old = _products.get(product_id)
+    if old is None or _listed_as(old) != _listed_as(product):
+        listing_version += 1
+    _products[product_id] = product
+    _versions[product_id] = version
+    fuzzy_search.set_name(product_id, product.game_name)
+    price_index.put(product)
+    _set_listed(_in_stock_ids, product_id, product.in_stock)
+    if old is not None and old.product_type != product.product_type:
+        _set_listed(_in_stock_by_type.get(old.product_type, []), product_id, False)
+    _set_listed(_in_stock_by_type.setdefault(product.product_type, []), product_id, product.in_stock)
+
+
+def remove(product_id: int):
+    """Убирает игру из кэша (после удаления из базы)."""
+    global version, listing_version
+    version += 1
+    listing_version += 1
+    old = _products.pop(product_id, None)
+    _versions.pop(product_id, None)
+    fuzzy_search.remove(product_id)
+    price_index.remove(product_id)
+    _set_listed(_in_stock_ids, product_id, False)
+    if old is not None:
+        _set_listed(_in_stock_by_type.get(old.product_type, []), product_id, False)
+
+
+async def refresh(product_id: int):
+    """
+    Перечитывает одну игру из базы после записи в неё. Вызовы для одной игры
+    выполняются по очереди: каждое следующее чтение начинается после того, как
+    предыдущее применено, и видит не более старую строку.
+    """
+    if not _loaded:
+        return  # кэш и так перечитается целиком при первом чтении
+    lock = _refresh_locks.setdefault(product_id, asyncio.Lock())
+    async with lock:
+        async with pool.connection() as db:
+            cursor = await db.execute(PRODUCT_BY_ID_SQL, (product_id,))
+            cursor.row_factory = product_factory
+            product = await cursor.fetchone()
+        if product is None:
+            remove(product_id)
+        else:
+            _put(product)
+
+
+def product_version(product_id: int) -> int:
+    """Версия строки игры: меняется при каждом refresh() этой игры."""
+    return _versions.get(product_id, 0)
+
+
+async def get(product_id: int) -> Product | None:
+    await ensure_loaded()
+    return _products.get(product_id)
+
+
+def _in_stock_list(product_type: str | None) -> list[int]:
+    if product_type is None:
+        return _in_stock_ids
+    return _in_stock_by_type.get(product_type, [])
+
+
+async def in_stock(product_type: str | None = None) -> list[Product]:
+    """Товары в наличии (все или одного вида), по возрастанию id."""
+    await ensure_loaded()
+    return [_products[product_id] for product_id in _in_stock_list(product_type)]
+
+
+async def in_stock_page(after_id: int | None = None, before_id: int | None = None,
+                        limit: int = 10, product_type: str | None = None) -> tuple[list[Product], int, int]:
+    """
+    Страница товаров в наличии по ключу id (keyset): после after_id или перед before_id.
+    product_type — только товары этого вида.
+    Возвращает (товары, позиция первого в списке, всего в наличии).
+    """
+    await ensure_loaded()
+    ids = _in_stock_list(product_type)
+    total = len(ids)
+    if before_id is not None:
+        end = bisect.bisect_left(ids, before_id)
+        start = max(0, end - limit)
+    else:
+        start = bisect.bisect_right(ids, after_id) if after_id is not None else 0
+        end = min(total, start + limit)
+    return [_products[product_id] for product_id in ids[start:end]], start, total
@@ -0,0 +1,198 @@
+# bot_apps/catalog_filter.py
+"""
+Комбинированный фильтр каталога: цена с учётом акций (effective_price),
+жанры, регион, "только со скидкой" и сортировка.
+
+Фильтр (FilterSpec) хранится на сервере под коротким токеном — callback_data
+ограничена 64 байтами, поэтому в кнопки уходит только "flt:<токен>:<курсор>".
+Каждая страница — один запрос с LIMIT по ключу сортировки (keyset):
+курсор — ключ сортировки крайней игры страницы, например (effective_price, id),
+и едет в кнопке целиком. Строку курсора запрос не перечитывает, поэтому
+удалённая, подешевевшая или закончившаяся игра страницу не обрывает.
+"""
+import hashlib
+from collections import OrderedDict
+from dataclasses import dataclass, replace
+
+from bot_apps import catalog_cache, pool, price_index
+
+TOKEN_CACHE_SIZE = 1024
+
+# Сортировка: (колонки ORDER BY — последней всегда id, подпись)
+SORTS = {
+    'price': (('s.effective_price', 's.id'), "сначала дешёвые"),
+    'new': (('s.id',), "сначала новые"),
+}
+_DESCENDING = {'new'}
+
+
+@dataclass(frozen=True, slots=True)
+class FilterSpec:
+    price_min: float | None = None
+    price_max: float | None = None
+    genre_ids: frozenset = frozenset()
+    region: str | None = None
+    on_sale: bool = False
+    sort: str = 'price'
+    product_type: str = 'steam'
+
+
+_specs: OrderedDict[str, FilterSpec] = OrderedDict()   # токен -> фильтр (LRU)
+
+
+def token_for(spec: FilterSpec) -> str:
+    """Короткий токен фильтра; одинаковые фильтры получают один и тот же токен."""
+    key = (f"{spec.price_min}|{spec.price_max}|{','.join(map(str, sorted(spec.genre_ids)))}|"
+           f"{spec.region}|{int(spec.on_sale)}|{spec.sort}|{spec.product_type}")
+    token = hashlib.blake2b(key.encode(), digest_size=6).hexdigest()
+    _specs[token] = spec
+    _specs.move_to_end(token)
+    if len(_specs) > TOKEN_CACHE_SIZE:
+        _specs.popitem(last=False)
+    return token
+
+
+def get_spec(token: str) -> FilterSpec | None:
+    """Фильтр по токену; None — токен устарел (вытеснен или бот перезапускался)."""
+    spec = _specs.get(token)
+    if spec is not None:
+        _specs.move_to_end(token)
+    return spec
+
+
+async def available_regions(product_type: str | None = None) -> list[str]:
+    """Регионы товаров в наличии (из кэша каталога)."""
+    return sorted({game.region for game in await catalog_cache.in_stock(product_type) if game.region},
+                  key=str.casefold)
+
+
+async def apply_action(spec: FilterSpec, action: str) -> FilterSpec:
+    """
+    Одно изменение фильтра из кнопки конструктора:
+    p — следующая ценовая корзина (price_index), g<id> — вкл/выкл жанр, r — следующий регион,
+    s — вкл/выкл "только со скидкой", o — следующая сортировка.
+    """
+    if action == 'p':
+        await catalog_cache.ensure_loaded()
+        ranges = [(None, None), *((bucket.min_price, bucket.max_price) for bucket in price_index.buckets(spec.product_type))]
+        current = (spec.price_min, spec.price_max)
+        index = ranges.index(current) + 1 if current in ranges else 0
+        price_min, price_max = ranges[index % len(ranges)]
+        return replace(spec, price_min=price_min, price_max=price_max)
+    if action.startswith('g') and action[1:].isdigit():
+        return replace(spec, genre_ids=spec.genre_ids ^ {int(action[1:])})
+    if action == 'r':
+        regions = [None, *await available_regions(spec.product_type)]
+        index = regions.index(spec.region) + 1 if spec.region in regions else 0
+        return replace(spec, region=regions[index % len(regions)])
+    if action == 's':
+        return replace(spec, on_sale=not spec.on_sale)
+    if action == 'o':
+        sorts = list(SORTS)
+        return replace(spec, sort=sorts[(sorts.index(spec.sort) + 1) % len(sorts)])
+    return spec
+
+
+def describe_price(spec: FilterSpec) -> str:
+    if spec.price_min is None and spec.price_max is None:
+        return "любая"
+    if spec.price_min is None:
+        return f"до ${spec.price_max:g}"
+    if spec.price_max is None:
+        return f"от ${spec.price_min:g}"
+    return f"${spec.price_min:g}–${spec.price_max:g}"
+
+
+def describe(spec: FilterSpec, genre_names: dict[int, str]) -> str:
+    """'цена до $10, Экшн или RPG, регион RU, только со скидкой, сначала дешёвые'"""
+    parts = []
+    if spec.price_min is not None or spec.price_max is not None:
+        parts.append(f"цена {describe_price(spec)}")
+    if spec.genre_ids:
+        parts.append(" или ".join(sorted(genre_names.get(genre_id, f"#{genre_id}") for genre_id in spec.genre_ids)))
+    if spec.region:
+        parts.append(f"регион {spec.region}")
+    if spec.on_sale:
+        parts.append("только со скидкой")
+    parts.append(SORTS[spec.sort][1])
+    return ", ".join(parts)
+
+
+def encode_cursor(key: tuple) -> str:
+    """Ключ сортировки -> текст для callback_data: (12.5, 7) -> '12.5_7'."""
+    return "_".join(map(repr, key))
+
+
+def decode_cursor(spec: FilterSpec, text: str) -> tuple | None:
+    """Текст курсора -> ключ сортировки фильтра spec; None — пустой или чужой формат."""
+    parts = text.split("_") if text else []
+    columns = SORTS[spec.sort][0]
+    if len(parts) != len(columns):
+        return None
+    try:
+        return (*map(float, parts[:-1]), int(parts[-1]))
+    except ValueError:
+        return None
+
+
+def compile_query(spec: FilterSpec, after: tuple | None = None, before: tuple | None = None,
+                  limit: int = 10) -> tuple[str, list]:
+    """
+    SQL одной страницы: ключи сортировки (последний элемент — id) игр в наличии,
+    подходящих под фильтр, после курсора after (или перед before — тогда в
+    обратном порядке), не больше limit.
+    """
+    where = ["s.count > 0", "s.product_type = ?"]
+    params = [spec.product_type]
+    if spec.price_min is not None:
+        where.append("s.effective_price >= ?")
+        params.append(spec.price_min)
+    if spec.price_max is not None:
+        where.append("s.effective_price <= ?")
+        params.append(spec.price_max)
+    if spec.genre_ids:
+        genre_ids = sorted(spec.genre_ids)
+        where.append(
+            f"s.id IN (SELECT product_id FROM product_genres WHERE genre_id IN ({', '.join('?' * len(genre_ids))}))"
+        )
+        params.extend(genre_ids)
+    if spec.region:
+        where.append("s.region = ? COLLATE NOCASE")
+        params.append(spec.region)
+    if spec.on_sale:
+        where.append("s.effective_price < s.price")
+
+    columns = SORTS[spec.sort][0]
+    descending = spec.sort in _DESCENDING
+    cursor = after if after is not None else before
+    backwards = before is not None and after is None
+    if cursor is not None:
+        # После курсора — дальше по порядку сортировки, перед курсором — наоборот
+        op = '<' if descending != backwards else '>'
+        where.append(f"({', '.join(columns)}) {op} ({', '.join('?' * len(columns))})")
+        params.extend(cursor)
+
+    direction = 'DESC' if descending != backwards else 'ASC'
+    order = ", ".join(f"{column} {direction}" for column in columns)
+    sql = f"SELECT {', '.join(columns)} FROM steam_keys s WHERE {' AND '.join(where)} ORDER BY {order} LIMIT ?"
+    params.append(limit)
+    return sql, params
+
+
+async def find_page(spec: FilterSpec, after: tuple | None = None, before: tuple | None = None,
+                    limit: int = 10) -> tuple[list[tuple], bool, bool]:
+    """
+    Ключи сортировки игр страницы по порядку (id — последний элемент ключа)
+    + (есть ли страница до, есть ли после).
+    """
+    sql, params = compile_query(spec, after, before, limit + 1)
+    async with pool.connection() as db:
+        cursor = await db.execute(sql, params)
+        keys = [tuple(row) for row in await cursor.fetchall()]
+
+    more = len(keys) > limit
+    keys = keys[:limit]
+    if before is not None and after is None:
+        keys.reverse()
+        return keys, more, True
+    return keys, after is not None, more
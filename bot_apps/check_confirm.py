@@ -0,0 +1,113 @@
+# check_confirm.py
+"""
+Нагрузочная проверка подтверждения заказов: много админов жмут "Подтвердить" разом.
+
+На временной базе заводит товар с ORDERS ключами, создаёт ORDERS заказов и
+параллельно шлёт CLICKS подтверждений на каждый (плюс по одной отмене на
+каждый пятый заказ). Падает (код 1), если какой-то заказ подтвердился дважды,
+ключ ушёл двум покупателям или остаток разошёлся с числом свободных ключей.
+
+    python -m bot_apps.check_confirm            # 100 заказов x 5 нажатий
+    python -m bot_apps.check_confirm 300 10
+"""
+import asyncio
+import os
+import random
+import sys
+import tempfile
+import time
+
+from bot_apps import catalog_cache, db, db_user, migrations, pool, writer
+
+ORDERS = 100
+CLICKS = 5
+
+
+async def check(db_name: str, orders: int, clicks: int) -> bool:
+    await migrations.migrate(db_name)
+    await pool.open_pool(pool.POOL_SIZE, db_name)
+    await writer.start_writer(db_name)
+    try:
+        await catalog_cache.load()
+        keys = "\n".join(f"KEY-{n:05d}" for n in range(orders))
+        await db_user.add_steam_key_into_db("Stress Game", keys, 10.0)
+        async with pool.connection() as conn:
+            cursor = await conn.execute("SELECT id FROM steam_keys WHERE game_name = ?", ("Stress Game",))
+            product_id = (await cursor.fetchone())[0]
+
+        order_ids = []
+        for user_id in range(1, orders + 1):
+            success, msg, order_data = await db_user.create_order(user_id, product_id)
+            if not success:
+                print(f"Не удалось создать заказ: {msg}")
+                return False
+            order_ids.append(order_data['order_id'])
+
+        calls = [('confirm', order_id) for order_id in order_ids for _ in range(clicks)]
+        calls += [('cancel', order_id) for order_id in order_ids[::5]]
+        random.shuffle(calls)
+
+        async def call(action, order_id):
+            if action == 'confirm':
+                success, _, order_data = await db_user.confirm_order(order_id)
+                return action, order_id, success, order_data['key'] if success else None
+            success, _ = await db_user.cancel_order(order_id)
+            return action, order_id, success, None
+
+        started = time.perf_counter()
+        results = await asyncio.gather(*(call(action, order_id) for action, order_id in calls))
+        elapsed = time.perf_counter() - started
+
+        ok = True
+        outcome: dict[int, list[str]] = {order_id: [] for order_id in order_ids}
+        delivered = []
+        for action, order_id, success, key in results:
+            if success:
+                outcome[order_id].append(action)
+                if key is not None:
+                    delivered.append(key)
+        for order_id, actions in outcome.items():
+            if len(actions) != 1:
+                print(f"[FAIL] заказ #{order_id}: успешных действий {len(actions)} ({actions})")
+                ok = False
+        if len(delivered) != len(set(delivered)):
+            print("[FAIL] один и тот же ключ выдан дважды")
+            ok = False
+
+        async with pool.connection() as conn:
+            cursor = await conn.execute(
+                "SELECT "
+                "(SELECT count FROM steam_keys WHERE id = ?), "
+                "(SELECT COUNT(*) FROM product_keys WHERE product_id = ? AND status = 'available'), "
+                "(SELECT COUNT(*) FROM product_keys WHERE product_id = ? AND status = 'sold'), "
+                "(SELECT COUNT(*) FROM orders WHERE status = 'delivered'), "
+                "(SELECT COUNT(*) FROM order_events WHERE to_status = 'delivered')",
+                (product_id, product_id, product_id)
+            )
+            count, available, sold, confirmed, delivered_events = await cursor.fetchone()
+        if count != available:
+            print(f"[FAIL] остаток {count}, свободных ключей {available}")
+            ok = False
+        if not (sold == confirmed == delivered_events == len(delivered)):
+            print(f"[FAIL] продано ключей {sold}, выдано заказов {confirmed}, событий выдачи {delivered_events}, "
+                  f"ключей покупателям {len(delivered)}")
+            ok = False
+
+        print(f"{len(calls)} параллельных действий над {orders} заказами за {elapsed:.2f} с: "
+              f"подтверждено {len(delivered)}, отменено {orders - len(delivered)}, остаток {count}")
+        return ok
+    finally:
+        await db.close_db()
+
+
+def main():
+    orders = int(sys.argv[1]) if len(sys.argv) > 1 else ORDERS
+    clicks = int(sys.argv[2]) if len(sys.argv) > 2 else CLICKS
+    with tempfile.TemporaryDirectory() as tmp:
+        ok = asyncio.run(check(os.path.join(tmp, 'confirm.db'), orders, clicks))
+    print("Каждый заказ обработан ровно один раз." if ok else "Есть заказы, обработанные неверно!")
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    main()
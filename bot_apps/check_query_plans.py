@@ -0,0 +1,111 @@
+# check_query_plans.py
+"""
+Проверка, что горячие запросы идут по индексам.
+
+Берёт все константы *_SQL из db_user, db_admin, handlers, order_reaper,
+order_states и sale_scheduler, плюс типичные запросы
+catalog_filter.compile_query, прогоняет EXPLAIN QUERY PLAN и падает (код 1),
+если какой-то запрос проходит таблицу или индекс целиком (SCAN) и не записан
+в ALLOWED_SCANS. Страницы каталога
+(keyset) вдобавок не должны сортировать выборку во временном B-дереве.
+
+    python -m bot_apps.check_query_plans            # на свежей базе во временной папке
+    python -m bot_apps.check_query_plans tg_bot.db  # на своей базе (после миграций)
+"""
+import asyncio
+import os
+import sys
+import tempfile
+
+from bot_apps import (
+    catalog_filter, db_admin, db_user, handlers, migrations, order_reaper, order_states, pool, sale_scheduler,
+)
+from bot_apps.catalog_filter import FilterSpec
+
+MODULES = (db_user, db_admin, handlers, order_reaper, order_states, sale_scheduler)
+
+# Запросы, которым полный проход разрешён, — с причиной
+ALLOWED_SCANS = {
+    'db_admin.DAILY_ORDER_STATS_SQL': "отчёт админа по всем заказам, по индексу дня",
+    'db_admin.USERS_OVERVIEW_SQL': "отчёт админа по всем пользователям, покрывающий индекс",
+    'db_user.GENRE_FACETS_SQL': "счётчики жанров, кэшируются до изменения каталога",
+    'sale_scheduler.SCHEDULED_SALES_SQL': "частичный индекс — только игры с заведённой акцией",
+}
+
+# Типичные фильтры каталога: (название, фильтр, курсор after, курсор before)
+FILTER_CASES = (
+    ("default", FilterSpec(), None, None),
+    ("price,next", FilterSpec(price_min=5, price_max=20), (10.0, 1), None),
+    ("price,prev", FilterSpec(price_max=20), None, (10.0, 1)),
+    ("genres,region", FilterSpec(genre_ids=frozenset({1, 2}), region='RU'), (10.0, 1), None),
+    ("on_sale,new", FilterSpec(on_sale=True, sort='new'), (1,), None),
+    ("windows,new,prev", FilterSpec(sort='new', product_type='windows'), None, (1,)),
+)
+
+
+def collect_queries():
+    queries = {}
+    for module in MODULES:
+        for name, value in vars(module).items():
+            if name.endswith('_SQL') and name.isupper() and isinstance(value, str):
+                queries[f"{module.__name__.rsplit('.', 1)[-1]}.{name}"] = value
+    for case, spec, after, before in FILTER_CASES:
+        sql, _ = catalog_filter.compile_query(spec, after, before)
+        queries[f"catalog_filter.compile_query[{case}]"] = sql
+    return queries
+
+
+def _uses_virtual_index(detail: str) -> bool:
+    # FTS5: 'SCAN f VIRTUAL TABLE INDEX 0:M2' — после двоеточия ограничения (M = MATCH),
+    # пусто после двоеточия — полный проход по виртуальной таблице
+    if 'VIRTUAL TABLE INDEX' not in detail:
+        return False
+    return bool(detail.rsplit(':', 1)[-1].strip())
+
+
+def full_scans(plan_rows):
+    """Строки плана 'SCAN ...' — полный проход по таблице или по индексу целиком."""
+    bad = []
+    for row in plan_rows:
+        detail = row[3]
+        if detail.startswith('SCAN') and 'CONSTANT ROW' not in detail and not _uses_virtual_index(detail):
+            bad.append(detail)
+    return bad
+
+
+async def check(db_name: str) -> bool:
+    await migrations.migrate(db_name)
+    db = await pool.open_connection(db_name)
+    ok = True
+    try:
+        for name, sql in sorted(collect_queries().items()):
+            params = [None] * sql.count('?')
+            cursor = await db.execute('EXPLAIN QUERY PLAN ' + sql, params)
+            rows = await cursor.fetchall()
+            bad = full_scans(rows)
+            if name.startswith('catalog_filter.'):
+                bad += [row[3] for row in rows if 'TEMP B-TREE' in row[3]]
+            allowed = bad and name in ALLOWED_SCANS
+            status = "allow" if allowed else "FAIL" if bad else "ok"
+            print(f"[{status}] {name}" + (f" — {ALLOWED_SCANS[name]}" if allowed else ""))
+            for row in rows:
+                print(f"        {row[3]}")
+            if bad and not allowed:
+                ok = False
+    finally:
+        await db.close()
+    return ok
+
+
+def main():
+    if len(sys.argv) > 1:
+        ok = asyncio.run(check(sys.argv[1]))
+    else:
+        with tempfile.TemporaryDirectory() as tmp:
+            ok = asyncio.run(check(os.path.join(tmp, 'plans.db')))
+    print("Все запросы используют индексы." if ok else "Есть запросы с полным проходом по таблице!")
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,13 +1,19 @@
+import asyncio
 import aiosqlite
+from collections import Counter
+from bot_apps import order_states, pool, writer
 import logging
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+IS_ADMIN_SQL = 'SELECT COUNT(*) FROM admins WHERE tg_id = ?'
+
+
 async def is_admin(tg_id: int) -> bool:
     try:
-        async with aiosqlite.connect('tg_bot.db') as db:
-            cursor = await db.execute('SELECT COUNT(*) FROM admins WHERE tg_id = ?', (tg_id,))
+        async with pool.connection() as db:
+            cursor = await db.execute(IS_ADMIN_SQL, (tg_id,))
             count = (await cursor.fetchone())[0]
             return count > 0
     except aiosqlite.Error as e:
@@ -16,30 +22,28 @@ async def is_admin(tg_id: int) -> bool:
 
 async def add_admin(tg_id: int, name: str):
     try:
-        async with aiosqlite.connect('tg_bot.db') as db:
-            await db.execute('INSERT OR IGNORE INTO admins (tg_id, name) VALUES (?, ?)', (tg_id, name))
-            await db.commit()
-            return True, f"Администратор {name} (ID: {tg_id}) добавлен."
+        await writer.execute('INSERT OR IGNORE INTO admins (tg_id, name) VALUES (?, ?)', (tg_id, name))
+        return True, f"Администратор {name} (ID: {tg_id}) добавлен."
     except Exception as e:
         return False, f"Ошибка при добавлении администратора: {e}"
 
 async def remove_admin(tg_id: int):
+    async def op(db):
+        cursor = await db.execute('SELECT name FROM admins WHERE tg_id = ?', (tg_id,))
+        admin = await cursor.fetchone()
+        if admin:
+            await db.execute('DELETE FROM admins WHERE tg_id = ?', (tg_id,))
+            return True, f"Администратор {admin[0]} (ID: {tg_id}) удалён."
+        return False, "Администратор не найден."
+
     try:
-        async with aiosqlite.connect('tg_bot.db') as db:
-            cursor = await db.execute('SELECT name FROM admins WHERE tg_id = ?', (tg_id,))
-            admin = await cursor.fetchone()
-            if admin:
-                await db.execute('DELETE FROM admins WHERE tg_id = ?', (tg_id,))
-                await db.commit()
-                return True, f"Администратор {admin[0]} (ID: {tg_id}) удалён."
-            return False, "Администратор не найден."
+        return await writer.submit(op)
     except Exception as e:
         return False, f"Ошибка при удалении администратора: {e}"
 
 async def get_admins():
     try:
-        async with aiosqlite.connect('tg_bot.db') as db:
-            db.row_factory = aiosqlite.Row
+        async with pool.connection() as db:
             cursor = await db.execute('SELECT tg_id, name FROM admins')
             admins = await cursor.fetchall()
             if admins:
@@ -50,100 +54,100 @@ async def get_admins():
         return False, f"Произошла ошибка при загрузке списка администраторов: {e}"
 
 
+# Общая статистика не пересчитывается по orders: счётчики по статусам и выручку
+# ведём по журналу order_events, дочитывая его с последнего обработанного id.
+# Журнал пишет только писатель, целыми транзакциями, так что id видны без пропусков.
+ORDER_EVENTS_SINCE_SQL = """
+    SELECT id, from_status, to_status, amount
+    FROM order_events
+    WHERE id > ?
+    ORDER BY id
+"""
+
+_status_counts: Counter = Counter()   # статус -> сколько заказов в нём сейчас
+_revenue = 0.0                        # сумма amount по выдачам
+_last_event_id = 0
+_events_lock = asyncio.Lock()
+
+
+async def _consume_order_events():
+    """Дочитывает новые события журнала и обновляет счётчики."""
+    global _revenue, _last_event_id
+    async with _events_lock:
+        async with pool.connection() as db:
+            cursor = await db.execute(ORDER_EVENTS_SINCE_SQL, (_last_event_id,))
+            rows = await cursor.fetchall()
+        for row in rows:
+            if row['from_status'] is not None:
+                _status_counts[row['from_status']] -= 1
+            _status_counts[row['to_status']] += 1
+            if row['to_status'] == order_states.DELIVERED and row['amount']:
+                _revenue += row['amount']
+        if rows:
+            _last_event_id = rows[-1]['id']
+
+
 async def get_global_order_stats():
     """
     Общая статистика по всем заказам.
     Возвращает: (success: bool, message: str, data: dict | None)
     """
     try:
-        async with aiosqlite.connect('tg_bot.db') as db:
-            db.row_factory = aiosqlite.Row
-
-            # Основные цифры
-            cursor = await db.execute(
-                """
-                SELECT
-                    COUNT(*) AS total,
-                    SUM(CASE WHEN status = 'confirmed' THEN 1 ELSE 0 END) AS confirmed,
-                    SUM(CASE WHEN status = 'cancelled' THEN 1 ELSE 0 END) AS cancelled,
-                    SUM(CASE WHEN status = 'pending'   THEN 1 ELSE 0 END) AS pending
-                FROM orders
-                """
-            )
-            row = await cursor.fetchone()
-
-            # Выручка по подтверждённым
-            cursor = await db.execute(
-                """
-                SELECT
-                    COALESCE(SUM(sk.price), 0) AS revenue
-                FROM orders o
-                JOIN steam_keys sk ON sk.id = o.key_id
-                WHERE o.status = 'confirmed'
-                """
-            )
-            rev_row = await cursor.fetchone()
-            revenue = rev_row["revenue"]
-
-            text = (
-                "📊 Общая статистика заказов:\n"
-                f"Всего заказов: {row['total']}\n"
-                f"Подтверждено: {row['confirmed']}\n"
-                f"Отменено: {row['cancelled']}\n"
-                f"В ожидании: {row['pending']}\n"
-                f"Выручка: {revenue}"
-            )
-
-            data = {
-                "total": row["total"],
-                "confirmed": row["confirmed"],
-                "cancelled": row["cancelled"],
-                "pending": row["pending"],
-                "revenue": revenue,
-            }
-
-            return True, text, data
+        await _consume_order_events()
+
+        data = {
+            "total": sum(_status_counts.values()),
+            "confirmed": _status_counts[order_states.DELIVERED],
+            "cancelled": _status_counts[order_states.CANCELLED] + _status_counts[order_states.EXPIRED],
+            "pending": _status_counts[order_states.PENDING] + _status_counts[order_states.PAID],
+            "revenue": round(_revenue, 2),
+        }
+        text = (
+            "📊 Общая статистика заказов:\n"
+            f"Всего заказов: {data['total']}\n"
+            f"Подтверждено: {data['confirmed']}\n"
+            f"Отменено: {data['cancelled']}\n"
+            f"В ожидании: {data['pending']}\n"
+            f"Выручка: {data['revenue']}"
+        )
+        return True, text, data
 
     except Exception as e:
         logger.error(f"Ошибка при получении общей статистики: {e}")
         return False, f"Ошибка при получении статистики: {e}", None
 
 
+USER_ORDER_STATS_SQL = """
+    SELECT
+        COUNT(*) AS total,
+        SUM(CASE WHEN status = 'delivered' THEN 1 ELSE 0 END) AS confirmed,
+        SUM(CASE WHEN status IN ('cancelled', 'expired') THEN 1 ELSE 0 END) AS cancelled,
+        SUM(CASE WHEN status IN ('pending', 'paid') THEN 1 ELSE 0 END) AS pending
+    FROM orders
+    WHERE user_id = ?
+"""
+USER_SPENT_SQL = """
+    SELECT
+        COALESCE(SUM(e.amount), 0) AS spent
+    FROM order_events e
+    WHERE e.order_id IN (SELECT id FROM orders WHERE user_id = ?)
+      AND e.to_status = 'delivered'
+"""
+
+
 async def get_user_order_stats(user_id: int):
     """
     Статистика по конкретному пользователю (по его Telegram user_id).
     Возвращает: (success: bool, message: str, data: dict | None)
     """
     try:
-        async with aiosqlite.connect('tg_bot.db') as db:
-            db.row_factory = aiosqlite.Row
-
-            cursor = await db.execute(
-                """
-                SELECT
-                    COUNT(*) AS total,
-                    SUM(CASE WHEN status = 'confirmed' THEN 1 ELSE 0 END) AS confirmed,
-                    SUM(CASE WHEN status = 'cancelled' THEN 1 ELSE 0 END) AS cancelled,
-                    SUM(CASE WHEN status = 'pending'   THEN 1 ELSE 0 END) AS pending
-                FROM orders
-                WHERE user_id = ?
-                """,
-                (user_id,)
-            )
+        async with pool.connection() as db:
+
+            cursor = await db.execute(USER_ORDER_STATS_SQL, (user_id,))
             row = await cursor.fetchone()
 
             # Сколько денег потратил пользователь (по подтверждённым заказам)
-            cursor = await db.execute(
-                """
-                SELECT
-                    COALESCE(SUM(sk.price), 0) AS spent
-                FROM orders o
-                JOIN steam_keys sk ON sk.id = o.key_id
-                WHERE o.user_id = ?
-                  AND o.status = 'confirmed'
-                """,
-                (user_id,)
-            )
+            cursor = await db.execute(USER_SPENT_SQL, (user_id,))
             spent_row = await cursor.fetchone()
             spent = spent_row["spent"]
 
@@ -175,30 +179,29 @@ async def get_user_order_stats(user_id: int):
         return False, f"Ошибка при получении статистики пользователя: {e}", None
 
 
+DAILY_ORDER_STATS_SQL = """
+    SELECT
+        date(order_date) AS day,
+        COUNT(*) AS total,
+        SUM(CASE WHEN status = 'delivered' THEN 1 ELSE 0 END) AS confirmed,
+        SUM(CASE WHEN status IN ('cancelled', 'expired') THEN 1 ELSE 0 END) AS cancelled,
+        SUM(CASE WHEN status IN ('pending', 'paid') THEN 1 ELSE 0 END) AS pending
+    FROM orders
+    GROUP BY date(order_date)
+    ORDER BY day DESC
+    LIMIT ?
+"""
+
+
 async def get_daily_order_stats(limit: int = 7):
     """
     Статистика по дням (последние N дней).
     Возвращает: (success: bool, message: str, lines: list[str])
     """
     try:
-        async with aiosqlite.connect('tg_bot.db') as db:
-            db.row_factory = aiosqlite.Row
-
-            cursor = await db.execute(
-                """
-                SELECT
-                    date(order_date) AS day,
-                    COUNT(*) AS total,
-                    SUM(CASE WHEN status = 'confirmed' THEN 1 ELSE 0 END) AS confirmed,
-                    SUM(CASE WHEN status = 'cancelled' THEN 1 ELSE 0 END) AS cancelled,
-                    SUM(CASE WHEN status = 'pending'   THEN 1 ELSE 0 END) AS pending
-                FROM orders
-                GROUP BY date(order_date)
-                ORDER BY day DESC
-                LIMIT ?
-                """,
-                (limit,)
-            )
+        async with pool.connection() as db:
+
+            cursor = await db.execute(DAILY_ORDER_STATS_SQL, (limit,))
             rows = await cursor.fetchall()
 
             if not rows:
@@ -218,25 +221,27 @@ async def get_daily_order_stats(limit: int = 7):
     except Exception as e:
         logger.error(f"Ошибка при получении статистики по дням: {e}")
         return False, f"Ошибка при получении статистики по дням: {e}", []
+
+
+USERS_OVERVIEW_SQL = """
+    SELECT
+        user_id,
+        COUNT(*) AS total,
+        SUM(CASE WHEN status = 'delivered' THEN 1 ELSE 0 END) AS confirmed,
+        SUM(CASE WHEN status IN ('cancelled', 'expired') THEN 1 ELSE 0 END) AS cancelled,
+        SUM(CASE WHEN status IN ('pending', 'paid') THEN 1 ELSE 0 END) AS pending
+    FROM orders
+    GROUP BY user_id
+    ORDER BY total DESC
+"""
+
+
 async def get_users_overview():
 
     try:
-        async with aiosqlite.connect('tg_bot.db') as db:
-            db.row_factory = aiosqlite.Row
-
-            cursor = await db.execute(
-                """
-                SELECT
-                    user_id,
-                    COUNT(*) AS total,
-                    SUM(CASE WHEN status = 'confirmed' THEN 1 ELSE 0 END) AS confirmed,
-                    SUM(CASE WHEN status = 'cancelled' THEN 1 ELSE 0 END) AS cancelled,
-                    SUM(CASE WHEN status = 'pending'   THEN 1 ELSE 0 END) AS pending
-                FROM orders
-                GROUP BY user_id
-                ORDER BY total DESC
-                """
-            )
+        async with pool.connection() as db:
+
+            cursor = await db.execute(USERS_OVERVIEW_SQL)
             rows = await cursor.fetchall()
 
             if not rows:
@@ -1,423 +1,772 @@
 # bot_apps/db_user.py
-import aiosqlite
-import html
+import json
 import logging
 import re
+from collections import OrderedDict, namedtuple
 from datetime import datetime
 
+from bot_apps import (
+    cards, catalog_cache, catalog_filter, fuzzy_search, media_cache, order_states, pool, sale_scheduler, writer,
+)
+from bot_apps.models import PRODUCT_TYPES, Product
+
 logger = logging.getLogger(__name__)
 
 
-async def _apply_sale_to_game(game) -> dict:
-    """Работает и с sqlite3.Row, и с dict — без ошибок"""
-    from datetime import datetime
-    import re
-
-    # Превращаем sqlite3.Row в обычный dict — теперь .get() работает
-    g = dict(game)
-
-    price = float(g.get('price', 0))
-    discount = int(g.get('discount', 0))
-
-    sale_active = bool(g.get('sale_active', 0))
-    sale_not = (g.get('sale_not') or "").strip()
-    sale_ends_at = g.get('sale_ends_at')
-
-    final_price = price
-    sale_text = ""
-
-    # Обычная скидка (поле discount)
-    if discount > 0 and not sale_active:
-        final_price = price * (1 - discount / 100)
-        sale_text = f"Скидка {discount}%"
-
-    # Новая акция
-    if sale_active and sale_not:
-        now = datetime.now()
-        expired = False
-
-        if sale_ends_at:
-            try:
-                if len(sale_ends_at) <= 10:
-                    end_dt = datetime.strptime(sale_ends_at, "%Y-%m-%d")
-                else:
-                    end_dt = datetime.strptime(sale_ends_at[:19], "%Y-%m-%d %H:%M:%S")
-                if now > end_dt:
-                    expired = True
-            except:
-                pass
-
-        if expired:
-            async with aiosqlite.connect('tg_bot.db') as db:
-                await db.execute(
-                    "UPDATE steam_keys SET sale_active = 0, sale_not = NULL, sale_ends_at = NULL WHERE id = ?",
-                    (g['id'],)
-                )
-                await db.commit()
-            sale_active = False
-        else:
-            match = re.search(r'(\d+)%', sale_not, re.IGNORECASE)
-            if match:
-                percent = int(match.group(1))
-                final_price = price * (1 - percent / 100)
-                end_date = sale_ends_at.split()[0] if sale_ends_at else "скоро"
-                sale_text = f"АКЦИЯ! {sale_not} до {end_date}"
-            else:
-                sale_text = f"АКЦИЯ! {sale_not}"
+SEARCH_SQL = (
+    "SELECT s.id FROM steam_keys_fts f JOIN steam_keys s ON s.id = f.rowid "
+    "WHERE steam_keys_fts MATCH ? AND s.count > 0 "
+    "ORDER BY f.rank LIMIT ?"
+)
+SEARCH_LIMIT = 20
+
+
+def _fts_query(query_clean: str) -> str:
+    """'ведьмак 3' -> '"ведьмак"* "3"*': все слова, каждое как префикс."""
+    tokens = re.findall(r'\w+', query_clean.casefold())
+    return " ".join(f'"{token}"*' for token in tokens)
+
+
+async def _search_in_stock(query_clean: str, limit: int = SEARCH_LIMIT) -> list[Product]:
+    """Игры в наличии по ID или по словам названия/жанра (FTS5, по релевантности bm25)"""
+    if query_clean.isdigit():
+        game = await catalog_cache.get(int(query_clean))
+        if game and game.in_stock:
+            return [game]
+
+    match = _fts_query(query_clean)
+    if not match:
+        return []
+    async with pool.connection() as db:
+        cursor = await db.execute(SEARCH_SQL, (match, limit))
+        rows = await cursor.fetchall()
+
+    games = []
+    for row in rows:
+        game = await catalog_cache.get(row['id'])
+        if game and game.in_stock:
+            games.append(game)
+    return games
+
+
+async def _fuzzy_in_stock(query_clean: str, limit: int = SEARCH_LIMIT) -> tuple[list[Product], bool]:
+    """
+    Похожие игры в наличии (опечатки, транслит, алиасы).
+    Второе значение — True, если запрос целиком совпал с названием или алиасом.
+    """
+    await catalog_cache.ensure_loaded()
+    matches = await fuzzy_search.search(query_clean, limit=limit)
+    games = []
+    for product_id, _, _ in matches:
+        game = await catalog_cache.get(product_id)
+        if game and game.in_stock:
+            games.append(game)
+    exact = bool(matches) and fuzzy_search.normalize(matches[0][2]) == fuzzy_search.normalize(query_clean)
+    return games, exact
+
+
+CATALOG_PAGE_SIZE = 10
+
+
+async def get_catalog_page(after_id=None, before_id=None, limit=CATALOG_PAGE_SIZE, product_type='steam'):
+    """
+    Одна страница каталога товаров вида product_type (keyset по id): после after_id или перед before_id.
+    Возвращает (success, msg, page), page — dict с product_type/items/first_id/last_id/has_prev/has_next.
+    """
+    try:
+        games, start, total = await catalog_cache.in_stock_page(after_id, before_id, limit, product_type)
+        if not games:
+            return False, "Товары не найдены." if product_type != 'steam' else "Игры не найдены.", {}
+
+        page = {
+            'product_type': product_type,
+            'items': await cards.render_all(games),
+            'first_id': games[0].id,
+            'last_id': games[-1].id,
+            'has_prev': start > 0,
+            'has_next': start + len(games) < total,
+        }
+        title = PRODUCT_TYPES.get(product_type, "Каталог")
+        return True, f"{title} ({start + 1}–{start + len(games)} из {total}):", page
 
-    return {
-        "final_price": round(final_price, 2),
-        "sale_text": sale_text
-    }
+    except Exception as e:
+        logger.error(f"Ошибка в get_catalog_page: {e}", exc_info=True)
+        return False, f"Ошибка: {str(e)}", {}
 
 
-async def show_all_games():
-    """Показать весь каталог"""
+async def filter_catalog(token, after=None, before=None, limit=CATALOG_PAGE_SIZE):
+    """
+    Страница каталога по комбинированному фильтру (catalog_filter) с токеном token:
+    после курсора after или перед before (текст catalog_filter.encode_cursor).
+    Возвращает (success, msg, page) — page как у get_catalog_page, только вместо
+    first_id/last_id курсоры first_cursor/last_cursor, плюс 'token'.
+    """
     try:
-        async with aiosqlite.connect('tg_bot.db') as db:
-            db.row_factory = aiosqlite.Row
-            cursor = await db.execute('SELECT * FROM steam_keys WHERE count > 0 ORDER BY id')
-            games = await cursor.fetchall()
-            games = [dict(row) for row in games]
-            if not games:
-                return False, "Игры не найдены.", []
-
-            result = []
-            for game in games:
-                sale = await _apply_sale_to_game(game)
-                text = (
-                    f"*ID*: {game['id']}\n"
-                    f"*Игра*: {game['game_name']}\n"
-                    f"*Цена*: ${sale['final_price']:.2f}"
-                )
-                if sale['sale_text']:
-                    text += f"\n{sale['sale_text']}"
-                if game.get('genre'):
-                    text += f"\n*Жанр*: {game['genre']}"
-                if game.get('region'):
-                    text += f"\n*Регион*: {game['region'] or 'Глобальный'}"
-
-                result.append({
-                    'text': text,
-                    'image_urls': game.get('image_urls') or ''
-                })
-
-            return True, "Доступные игры:", result
+        spec = catalog_filter.get_spec(token)
+        if spec is None:
+            return False, "Фильтр устарел, настройте его заново.", {}
+
+        await catalog_cache.ensure_loaded()
+        after = catalog_filter.decode_cursor(spec, after)
+        before = catalog_filter.decode_cursor(spec, before)
+        keys, has_prev, has_next = await catalog_filter.find_page(spec, after, before, limit)
+        games = [game for game in [await catalog_cache.get(key[-1]) for key in keys] if game]
+        genre_names = {facet.id: facet.name for facet in await get_genre_facets()}
+        title = f"Фильтр: {catalog_filter.describe(spec, genre_names)}"
+        if not games:
+            return False, f"{title}\nНичего не найдено.", {'token': token}
+
+        page = {
+            'token': token,
+            'items': await cards.render_all(games),
+            'first_cursor': catalog_filter.encode_cursor(keys[0]),
+            'last_cursor': catalog_filter.encode_cursor(keys[-1]),
+            'has_prev': has_prev,
+            'has_next': has_next,
+        }
+        return True, title, page
 
     except Exception as e:
-        logger.error(f"Ошибка в show_all_games: {e}", exc_info=True)
-        return False, f"Ошибка: {str(e)}", []
+        logger.error(f"Ошибка в filter_catalog: {e}", exc_info=True)
+        return False, f"Ошибка: {str(e)}", {}
+
+
+async def get_game_card(game_id):
+    """Карточка одной игры в наличии (cards.Card)"""
+    try:
+        game = await catalog_cache.get(int(game_id))
+        if not game or not game.in_stock:
+            return False, "Игра не найдена или закончилась.", None
+
+        return True, "", await cards.render(game)
+
+    except Exception as e:
+        logger.error(f"Ошибка в get_game_card: {e}", exc_info=True)
+        return False, f"Ошибка: {str(e)}", None
 
 
 async def search_games(query):
     """Поиск по названию или ID"""
     try:
-        async with aiosqlite.connect('tg_bot.db') as db:
-            db.row_factory = aiosqlite.Row
+        query_clean = query.strip()
+        msg = "Результаты поиска:"
+        games = await _search_in_stock(query_clean)
+        if not games:
+            games, exact = await _fuzzy_in_stock(query_clean)
+            if games and not exact:
+                msg = "Возможно, вы имели в виду: " + ", ".join(game.game_name for game in games[:3])
+        if not games:
+            return False, "Игры не найдены.", []
 
-            if query.strip().isdigit():
-                game_id = int(query.strip())
-                cursor = await db.execute('SELECT * FROM steam_keys WHERE id = ? AND count > 0', (game_id,))
-            else:
-                cursor = await db.execute(
-                    'SELECT * FROM steam_keys WHERE game_name LIKE ? AND count > 0',
-                    (f'%{query.strip()}%',)
-                )
+        result = await cards.render_all(games)
 
-            games = await cursor.fetchall()
-            games = [dict(row) for row in games]
-            if not games:
-                return False, "Игры не найдены.", []
-
-            result = []
-            for game in games:
-                sale = await _apply_sale_to_game(game)
-                text = (
-                    f"*ID*: {game['id']}\n"
-                    f"*Игра*: {game['game_name']}\n"
-                    f"*Цена*: ${sale['final_price']:.2f}"
-                )
-                if sale['sale_text']:
-                    text += f"\n{sale['sale_text']}"
-                if game.get('genre'):
-                    text += f"\n*Жанр*: {game['genre']}"
-                if game.get('region'):
-                    text += f"\n*Регион*: {game['region'] or 'Глобальный'}"
-
-                result.append({
-                    'text': text,
-                    'image_urls': game.get('image_urls') or ''
-                })
-
-            return True, "Результаты поиска:", result
+        return True, msg, result
 
     except Exception as e:
         logger.error(f"Ошибка в search_games: {e}", exc_info=True)
         return False, f"Ошибка поиска: {str(e)}", []
 
 
-async def filter_games_by_price(price_limit):
-    try:
-        async with aiosqlite.connect('tg_bot.db') as db:
-            db.row_factory = aiosqlite.Row
-            cursor = await db.execute(
-                'SELECT * FROM steam_keys WHERE count > 0 AND price <= ?',
-                (float(price_limit),)
-            )
-            games = await cursor.fetchall()
-            games = [dict(row) for row in games]
+INLINE_PAGE_SIZE = 20
+INLINE_RESULTS_LIMIT = 100
+INLINE_CACHE_SIZE = 256
 
-            if not games:
-                return False, f"Игры до ${price_limit} не найдены.", []
-
-            result = []
-            for game in games:
-                sale = await _apply_sale_to_game(game)
-                text = (
-                    f"*ID*: {game['id']}\n"
-                    f"*Игра*: {game['game_name']}\n"
-                    f"*Цена*: ${sale['final_price']:.2f}"
-                )
-                if sale['sale_text']:
-                    text += f"\n{sale['sale_text']}"
-
-                result.append({
-                    'text': text,
-                    'image_urls': game.get('image_urls') or ''
-                })
-
-            return True, f"Игры до ${price_limit}:", result
+# (нормализованный запрос, состав витрины, версия поискового индекса) -> id найденных игр по порядку
+_inline_cache: OrderedDict[tuple[str, int, int], list[int]] = OrderedDict()
 
-    except Exception as e:
-        logger.error(f"Ошибка в filter_games_by_price: {e}", exc_info=True)
-        return False, f"Ошибка: {str(e)}", []
 
+async def inline_search(query, offset=0, limit=INLINE_PAGE_SIZE):
+    """
+    Карточки для inline-режима (@bot запрос): (карточки страницы, следующий offset или None).
+    Список id на запрос кэшируется (LRU), пока не изменится состав витрины
+    (catalog_cache.listing_version) или названия/алиасы (fuzzy_search.version);
+    продажи и брони его не сбрасывают — наличие проверяется при сборке страницы.
+    """
+    query_key = " ".join(query.casefold().split())
+    await catalog_cache.ensure_loaded()
+    key = (query_key, catalog_cache.listing_version, fuzzy_search.version)
 
-async def filter_games_by_genre(genre):
+    ids = _inline_cache.get(key)
+    if ids is None:
+        if query_key:
+            games = await _search_in_stock(query_key, INLINE_RESULTS_LIMIT)
+            if not games:
+                games, _ = await _fuzzy_in_stock(query_key, INLINE_RESULTS_LIMIT)
+        else:
+            games = await catalog_cache.in_stock()
+        ids = [game.id for game in games]
+        _inline_cache[key] = ids
+        if len(_inline_cache) > INLINE_CACHE_SIZE:
+            _inline_cache.popitem(last=False)
+    else:
+        _inline_cache.move_to_end(key)
+
+    games = []
+    for game_id in ids[offset:offset + limit]:
+        game = await catalog_cache.get(game_id)
+        if game and game.in_stock:
+            games.append(game)
+    next_offset = offset + limit if offset + limit < len(ids) else None
+    return await cards.render_all(games), next_offset
+
+
+GENRE_FACETS_SQL = (
+    "SELECT g.id, g.name, COUNT(*) FROM product_genres pg "
+    "JOIN steam_keys s ON s.id = pg.product_id "
+    "JOIN genres g ON g.id = pg.genre_id "
+    "WHERE s.count > 0 GROUP BY pg.genre_id"
+)
+
+GenreFacet = namedtuple('GenreFacet', ['id', 'name', 'count'])
+
+_genre_facets: tuple[int, list[GenreFacet]] | None = None   # (catalog_cache.listing_version, фасеты)
+
+
+def split_genres(genre_text) -> list[str]:
+    """'Экшн, RPG' -> ['Экшн', 'RPG'] (без пустых и повторов)."""
+    names = {}
+    for name in re.split(r'[,/;]', genre_text or ''):
+        name = name.strip()
+        if name:
+            names.setdefault(name.casefold(), name)
+    return list(names.values())
+
+
+async def _set_product_genres(db, product_id, genre_text):
+    """Перепривязывает жанры игры. Вызывается внутри операции писателя."""
+    await db.execute('DELETE FROM product_genres WHERE product_id = ?', (product_id,))
+    for name in split_genres(genre_text):
+        await db.execute('INSERT OR IGNORE INTO genres (name) VALUES (?)', (name,))
+        await db.execute(
+            'INSERT OR IGNORE INTO product_genres (product_id, genre_id) SELECT ?, id FROM genres WHERE name = ?',
+            (product_id, name)
+        )
+
+
+async def get_genre_facets() -> list[GenreFacet]:
+    """
+    Жанры, в которых есть игры в наличии, с количеством (больше игр — выше).
+    Пересчитываются, только когда меняется состав витрины или жанры игр.
+    """
+    global _genre_facets
+    await catalog_cache.ensure_loaded()
+    if _genre_facets is not None and _genre_facets[0] == catalog_cache.listing_version:
+        return _genre_facets[1]
+
+    version = catalog_cache.listing_version
+    async with pool.connection() as db:
+        cursor = await db.execute(GENRE_FACETS_SQL)
+        rows = await cursor.fetchall()
+    facets = sorted((GenreFacet(*row) for row in rows), key=lambda facet: (-facet.count, facet.name.casefold()))
+    _genre_facets = (version, facets)
+    return facets
+
+
+def split_keys(text) -> list[str]:
+    """Ключи через пробел, запятую или с новой строки -> список без повторов."""
+    return list(dict.fromkeys(key for key in re.split(r'[\s,;]+', text or '') if key))
+
+
+# Повтор ключа в этом товаре пропускает OR IGNORE, в другом — триггер v013;
+# rowcount — число реально добавленных ключей
+INSERT_KEY_SQL = 'INSERT OR IGNORE INTO product_keys (product_id, key_text) VALUES (?, ?)'
+
+
+def product_label(product_type) -> tuple[str, str, str]:
+    """
+    Слова для сообщений о товаре: (название, окончание глагола, родительный падеж).
+    Игры — "Игра ... добавлена", остальное (и неизвестный товар) — "Товар ... добавлен".
+    """
+    if product_type == 'steam':
+        return "Игра", "а", "игры"
+    return "Товар", "", "товара"
+
+
+async def add_steam_key_into_db(game_name, st_key, price, genre=None, region=None, image_urls=None,
+                                product_type='steam', attributes=None):
+    """
+    Добавляет товар в каталог: игру или (product_type) ключ Windows/Office; attributes — dict.
+    st_key — один или несколько ключей (split_keys); остаток товара = число ключей.
+    """
+    if product_type not in PRODUCT_TYPES:
+        return False, f"Неизвестный вид товара: {product_type}."
+    keys = split_keys(st_key)
+    if not keys:
+        return False, "Не указано ни одного ключа."
     try:
-        async with aiosqlite.connect('tg_bot.db') as db:
-            db.row_factory = aiosqlite.Row
+        attributes_json = json.dumps(attributes, ensure_ascii=False) if attributes else None
+
+        async def op(db):
             cursor = await db.execute(
-                'SELECT * FROM steam_keys WHERE count > 0 AND genre LIKE ?',
-                (f'%{genre}%',)
+                'INSERT INTO steam_keys (game_name, st_key, price, count, genre, region, image_urls, '
+                'product_type, attributes) VALUES (?, ?, ?, 0, ?, ?, ?, ?, ?)',
+                (game_name, keys[0], price, genre, region, image_urls, product_type, attributes_json)
             )
-            games = await cursor.fetchall()
-            games = [dict(row) for row in games]
+            product_id = cursor.lastrowid
+            await _set_product_genres(db, product_id, genre)
+            # count поднимут триггеры product_keys
+            cursor = await db.executemany(INSERT_KEY_SQL, [(product_id, key) for key in keys])
+            return product_id, cursor.rowcount
+
+        product_id, added = await writer.submit(op)
+        await catalog_cache.refresh(product_id)
+        logger.info(f"Добавлен товар #{product_id} ({product_type}): {game_name}, ключей: {added}")
+        label, ending, _ = product_label(product_type)
+        msg = f"{label} '{game_name}' добавлен{ending} (ID: {product_id}), ключей в продаже: {added}"
+        if added < len(keys):
+            msg += f", уже загруженных ключей пропущено {len(keys) - added}"
+        return True, msg + "."
+    except Exception as e:
+        logger.error(f"Ошибка добавления игры: {e}", exc_info=True)
+        return False, f"Ошибка добавления {product_label(product_type)[2]}: {str(e)}"
+
+async def edit_steam_key_into_db(game_id, game_name=None, price=None, discount=None,
+                                 genre=None, region=None, image_urls=None):
+    """Меняет указанные поля игры или другого товара, None — оставить как есть."""
+    fields = {
+        'game_name': game_name,
+        'price': price,
+        'discount': discount,
+        'genre': genre,
+        'region': region,
+        'image_urls': image_urls,
+    }
+    fields = {name: value for name, value in fields.items() if value is not None}
+    if not fields:
+        return False, "Не указано ни одного поля для изменения."
 
-            if not games:
-                return False, f"Игры жанра '{genre}' не найдены.", []
-
-            result = []
-            for game in games:
-                sale = await _apply_sale_to_game(game)
-                text = (
-                    f"*ID*: {game['id']}\n"
-                    f"*Игра*: {game['game_name']}\n"
-                    f"*Цена*: ${sale['final_price']:.2f}"
-                )
-                if sale['sale_text']:
-                    text += f"\n{sale['sale_text']}"
-
-                result.append({
-                    'text': text,
-                    'image_urls': game.get('image_urls') or ''
-                })
-
-            return True, f"Игры жанра '{genre}':", result
+    game = await catalog_cache.get(game_id)
+    label, ending, genitive = product_label(game.product_type if game else None)
+    try:
+        assignments = ", ".join(f"{name} = ?" for name in fields)
+        async def op(db):
+            cursor = await db.execute(
+                f'UPDATE steam_keys SET {assignments} WHERE id = ?',
+                (*fields.values(), game_id)
+            )
+            if cursor.rowcount and 'genre' in fields:
+                await _set_product_genres(db, game_id, genre)
+            return writer.WriteResult(cursor.lastrowid, cursor.rowcount)
+
+        result = await writer.submit(op)
+        if result.rowcount == 0:
+            return False, f"{label} с ID {game_id} не найден{ending}."
+        await catalog_cache.refresh(game_id)
+        if 'image_urls' in fields:
+            await media_cache.forget(game_id)
+        logger.info(f"Товар #{game_id} изменён: {', '.join(fields)}")
+        return True, f"{label} с ID {game_id} обновлен{ending}."
+    except Exception as e:
+        logger.error(f"Ошибка редактирования товара #{game_id}: {e}", exc_info=True)
+        return False, f"Ошибка редактирования {genitive}: {str(e)}"
+
+async def add_product_keys(product_id, keys):
+    """Докладывает ключи товару; уже загруженные ключи пропускаются. Возвращает (success, msg, добавлено)."""
+    keys = split_keys(keys) if isinstance(keys, str) else list(dict.fromkeys(keys))
+    if not keys:
+        return False, "Не указано ни одного ключа.", 0
+    try:
+        game = await catalog_cache.get(int(product_id))
+        if game is None:
+            return False, f"Товар с ID {product_id} не найден.", 0
+
+        result = await writer.executemany(INSERT_KEY_SQL, [(game.id, key) for key in keys])
+        await catalog_cache.refresh(game.id)
+        added = result.rowcount
+        logger.info(f"Товару #{game.id} добавлено ключей: {added} из {len(keys)}")
+        msg = f"'{game.game_name}': добавлено ключей {added}"
+        if added < len(keys):
+            msg += f", повторов пропущено {len(keys) - added}"
+        return True, msg + ".", added
+    except Exception as e:
+        logger.error(f"Ошибка добавления ключей: {e}", exc_info=True)
+        return False, f"Ошибка добавления ключей: {str(e)}", 0
 
+async def delete_steam_key_from_db(game_id):
+    """Удаляет игру или другой товар из каталога."""
+    game = await catalog_cache.get(game_id)
+    label, ending, genitive = product_label(game.product_type if game else None)
+    try:
+        async def op(db):
+            await db.execute('DELETE FROM product_genres WHERE product_id = ?', (game_id,))
+            # Проданные и зарезервированные ключи остаются за своими заказами
+            await db.execute("DELETE FROM product_keys WHERE product_id = ? AND status = 'available'", (game_id,))
+            cursor = await db.execute('DELETE FROM steam_keys WHERE id = ?', (game_id,))
+            return writer.WriteResult(cursor.lastrowid, cursor.rowcount)
+
+        result = await writer.submit(op)
+        if result.rowcount == 0:
+            return False, f"{label} с ID {game_id} не найден{ending}."
+        catalog_cache.remove(game_id)
+        await media_cache.forget(game_id)
+        logger.info(f"Товар #{game_id} удалён")
+        return True, f"{label} с ID {game_id} удален{ending}."
     except Exception as e:
-        logger.error(f"Ошибка в filter_games_by_genre: {e}", exc_info=True)
-        return False, f"Ошибка: {str(e)}", []
+        logger.error(f"Ошибка удаления товара #{game_id}: {e}", exc_info=True)
+        return False, f"Ошибка удаления {genitive}: {str(e)}"
+
+async def set_sale(game_id, sale_text, ends_at, starts_at=None):
+    """
+    Заводит акцию: текст, процент (из текста, если в нём есть 'N%'), начало и конец.
+    Даты — 'YYYY-MM-DD' или 'YYYY-MM-DD HH:MM:SS'. Без начала акция действует сразу.
+    """
+    end_dt = sale_scheduler.parse_sale_end(ends_at)
+    if end_dt is None:
+        return False, "Неверная дата окончания (нужно YYYY-MM-DD)."
+    start_dt = sale_scheduler.parse_sale_end(starts_at) if starts_at else None
+    if starts_at and start_dt is None:
+        return False, "Неверная дата начала (нужно YYYY-MM-DD)."
+    if start_dt is not None and start_dt >= end_dt:
+        return False, "Акция должна начинаться раньше, чем заканчивается."
+
+    match = re.search(r'(\d+)%', sale_text)
+    percent = min(int(match.group(1)), 100) if match else None
+    now = datetime.now()
+    active = int((start_dt is None or start_dt <= now) and now < end_dt)
 
+    try:
+        result = await writer.execute(
+            "UPDATE steam_keys SET sale_active = ?, sale_not = ?, sale_ends_at = ?, "
+            "sale_percent = ?, sale_start_ts = ?, sale_end_ts = ? WHERE id = ?",
+            (active, sale_text, ends_at, percent,
+             int(start_dt.timestamp()) if start_dt else None, int(end_dt.timestamp()), game_id)
+        )
+        if result.rowcount == 0:
+            return False, f"Игра с ID {game_id} не найдена."
+        await catalog_cache.refresh(game_id)
+        await sale_scheduler.reload()
+        return True, f"Акция на игру {game_id} включена!\n{sale_text} до {ends_at}"
+    except Exception as e:
+        logger.error(f"Ошибка при включении акции: {e}", exc_info=True)
+        return False, f"Ошибка: {str(e)}"
 
 
-async def search_games(query):
-    """Поиск игр по названию или по ID."""
+async def clear_sale(game_id):
+    """Снимает акцию с игры."""
     try:
-        async with aiosqlite.connect('tg_bot.db') as db:
-            db.row_factory = aiosqlite.Row
-
-            # Попробуем определить, является ли query числом (ID)
-            query_clean = query.strip()
-            if re.fullmatch(r'\d+', query_clean):  # Только цифры → это ID
-                game_id = int(query_clean)
-                cursor = await db.execute(
-                    'SELECT * FROM steam_keys WHERE id = ? AND count > 0',
-                    (game_id,)
-                )
-                logger.info(f"Поиск игры по ID: {game_id}")
-            else:
-                # Поиск по названию (частичное совпадение)
-                cursor = await db.execute(
-                    'SELECT * FROM steam_keys WHERE game_name LIKE ? AND count > 0',
-                    (f'%{query_clean}%',)
-                )
-                logger.info(f"Поиск игр по названию: '{query_clean}'")
+        await writer.execute(
+            "UPDATE steam_keys SET sale_active = 0, sale_not = NULL, sale_ends_at = NULL, "
+            "sale_percent = NULL, sale_start_ts = NULL, sale_end_ts = NULL WHERE id = ?",
+            (game_id,)
+        )
+        await catalog_cache.refresh(game_id)
+        await sale_scheduler.reload()
+        return True, f"Акция на игру {game_id} отключена."
+    except Exception as e:
+        logger.error(f"Ошибка при отключении акции: {e}", exc_info=True)
+        return False, f"Ошибка: {str(e)}"
 
-            games = await cursor.fetchall()
-            games = [dict(row) for row in games]
 
-            if not games:
-                logger.info(f"Игры по запросу '{query}' не найдены")
-                return False, "Игры не найдены.", []
-
-            result = []
-            for game in games:
-                price = game['price']
-                discount = game['discount'] or 0
-                final_price = price * (1.0 - discount / 100.0)
-                game_text = (
-                    f"*ID*: {game['id']}\n"
-                    f"*Игра*: {game['game_name']}\n"
-                    f"*Цена*: ${final_price:.2f}\n"
-                    f"*Скидка*: {discount}%\n"
-                    f"*Жанр*: {game['genre'] or 'Не указан'}\n"
-                    f"*Регион*: {game['region'] or 'Не указан'}"
-                )
-                result.append({
-                    'text': game_text,
-                    'image_urls': game['image_urls'] or ''
-                })
-
-            logger.info(f"Найдено {len(games)} игр по запросу '{query}'")
-            return True, "Игры найдены.", result
-
-    except ValueError as e:
-        logger.error(f"Ошибка преобразования ID: {e}", exc_info=True)
-        return False, "Некорректный ID игры.", []
-    except Exception as e:
-        logger.error(f"Ошибка поиска игр: {e}", exc_info=True)
-        return False, f"Ошибка поиска: {str(e)}", []
+# Сколько неоплаченный заказ держит ключ; потом его снимает order_reaper
+ORDER_RESERVATION_TTL = 30 * 60
+
+# Резерв одного доступного ключа за заказом — одна команда: выбор и захват атомарны
+RESERVE_KEY_SQL = (
+    "UPDATE product_keys SET status = 'reserved', order_id = ?, reserved_at = CURRENT_TIMESTAMP "
+    "WHERE id = (SELECT id FROM product_keys WHERE product_id = ? AND status = 'available' LIMIT 1) "
+    "RETURNING id"
+)
+SELL_KEY_SQL = (
+    "UPDATE product_keys SET status = 'sold' WHERE order_id = ? AND status = 'reserved' "
+    "RETURNING key_text"
+)
+RELEASE_KEY_SQL = (
+    "UPDATE product_keys SET status = 'available', order_id = NULL, reserved_at = NULL "
+    "WHERE order_id = ? AND status = 'reserved' RETURNING product_id"
+)
+
 
 async def create_order(user_id, game_id):
-    """Создаёт заказ для пользователя."""
+    """Создаёт заказ для пользователя и резервирует за ним один ключ товара."""
     try:
-        async with aiosqlite.connect('tg_bot.db') as db:
-            db.row_factory = aiosqlite.Row
-            # Проверяем, существует ли пользователь в таблице users
-            cursor = await db.execute('SELECT * FROM users WHERE tg_id = ?', (user_id,))
-            user = await cursor.fetchone()
-            if not user:
-                await db.execute('INSERT OR IGNORE INTO users (tg_id) VALUES (?)', (user_id,))
-                await db.commit()
-                logger.info(f"Добавлен новый пользователь с tg_id: {user_id}")
-
-            cursor = await db.execute('SELECT * FROM steam_keys WHERE id = ? AND count > 0', (game_id,))
-            game = await cursor.fetchone()
-            if not game:
-                logger.warning(f"Игра с ID {game_id} не найдена или недоступна")
-                return False, "Игра не найдена или недоступна.", None
+        game = await catalog_cache.get(int(game_id))
+        if not game or not game.in_stock:
+            logger.warning(f"Игра с ID {game_id} не найдена или недоступна")
+            return False, "Игра не найдена или недоступна.", None
 
+        expires_at = int(datetime.now().timestamp()) + ORDER_RESERVATION_TTL
+
+        async def op(db):
+            # Пользователь мог ещё не нажимать /start
+            await db.execute('INSERT OR IGNORE INTO users (tg_id) VALUES (?)', (user_id,))
             cursor = await db.execute(
-                'INSERT INTO orders (user_id, key_id, status, order_date) VALUES (?, ?, ?, CURRENT_TIMESTAMP)',
-                (user_id, game_id, 'pending'))
-            await db.commit()
+                'INSERT INTO orders (user_id, key_id, status, order_date, expires_at) '
+                'VALUES (?, ?, ?, CURRENT_TIMESTAMP, ?)',
+                (user_id, game.id, order_states.PENDING, expires_at))
             order_id = cursor.lastrowid
-            order_data = {
-                'order_id': order_id,
-                'user_id': user_id,
-                'game_name': game['game_name'],
-                'key': game['st_key']
-            }
-            logger.info(f"Создан заказ #{order_id} для пользователя {user_id}, игра: {game['game_name']}")
-            return True, "Заказ успешно создан.", order_data
+            cursor = await db.execute(RESERVE_KEY_SQL, (order_id, game.id))
+            if await cursor.fetchone() is None:
+                # Последний ключ успели забрать — заказа без ключа не оставляем
+                await db.execute('DELETE FROM orders WHERE id = ?', (order_id,))
+                return None
+            await order_states.log_created(db, order_id, f"user:{user_id}")
+            return order_id
+
+        order_id = await writer.submit(op)
+        await catalog_cache.refresh(game.id)
+        if order_id is None:
+            return False, "Ключи этой игры закончились.", None
+
+        order_data = {
+            'order_id': order_id,
+            'user_id': user_id,
+            'game_name': game.game_name,
+            'expires_at': expires_at,
+        }
+        logger.info(f"Создан заказ #{order_id} для пользователя {user_id}, игра: {game.game_name}")
+        return True, "Заказ успешно создан.", order_data
     except Exception as e:
         logger.error(f"Ошибка создания заказа: {e}", exc_info=True)
         return False, f"Ошибка создания заказа: {str(e)}", None
 
-async def confirm_order(order_id):
-    """Подтверждает заказ и отправляет ключ пользователю."""
+PAID_WITHOUT_KEY_MSG = "Оплата отмечена, но ключи этой игры закончились. Добавьте ключи и подтвердите заказ ещё раз."
+ORDER_EXPIRED_MSG = "Бронь по заказу истекла — он будет отменён автоматически, покупателю нужно оформить заказ заново."
+
+
+async def _confirm_in_tx(db, order_id, actor):
+    """Подтверждение одного заказа внутри операции писателя -> (success, msg, order_data)."""
+    order = await order_states.get_state(db, order_id)
+    if order is not None and order_states.is_expired(order):
+        logger.warning(f"Заказ #{order_id} не подтверждён: бронь истекла")
+        return False, ORDER_EXPIRED_MSG, None
+    if order is not None and order['status'] == order_states.PENDING:
+        if await order_states.transition(db, order_id, order_states.PAID, actor,
+                                         from_status=order_states.PENDING) is None:
+            order = None
+    elif order is not None and order['status'] != order_states.PAID:
+        order = None
+    if order is None:
+        logger.warning(f"Заказ с ID {order_id} не найден или уже обработан")
+        return False, "Заказ не найден или уже обработан.", None
+
+    cursor = await db.execute(SELL_KEY_SQL, (order_id,))
+    key = await cursor.fetchone()
+    if key is None:
+        # Заказ создан до склада ключей или ключи закончились, пока он ждал, — резервируем сейчас
+        await db.execute(RESERVE_KEY_SQL, (order_id, order['key_id']))
+        cursor = await db.execute(SELL_KEY_SQL, (order_id,))
+        key = await cursor.fetchone()
+    if key is None:
+        logger.warning(f"Заказ #{order_id} оплачен, но доступного ключа нет")
+        return False, PAID_WITHOUT_KEY_MSG, None
+
+    cursor = await db.execute('SELECT game_name, effective_price FROM steam_keys WHERE id = ?', (order['key_id'],))
+    game = await cursor.fetchone()
+    await order_states.transition(db, order_id, order_states.DELIVERED, actor,
+                                  amount=game['effective_price'] if game else None,
+                                  from_status=order_states.PAID)
+    order_data = {
+        'order_id': order_id,
+        'user_id': order['user_id'],
+        'game_id': order['key_id'],
+        'game_name': game['game_name'] if game else "",
+        'key': key['key_text']
+    }
+    logger.info(f"Заказ #{order_id} подтверждён для пользователя {order['user_id']}")
+    return True, "Заказ подтверждён.", order_data
+
+
+async def _cancel_in_tx(db, order_id, actor):
+    """Отмена одного заказа внутри операции писателя -> (отменён ли, id товара освобождённого ключа)."""
+    if await order_states.transition(db, order_id, order_states.CANCELLED, actor) is None:
+        return False, None
+    cursor = await db.execute(RELEASE_KEY_SQL, (order_id,))
+    released = await cursor.fetchone()
+    return True, released['product_id'] if released else None
+
+
+async def confirm_order(order_id, actor='admin'):
+    """
+    Подтверждает оплату и выдаёт ключ: pending -> paid -> delivered (order_states).
+    Каждый переход — compare-and-set по статусу, так что из нескольких одновременных
+    нажатий ключ получает только первое, остальные видят "уже обработан".
+    Если ключей не осталось, заказ остаётся оплаченным — после /add_keys его подтверждают ещё раз.
+    """
     try:
-        async with aiosqlite.connect('tg_bot.db') as db:
-            db.row_factory = aiosqlite.Row
-            cursor = await db.execute('SELECT * FROM orders WHERE id = ? AND status = ?', (order_id, 'pending'))
-            order = await cursor.fetchone()
-            if not order:
-                logger.warning(f"Заказ с ID {order_id} не найден или уже обработан")
-                return False, "Заказ не найден или уже обработан.", None
-
-            cursor = await db.execute('SELECT * FROM steam_keys WHERE id = ?', (order['key_id'],))
-            game = await cursor.fetchone()
-            if not game:
-                logger.warning(f"Игра с ID {order['key_id']} не найдена")
-                return False, "Игра не найдена.", None
-
-            await db.execute('UPDATE orders SET status = ? WHERE id = ?', ('confirmed', order_id))
-            await db.execute('UPDATE steam_keys SET count = count - 1 WHERE id = ?', (order['key_id'],))
-            await db.commit()
-
-            order_data = {
-                'order_id': order_id,
-                'user_id': order['user_id'],
-                'game_name': game['game_name'],
-                'key': game['st_key']
-            }
-            logger.info(f"Заказ #{order_id} подтверждён для пользователя {order['user_id']}")
-            return True, "Заказ подтверждён.", order_data
+        success, msg, order_data = await writer.submit(lambda db: _confirm_in_tx(db, order_id, actor))
+        if success:
+            await catalog_cache.refresh(order_data['game_id'])
+        return success, msg, order_data
     except Exception as e:
         logger.error(f"Ошибка подтверждения заказа: {e}", exc_info=True)
         return False, f"Ошибка подтверждения заказа: {str(e)}", None
 
-async def cancel_order(order_id):
-    """Отменяет заказ"""
+async def cancel_order(order_id, actor='admin'):
+    """Отменяет ожидающий или оплаченный, но не выданный заказ и возвращает его ключ в продажу"""
     try:
-        async with aiosqlite.connect('tg_bot.db') as db:
-            cursor = await db.execute('SELECT * FROM orders WHERE id = ? AND status = ?', (order_id, 'pending'))
-            order = await cursor.fetchone()
-            if not order:
-                logger.warning(f"Заказ с ID {order_id} не найден или уже обработан")
-                return False, "Заказ не найден или уже обработан."
-
-            await db.execute('UPDATE orders SET status = ? WHERE id = ?', ('cancelled', order_id))
-            await db.commit()
-            logger.info(f"Заказ #{order_id} отменён")
-            return True, "Заказ отменён."
+        cancelled, product_id = await writer.submit(lambda db: _cancel_in_tx(db, order_id, actor))
+        if not cancelled:
+            logger.warning(f"Заказ с ID {order_id} не найден или уже обработан")
+            return False, "Заказ не найден или уже обработан."
+        if product_id is not None:
+            await catalog_cache.refresh(product_id)
+
+        logger.info(f"Заказ #{order_id} отменён")
+        return True, "Заказ отменён."
     except Exception as e:
         logger.error(f"Ошибка отмены заказа: {e}", exc_info=True)
         return False, f"Ошибка отмены заказа: {str(e)}"
 
-async def get_pending_orders(games=None):
-    """Возвращает список ожидающих заказов."""
+async def confirm_orders(order_ids, actor='admin'):
+    """
+    Подтверждает несколько заказов одной операцией писателя (одна транзакция).
+    Возвращает (success, msg, delivered) — delivered: order_data выданных заказов (как у confirm_order).
+    """
+    order_ids = list(dict.fromkeys(order_ids))
+
+    async def op(db):
+        return [(order_id, *await _confirm_in_tx(db, order_id, actor)) for order_id in order_ids]
+
+    try:
+        results = await writer.submit(op)
+        delivered = [order_data for _, success, _, order_data in results if success]
+        for game_id in {order_data['game_id'] for order_data in delivered}:
+            await catalog_cache.refresh(game_id)
+
+        msg = f"Подтверждено {len(delivered)} из {len(order_ids)}."
+        no_keys = [order_id for order_id, _, result_msg, _ in results if result_msg == PAID_WITHOUT_KEY_MSG]
+        if no_keys:
+            msg += f" Оплачены, но без ключа: {', '.join(f'#{order_id}' for order_id in no_keys)}."
+        logger.info(f"Массовое подтверждение ({actor}): {msg}")
+        return True, msg, delivered
+    except Exception as e:
+        logger.error(f"Ошибка массового подтверждения заказов: {e}", exc_info=True)
+        return False, f"Ошибка подтверждения заказов: {str(e)}", []
+
+async def cancel_orders(order_ids, actor='admin'):
+    """Отменяет несколько заказов одной операцией писателя. Возвращает (success, msg, id отменённых)."""
+    order_ids = list(dict.fromkeys(order_ids))
+
+    async def op(db):
+        return [(order_id, *await _cancel_in_tx(db, order_id, actor)) for order_id in order_ids]
+
     try:
-        async with aiosqlite.connect('tg_bot.db') as db:
-            db.row_factory = aiosqlite.Row
-            cursor = await db.execute('''
-                                      SELECT o.id AS order_id, o.user_id, o.key_id, o.status, o.order_date, s.game_name
-                                      FROM orders o
-                                               JOIN steam_keys s ON o.key_id = s.id
-                                      WHERE o.status = ?
-                                      ''', ('pending',))
-            orders = await cursor.fetchall()
-            games = [dict(row) for row in games]
-            if not orders:
-                logger.info("Ожидающие заказы не найдены")
-                return False, "Ожидающие заказы не найдены.", []
-
-            result = []
-            for order in orders:
-                result.append({
-                    'order_id': order['order_id'],
-                    'user_id': order['user_id'],
-                    'game_name': order['game_name'],
-                    'order_date': order['order_date']
-                })
-            logger.info(f"Найдено {len(orders)} ожидающих заказов")
-            return True, "Ожидающие заказы найдены.", result
+        results = await writer.submit(op)
+        cancelled = [order_id for order_id, success, _ in results if success]
+        for product_id in {product_id for _, success, product_id in results if success and product_id is not None}:
+            await catalog_cache.refresh(product_id)
+        msg = f"Отменено {len(cancelled)} из {len(order_ids)}."
+        logger.info(f"Массовая отмена ({actor}): {msg}")
+        return True, msg, cancelled
     except Exception as e:
-        logger.error(f"Ошибка получения заказов: {e}", exc_info=True)
-        return False, f"Ошибка получения заказов: {str(e)}", []
+        logger.error(f"Ошибка массовой отмены заказов: {e}", exc_info=True)
+        return False, f"Ошибка отмены заказов: {str(e)}", []
+
+# Очередь заказов для админа: оплаченные без ключа и ждущие оплаты с живой бронью.
+# Просроченные, но ещё не снятые order_reaper заказы оплатить уже нельзя — в очередь
+# не берём. Параметры — _open_order_params()
+_OPEN_ORDER_WHERE = "o.status IN (?, ?) AND (o.status = ? OR o.expires_at IS NULL OR o.expires_at > ?)"
+ORDER_QUEUE_IDS_SQL = f'''
+    SELECT o.id FROM orders o
+    WHERE {_OPEN_ORDER_WHERE}
+    ORDER BY o.id
+'''
+_ORDER_QUEUE_COLUMNS = '''
+    SELECT o.id AS order_id, o.user_id, o.key_id, o.status, o.order_date, o.expires_at, s.game_name
+    FROM orders o
+             LEFT JOIN steam_keys s ON o.key_id = s.id
+'''
+ORDER_QUEUE_NEXT_SQL = f'''{_ORDER_QUEUE_COLUMNS}
+    WHERE {_OPEN_ORDER_WHERE} AND o.id > ?
+    ORDER BY o.id
+    LIMIT ?
+'''
+ORDER_QUEUE_PREV_SQL = f'''{_ORDER_QUEUE_COLUMNS}
+    WHERE {_OPEN_ORDER_WHERE} AND o.id < ?
+    ORDER BY o.id DESC
+    LIMIT ?
+'''
+# Для заголовка "a–b из N": всего в очереди и сколько до первого заказа страницы
+ORDER_QUEUE_COUNT_SQL = f'''
+    SELECT COUNT(*) AS total, COALESCE(SUM(o.id < ?), 0) AS before
+    FROM orders o
+    WHERE {_OPEN_ORDER_WHERE}
+'''
+ORDER_QUEUE_PAGE_SIZE = 10
+
+
+def _open_order_params() -> tuple:
+    return (order_states.PENDING, order_states.PAID, order_states.PAID, int(datetime.now().timestamp()))
+
+
+async def get_open_order_ids() -> list[int]:
+    """id всех заказов очереди (ожидают оплаты или оплачены без ключа) по возрастанию."""
+    async with pool.connection() as db:
+        cursor = await db.execute(ORDER_QUEUE_IDS_SQL, _open_order_params())
+        return [row[0] for row in await cursor.fetchall()]
+
+
+async def filter_open_order_ids(order_ids) -> set[int]:
+    """Те из order_ids, что ещё в очереди."""
+    order_ids = list(order_ids)
+    if not order_ids:
+        return set()
+    placeholders = ", ".join("?" * len(order_ids))
+    async with pool.connection() as db:
+        cursor = await db.execute(
+            f"SELECT o.id FROM orders o WHERE o.id IN ({placeholders}) AND {_OPEN_ORDER_WHERE}",
+            (*order_ids, *_open_order_params())
+        )
+        return {row[0] for row in await cursor.fetchall()}
+
+
+async def get_order_queue_page(after_id=None, before_id=None, limit=ORDER_QUEUE_PAGE_SIZE):
+    """
+    Страница очереди заказов по ключу id (keyset): после after_id или перед before_id.
+    Если после after_id заказов не осталось (их разобрали), отдаёт последнюю страницу.
+    Возвращает (success, msg, page), page — dict с orders/first_id/last_id/has_prev/has_next/total.
+    """
+    try:
+        params = _open_order_params()
+        async with pool.connection() as db:
+            if before_id is not None:
+                cursor = await db.execute(ORDER_QUEUE_PREV_SQL, (*params, before_id, limit))
+                rows = (await cursor.fetchall())[::-1]
+            else:
+                cursor = await db.execute(ORDER_QUEUE_NEXT_SQL, (*params, after_id or 0, limit))
+                rows = await cursor.fetchall()
+                if not rows and after_id is not None:
+                    cursor = await db.execute(ORDER_QUEUE_PREV_SQL, (*params, after_id + 1, limit))
+                    rows = (await cursor.fetchall())[::-1]
+            if not rows:
+                return False, "Ожидающие заказы не найдены.", {}
+            cursor = await db.execute(ORDER_QUEUE_COUNT_SQL, (rows[0]['order_id'], *params))
+            counts = await cursor.fetchone()
+
+        before, total = counts['before'], counts['total']
+        page = {
+            'orders': [{
+                'order_id': row['order_id'],
+                'user_id': row['user_id'],
+                'game_name': row['game_name'] or f"товар #{row['key_id']}",
+                'order_date': row['order_date'],
+                'expires_at': row['expires_at'],
+                'status': row['status'],
+            } for row in rows],
+            'first_id': rows[0]['order_id'],
+            'last_id': rows[-1]['order_id'],
+            'has_prev': before > 0,
+            'has_next': before + len(rows) < total,
+            'total': total,
+        }
+        return True, f"Очередь заказов ({before + 1}–{before + len(rows)} из {total}):", page
+    except Exception as e:
+        logger.error(f"Ошибка получения очереди заказов: {e}", exc_info=True)
+        return False, f"Ошибка получения заказов: {str(e)}", {}
+
+# Выручка — суммы, записанные в журнал в момент выдачи, а не сегодняшние цены товаров
+ANALYTICS_SQL = '''
+    SELECT COUNT(*) as total_orders, SUM(amount) as total_revenue
+    FROM order_events
+    WHERE to_status = ?
+'''
+
 
 async def get_analytics():
     """Возвращает аналитику продаж."""
     try:
-        async with aiosqlite.connect('tg_bot.db') as db:
-            db.row_factory = aiosqlite.Row
-            cursor = await db.execute('''
-                                      SELECT COUNT(*) as total_orders, SUM(s.price * (1.0 - s.discount / 100.0)) as total_revenue
-                                      FROM orders o
-                                               JOIN steam_keys s ON o.key_id = s.id
-                                      WHERE o.status = ?
-                                      ''', ('confirmed',))
+        async with pool.connection() as db:
+            cursor = await db.execute(ANALYTICS_SQL, (order_states.DELIVERED,))
             stats = await cursor.fetchone()
             if not stats:
                 logger.info("Аналитика недоступна: нет подтверждённых заказов")
@@ -0,0 +1,188 @@
+# bot_apps/fuzzy_search.py
+"""
+Нечёткий поиск по названиям игр и их алиасам: триграммный индекс в памяти.
+
+Названия и запросы сначала нормализуются: нижний регистр, кириллица -> латиница,
+римские цифры -> арабские ("GTA V" и "гта 5" дают одно и то же "gta 5").
+Дальше и то и другое режется на триграммы; кандидаты собираются только по самым
+редким триграммам запроса, так что время ответа почти не зависит от размера каталога.
+
+Названия берутся из catalog_cache (он сам вызывает set_name/remove/rebuild),
+алиасы — из таблицы product_aliases.
+"""
+import asyncio
+import logging
+import math
+import re
+
+from bot_apps import pool, writer
+
+logger = logging.getLogger(__name__)
+
+# Доля триграмм запроса, которая должна найтись в названии
+MIN_SIMILARITY = 0.5
+
+_TRANSLIT = {
+    'а': 'a', 'б': 'b', 'в': 'v', 'г': 'g', 'д': 'd', 'е': 'e', 'ё': 'e', 'ж': 'zh',
+    'з': 'z', 'и': 'i', 'й': 'y', 'к': 'k', 'л': 'l', 'м': 'm', 'н': 'n', 'о': 'o',
+    'п': 'p', 'р': 'r', 'с': 's', 'т': 't', 'у': 'u', 'ф': 'f', 'х': 'h', 'ц': 'ts',
+    'ч': 'ch', 'ш': 'sh', 'щ': 'sch', 'ъ': '', 'ы': 'y', 'ь': '', 'э': 'e', 'ю': 'yu',
+    'я': 'ya', 'ң': 'ng', 'ө': 'o', 'ү': 'u',
+}
+_TRANSLIT_TABLE = str.maketrans(_TRANSLIT)
+
+_ROMAN = {
+    'i': '1', 'ii': '2', 'iii': '3', 'iv': '4', 'v': '5', 'vi': '6', 'vii': '7',
+    'viii': '8', 'ix': '9', 'x': '10', 'xi': '11', 'xii': '12', 'xiii': '13',
+    'xiv': '14', 'xv': '15', 'xvi': '16', 'xvii': '17', 'xviii': '18', 'xix': '19', 'xx': '20',
+}
+
+_docs: dict[int, tuple[int, str, frozenset]] = {}   # doc_id -> (product_id, текст, триграммы)
+_product_docs: dict[int, list[int]] = {}            # product_id -> doc_id его названия и алиасов
+_postings: dict[str, set[int]] = {}                 # триграмма -> doc_id
+_names: dict[int, str] = {}                         # product_id -> название
+_aliases: dict[int, set[str]] = {}                  # product_id -> алиасы
+_next_doc_id = 0
+# Растёт при каждой переиндексации названия или алиасов — ключ для кэшей результатов поиска
+version = 0
+_aliases_loaded = False
+_aliases_lock = asyncio.Lock()
+
+
+def normalize(text: str) -> str:
+    text = text.casefold().translate(_TRANSLIT_TABLE)
+    words = re.findall(r'[a-z]+|\d+', text)   # заодно режет "gta5" на "gta 5"
+    return " ".join(_ROMAN.get(word, word) for word in words)
+
+
+def trigrams(text: str) -> frozenset:
+    grams = set()
+    for word in normalize(text).split():
+        padded = f"  {word} "
+        grams.update(padded[i:i + 3] for i in range(len(padded) - 2))
+    return frozenset(grams)
+
+
+def _drop_docs(product_id: int):
+    for doc_id in _product_docs.pop(product_id, []):
+        _, _, grams = _docs.pop(doc_id)
+        for gram in grams:
+            posting = _postings.get(gram)
+            if posting is not None:
+                posting.discard(doc_id)
+                if not posting:
+                    del _postings[gram]
+
+
+def _index_product(product_id: int):
+    """Переиндексирует название и алиасы одного товара."""
+    global _next_doc_id, version
+    version += 1
+    _drop_docs(product_id)
+    if product_id not in _names:
+        return  # алиасы без товара (удалён) не ищем
+    texts = [_names[product_id], *sorted(_aliases.get(product_id, ()))]
+    doc_ids = []
+    for text in texts:
+        grams = trigrams(text)
+        if not grams:
+            continue
+        doc_id = _next_doc_id
+        _next_doc_id += 1
+        _docs[doc_id] = (product_id, text, grams)
+        for gram in grams:
+            _postings.setdefault(gram, set()).add(doc_id)
+        doc_ids.append(doc_id)
+    _product_docs[product_id] = doc_ids
+
+
+def rebuild(products):
+    """Полная перестройка по парам (id, название) — вызывается из catalog_cache.load()."""
+    _docs.clear()
+    _product_docs.clear()
+    _postings.clear()
+    _names.clear()
+    for product_id, name in products:
+        _names[product_id] = name
+        _index_product(product_id)
+
+
+def set_name(product_id: int, name: str):
+    if _names.get(product_id) == name and product_id in _product_docs:
+        return
+    _names[product_id] = name
+    _index_product(product_id)
+
+
+def remove(product_id: int):
+    global version
+    version += 1
+    _names.pop(product_id, None)
+    _aliases.pop(product_id, None)
+    _drop_docs(product_id)
+
+
+async def load_aliases():
+    global _aliases_loaded
+    async with _aliases_lock:
+        async with pool.connection() as db:
+            cursor = await db.execute('SELECT product_id, alias FROM product_aliases')
+            rows = await cursor.fetchall()
+
+        _aliases.clear()
+        for row in rows:
+            _aliases.setdefault(row['product_id'], set()).add(row['alias'])
+        for product_id in list(_names):
+            _index_product(product_id)
+        _aliases_loaded = True
+        logger.info(f"Алиасы игр загружены: {len(rows)}")
+
+
+async def add_alias(product_id: int, alias: str) -> bool:
+    """Сохраняет алиас; False — такой алиас у игры уже есть."""
+    if not _aliases_loaded:
+        await load_aliases()
+    result = await writer.execute(
+        'INSERT OR IGNORE INTO product_aliases (product_id, alias) VALUES (?, ?)',
+        (product_id, alias)
+    )
+    if result.rowcount == 0:
+        return False
+    _aliases.setdefault(product_id, set()).add(alias)
+    _index_product(product_id)
+    return True
+
+
+async def search(query: str, limit: int = 5) -> list[tuple[int, float, str]]:
+    """
+    Похожие игры: [(product_id, сходство 0..1, совпавшее название/алиас)],
+    лучшие сначала, по одной записи на игру.
+    """
+    if not _aliases_loaded:
+        await load_aliases()
+    query_grams = trigrams(query)
+    if not query_grams:
+        return []
+
+    # Чтобы набрать need общих триграмм, название обязано содержать хотя бы одну
+    # из (len - need + 1) самых редких триграмм запроса — частые списки не трогаем
+    need = math.ceil(MIN_SIMILARITY * len(query_grams))
+    rarest = sorted(query_grams, key=lambda gram: len(_postings.get(gram, ())))
+    candidates = set()
+    for gram in rarest[:len(query_grams) - need + 1]:
+        candidates.update(_postings.get(gram, ()))
+
+    best: dict[int, tuple[float, float, str]] = {}
+    for doc_id in candidates:
+        product_id, text, grams = _docs[doc_id]
+        common = len(query_grams & grams)
+        coverage = common / len(query_grams)
+        if coverage < MIN_SIMILARITY:
+            continue
+        # При равном покрытии выше то название, в котором меньше лишнего
+        jaccard = common / (len(query_grams) + len(grams) - common)
+        if product_id not in best or (coverage, jaccard) > best[product_id][:2]:
+            best[product_id] = (coverage, jaccard, text)
+
+    ranked = sorted(best.items(), key=lambda item: item[1][:2], reverse=True)[:limit]
+    return [(product_id, coverage, text) for product_id, (coverage, _, text) in ranked]
@@ -1,14 +1,22 @@
+import asyncio
 import html
+import os
 import shlex
 import logging
+import tempfile
+import time
+from datetime import datetime
 from aiogram import Router, F, Bot
-from aiogram.filters import CommandStart, Command
-from aiogram.types import Message, CallbackQuery
-from aiogram.exceptions import TelegramBadRequest
+from aiogram.filters import Command
+from aiogram.types import (
+    Message, CallbackQuery, InputMediaPhoto, InlineQuery, InlineQueryResultArticle,
+    InlineQueryResultCachedPhoto, InlineQueryResultPhoto, InputTextMessageContent, User,
+)
+from aiogram.exceptions import TelegramBadRequest, TelegramRetryAfter
 from bot_apps import keyboards as kb
 from bot_apps import db_user
 from bot_apps import db_admin
-import aiosqlite
+from bot_apps import cards, catalog_cache, catalog_filter, fuzzy_search, key_import, media_cache, pool, price_index, writer
 from aiogram.filters.command import CommandObject
 from aiogram import types
 
@@ -24,7 +32,7 @@ PAYMENT_DETAILS = (
     "👤 Имя держателя: Турдумаматов Улукбек\n"
 )
 async def broadcast_sale_notification(bot, game_name: str, sale_text: str, ends_at: str):
-    async with aiosqlite.connect('tg_bot.db') as db:
+    async with pool.connection() as db:
         cursor = await db.execute("SELECT tg_id FROM users")
         users = await cursor.fetchall()
 
@@ -54,30 +62,28 @@ async def cmd_sale(message: Message, bot: Bot, command: CommandObject):
 
     args = shlex.split(command.args or "")
     if len(args) < 3:
-        return await message.answer("Использование:\n/sale <ID> \"Текст акции\" \"2025-12-31\"")
+        return await message.answer(
+            "Использование:\n/sale <ID> \"Текст акции\" \"2025-12-31\" [\"дата начала\"]"
+        )
 
     try:
         game_id = int(args[0])
         sale_text = args[1]
         ends_at = args[2]
+        starts_at = args[3] if len(args) > 3 else None
     except:
         return await message.answer("Неверный формат.")
 
-    async with aiosqlite.connect('tg_bot.db') as db:
-        db.row_factory = aiosqlite.Row
-        cursor = await db.execute("SELECT game_name FROM steam_keys WHERE id = ?", (game_id,))
-        game = await cursor.fetchone()
-        if not game:
-            return await message.answer("Игра не найдена.")
+    game = await catalog_cache.get(game_id)
+    if not game:
+        return await message.answer("Игра не найдена.")
 
-        await db.execute(
-            "UPDATE steam_keys SET sale_active = 1, sale_not = ?, sale_ends_at = ? WHERE id = ?",
-            (sale_text, ends_at, game_id)
-        )
-        await db.commit()
+    success, msg = await db_user.set_sale(game_id, sale_text, ends_at, starts_at)
+    if not success:
+        return await message.answer(msg)
 
     await message.answer("Акция включена! Рассылаю уведомления...")
-    sent = await broadcast_sale_notification(bot, game['game_name'], sale_text, ends_at)
+    sent = await broadcast_sale_notification(bot, game.game_name, sale_text, ends_at)
     await message.answer(f"Готово! Уведомлено {sent} пользователей.")
 
 @rt.callback_query(F.data == "admin_sales_menu")
@@ -88,6 +94,7 @@ async def admin_sales_menu(callback: CallbackQuery):
     text = (
         "<b>Управление акциями на игры</b>\n\n"
         "<code>/sale 15 \"Скидка 80%\" \"2025-12-31\"</code> — включить акцию + разослать всем\n"
+        "<code>/sale 15 \"Скидка 80%\" \"2025-12-31\" \"2025-12-20\"</code> — акция с датой начала\n"
         "<code>/sale_off 15</code> — выключить акцию\n\n"
         "<i>Пример:</i>\n"
         "<code>/sale 23 \"АКЦИЯ -70%\" \"2025-12-31\"</code>"
@@ -106,18 +113,12 @@ async def cmd_sale_off(message: Message):
 
     try:
         game_id = int(message.text.split()[1])
-        async with aiosqlite.connect('tg_bot.db') as db:
-            await db.execute(
-                "UPDATE steam_keys SET sale_active = 0, sale_not = NULL, sale_ends_at = NULL WHERE id = ?",
-                (game_id,)
-            )
-            await db.commit()
-        await message.answer("Акция отключена.")
+        success, msg = await db_user.clear_sale(game_id)
+        await message.answer("Акция отключена." if success else msg)
     except:
         await message.answer("Использование: /sale_off <ID>")
 async def get_admin_ids():
-    async with aiosqlite.connect('tg_bot.db') as db:
-        db.row_factory = aiosqlite.Row
+    async with pool.connection() as db:
         cur = await db.execute("SELECT tg_id FROM admins")
         rows = await cur.fetchall()
         return [row["tg_id"] for row in rows]
@@ -159,7 +160,10 @@ async def admin_add_product_callback(callback: CallbackQuery):
             return
         await callback.message.answer(
             html.escape(
-                "Формат: /add_product 'название игры' 'цена' 'количество' 'жанр' 'страна' 'ключ' ['URL1,URL2,URL3']"),
+                f"{ADD_PRODUCT_USAGE}\n"
+                f"{ADD_OS_KEY_USAGE}\n"
+                "Докладывать ключи: /add_keys <ID> <ключ1> <ключ2> ...\n"
+                f"{IMPORT_KEYS_USAGE}"),
             parse_mode='HTML'
         )
         await callback.answer()
@@ -231,25 +235,7 @@ async def admin_orders_callback(callback: CallbackQuery):
         if not await db_admin.is_admin(callback.from_user.id):
             await callback.answer("Эта команда доступна только администратору.", show_alert=True)
             return
-        success, msg, orders = await db_user.get_pending_orders()
-        if success and orders:
-            for order in orders:
-                await callback.message.answer(
-                    html.escape(
-                        f"*Заказ ID*: {order['order_id']}\n"
-                        f"*Пользователь*: {order['user_id']}\n"
-                        f"*Игра*: {order['game_name']}\n"
-                        f"*Дата*: {order['order_date']}"
-                    ),
-                    reply_markup=kb.get_order_actions_keyboard(order['order_id']),
-                    parse_mode='HTML'
-                )
-        else:
-            await callback.message.answer(
-                html.escape(msg),
-                reply_markup=kb.get_main_menu(),
-                parse_mode='HTML'
-            )
+        await _send_order_queue(callback.message, callback.from_user.id)
         await callback.answer()
     except Exception as e:
         logger.error(f"Ошибка в обработчике admin_orders: {e}", exc_info=True)
@@ -336,48 +322,61 @@ async def buy(message: Message, bot: Bot):
             )
             return
 
-        # создаём заказ
-        success, msg, order_data = await db_user.create_order(message.from_user.id, game_id)
+        await _place_order(message, bot, game_id)
 
-        # если не получилось — показываем ошибку и ВЫХОД
-        if not success or not order_data:
-            await message.answer(
-                html.escape(msg),
-                parse_mode='HTML'
-            )
-            return
+    except Exception as e:
+        logger.error(f"Ошибка в обработчике /buy: {e}", exc_info=True)
+        await message.answer("Произошла ошибка при покупке.")
 
-        # если всё ок — отправляем реквизиты пользователю
+
+async def _place_order(message: Message, bot: Bot, game_id: int, user: User | None = None):
+    """
+    Создаёт заказ от user (по умолчанию — автора сообщения), отвечает в чат
+    сообщения реквизитами и уведомляет админов. Из callback передаётся
+    callback.from_user: автор callback.message — сам бот.
+    """
+    user = user or message.from_user
+    # создаём заказ
+    success, msg, order_data = await db_user.create_order(user.id, game_id)
+
+    # если не получилось — показываем ошибку и ВЫХОД
+    if not success or not order_data:
         await message.answer(
-            html.escape(
-                f"Заказ #{order_data['order_id']} на '{order_data['game_name']}' создан!\n{PAYMENT_DETAILS}"
-            ),
+            html.escape(msg),
             parse_mode='HTML'
         )
+        return
 
-        # уведомляем админов (если тут что-то упадёт — юзеру уже всё ок показали)
-        try:
-            admin_ids = await get_admin_ids()
-            for admin_id in admin_ids:
-                try:
-                    await bot.send_message(
-                        admin_id,
-                        html.escape(
-                            f"Новый заказ #{order_data['order_id']}!\n"
-                            f"Пользователь: @{message.from_user.username or message.from_user.id}\n"
-                            f"Игра: {order_data['game_name']}"
-                        ),
-                        reply_markup=kb.get_order_actions_keyboard(order_data['order_id']),
-                        parse_mode='HTML'
-                    )
-                except Exception as e:
-                    logger.error(f"Не удалось отправить уведомление админу {admin_id}: {e}", exc_info=True)
-        except Exception as e:
-            logger.error(f"Ошибка при отправке уведомлений администраторам: {e}", exc_info=True)
+    # если всё ок — отправляем реквизиты пользователю
+    await message.answer(
+        html.escape(
+            f"Заказ #{order_data['order_id']} на '{order_data['game_name']}' создан!\n{PAYMENT_DETAILS}\n"
+            f"Ключ забронирован за вами до "
+            f"{datetime.fromtimestamp(order_data['expires_at']).strftime('%H:%M')} — "
+            f"неоплаченный к этому времени заказ отменяется автоматически."
+        ),
+        parse_mode='HTML'
+    )
 
+    # уведомляем админов (если тут что-то упадёт — юзеру уже всё ок показали)
+    try:
+        admin_ids = await get_admin_ids()
+        for admin_id in admin_ids:
+            try:
+                await bot.send_message(
+                    admin_id,
+                    html.escape(
+                        f"Новый заказ #{order_data['order_id']}!\n"
+                        f"Пользователь: @{user.username or user.id}\n"
+                        f"Игра: {order_data['game_name']}"
+                    ),
+                    reply_markup=kb.get_order_actions_keyboard(order_data['order_id']),
+                    parse_mode='HTML'
+                )
+            except Exception as e:
+                logger.error(f"Не удалось отправить уведомление админу {admin_id}: {e}", exc_info=True)
     except Exception as e:
-        logger.error(f"Ошибка в обработчике /buy: {e}", exc_info=True)
-        await message.answer("Произошла ошибка при покупке.")
+        logger.error(f"Ошибка при отправке уведомлений администраторам: {e}", exc_info=True)
 
 
 @rt.callback_query(F.data.startswith("buy_"))
@@ -396,46 +395,7 @@ async def buy_callback(callback: CallbackQuery, bot: Bot):
             await callback.answer()
             return
 
-        # создаём заказ
-        success, msg, order_data = await db_user.create_order(callback.from_user.id, game_id)
-
-        # если ошибка — говорим и выходим
-        if not success or not order_data:
-            await callback.message.answer(
-                html.escape(msg),
-                parse_mode='HTML'
-            )
-            await callback.answer()
-            return
-
-        # если всё ок — отправляем реквизиты
-        await callback.message.answer(
-            html.escape(
-                f"Заказ #{order_data['order_id']} на '{order_data['game_name']}' создан!\n{PAYMENT_DETAILS}"
-            ),
-            parse_mode='HTML'
-        )
-
-        # уведомляем админов отдельно
-        try:
-            admin_ids = await get_admin_ids()
-            for admin_id in admin_ids:
-                try:
-                    await bot.send_message(
-                        admin_id,
-                        html.escape(
-                            f"Новый заказ #{order_data['order_id']}!\n"
-                            f"Пользователь: @{callback.from_user.username or callback.from_user.id}\n"
-                            f"Игра: {order_data['game_name']}"
-                        ),
-                        reply_markup=kb.get_order_actions_keyboard(order_data['order_id']),
-                        parse_mode='HTML'
-                    )
-                except Exception as e:
-                    logger.error(f"Не удалось отправить уведомление админу {admin_id}: {e}", exc_info=True)
-        except Exception as e:
-            logger.error(f"Ошибка при отправке уведомлений администраторам: {e}", exc_info=True)
-
+        await _place_order(callback.message, bot, game_id, user=callback.from_user)
         await callback.answer()
 
     except Exception as e:
@@ -453,24 +413,17 @@ async def confirm_order_callback(callback: CallbackQuery, bot: Bot):
             await callback.answer("Эта команда доступна только администратору.", show_alert=True)
             return
         order_id = int(callback.data.replace("confirm_order_", ""))
-        success, msg, order_data = await db_user.confirm_order(order_id)
+        success, msg, order_data = await db_user.confirm_order(order_id, actor=f"admin:{callback.from_user.id}")
         if success and order_data:
-            await bot.send_message(
-                order_data['user_id'],
-                html.escape(
-                    f"Ваш заказ #{order_data['order_id']} подтверждён!\nИгра: {order_data['game_name']}\nКлюч: {order_data['key']}"),
-                parse_mode='HTML'
-            )
+            await bot.send_message(order_data['user_id'], _key_delivery_text(order_data), parse_mode='HTML')
             await callback.message.edit_text(
                 html.escape(f"Заказ #{order_id} подтверждён. Ключ отправлен пользователю."),
                 parse_mode='HTML'
             )
+            await callback.answer()
         else:
-            await callback.message.answer(
-                html.escape(msg),
-                parse_mode='HTML'
-            )
-        await callback.answer()
+            # Другой админ успел раньше — всплывающее окно вместо сообщения в чат
+            await callback.answer(msg, show_alert=True)
     except TelegramBadRequest as e:
         if "message is not modified" in str(e):
             logger.debug(f"Сообщение не изменено, пропускаем: {e}")
@@ -482,6 +435,187 @@ async def confirm_order_callback(callback: CallbackQuery, bot: Bot):
         await callback.answer("Произошла ошибка.", show_alert=True)
 
 
+# Массовая выдача ключей: не больше стольких сообщений в секунду (общий лимит Telegram ~30/с)
+DELIVERY_RATE = 20
+
+_order_queue_selection: dict[int, set[int]] = {}   # id админа -> выбранные в очереди заказы
+# Фоновые рассылки ключей: держим ссылки, чтобы задачи не собрал GC
+_delivery_tasks: set[asyncio.Task] = set()
+
+
+def _key_delivery_text(order_data: dict) -> str:
+    return html.escape(
+        f"Ваш заказ #{order_data['order_id']} подтверждён!\nИгра: {order_data['game_name']}\nКлюч: {order_data['key']}"
+    )
+
+
+async def _fan_out(bot: Bot, messages: list[tuple[int, str]]) -> list[int]:
+    """Рассылает (chat_id, html-текст) с шагом 1/DELIVERY_RATE; возвращает номера недоставленных."""
+    failed = []
+    for n, (chat_id, text) in enumerate(messages):
+        for attempt in range(2):
+            try:
+                await bot.send_message(chat_id, text, parse_mode='HTML')
+                break
+            except TelegramRetryAfter as e:
+                if attempt:
+                    failed.append(n)
+                    break
+                logger.warning(f"Лимит Telegram при рассылке, ждём {e.retry_after} с")
+                await asyncio.sleep(e.retry_after)
+            except Exception as e:
+                failed.append(n)
+                logger.error(f"Не удалось отправить сообщение {chat_id}: {e}", exc_info=True)
+                break
+        await asyncio.sleep(1 / DELIVERY_RATE)
+    return failed
+
+
+async def _deliver_keys(bot: Bot, admin_id: int, delivered: list[dict]):
+    """
+    Фоновая рассылка ключей подтверждённых заказов. Недоставленные заказы
+    (с ключами — чтобы переслать вручную) приходят админу отдельным сообщением.
+    """
+    try:
+        failed = await _fan_out(bot, [(data['user_id'], _key_delivery_text(data)) for data in delivered])
+        if not failed:
+            return
+        lines = [f"Не доставлены ключи по заказам ({len(failed)} из {len(delivered)}):"]
+        lines += [f"#{delivered[n]['order_id']} · пользователь {delivered[n]['user_id']} · ключ {delivered[n]['key']}"
+                  for n in failed]
+        # Длинный отчёт — несколькими сообщениями (лимит Telegram 4096 символов)
+        chunk = []
+        for line in lines:
+            if chunk and sum(len(part) + 1 for part in chunk) + len(line) > 4000:
+                await bot.send_message(admin_id, html.escape("\n".join(chunk)), parse_mode='HTML')
+                chunk = []
+            chunk.append(line)
+        await bot.send_message(admin_id, html.escape("\n".join(chunk)), parse_mode='HTML')
+    except Exception as e:
+        logger.error(f"Ошибка фоновой рассылки ключей админа {admin_id}: {e}", exc_info=True)
+
+
+def _order_queue_text(msg: str, page: dict, selected: set[int]) -> str:
+    lines = [msg]
+    for order in page['orders']:
+        line = (f"{'☑' if order['order_id'] in selected else '☐'} #{order['order_id']} · {order['game_name']} · "
+                f"пользователь {order['user_id']} · {order['order_date']}")
+        if order['status'] == 'paid':
+            line += " · оплачен, ключ не выдан"
+        lines.append(line)
+    if selected:
+        lines.append(f"\nВыбрано заказов: {len(selected)}")
+    return html.escape("\n".join(lines))
+
+
+async def _queue_selection(admin_id: int) -> set[int]:
+    """Выбор админа без заказов, которые уже ушли из очереди."""
+    selected = _order_queue_selection.setdefault(admin_id, set())
+    selected &= await db_user.filter_open_order_ids(selected)
+    return selected
+
+
+async def _send_order_queue(message: Message, admin_id: int):
+    """Очередь заказов одним сообщением (первая страница)."""
+    success, msg, page = await db_user.get_order_queue_page()
+    if not success:
+        await message.answer(html.escape(msg), reply_markup=kb.get_main_menu(), parse_mode='HTML')
+        return
+    selected = await _queue_selection(admin_id)
+    await message.answer(
+        _order_queue_text(msg, page, selected),
+        reply_markup=kb.get_order_queue_keyboard(page, selected),
+        parse_mode='HTML'
+    )
+
+
+async def _edit_order_queue(callback: CallbackQuery, after_id=None, before_id=None):
+    success, msg, page = await db_user.get_order_queue_page(after_id=after_id, before_id=before_id)
+    if not success:
+        await callback.message.edit_text(html.escape(msg), parse_mode='HTML')
+        return
+    selected = await _queue_selection(callback.from_user.id)
+    try:
+        await callback.message.edit_text(
+            _order_queue_text(msg, page, selected),
+            reply_markup=kb.get_order_queue_keyboard(page, selected),
+            parse_mode='HTML'
+        )
+    except TelegramBadRequest as e:
+        # "message is not modified" — страница и выбор не изменились
+        if "not modified" not in str(e):
+            raise
+
+
+@rt.callback_query(F.data.startswith("oq:"))
+async def order_queue_callback(callback: CallbackQuery, bot: Bot):
+    """Консоль очереди заказов: листание, выбор и массовые подтверждение/отмена."""
+    admin_id = callback.from_user.id
+    try:
+        if not await db_admin.is_admin(admin_id):
+            await callback.answer("Эта команда доступна только администратору.", show_alert=True)
+            return
+        # oq:<действие>:<id>[:<первый id страницы>]
+        action, _, rest = callback.data.removeprefix("oq:").partition(":")
+        parts = [int(part) for part in rest.split(":")]
+        selected = _order_queue_selection.setdefault(admin_id, set())
+        start = parts[-1]
+        notice = None
+        delivered = []
+
+        if action == 'n':
+            await _edit_order_queue(callback, after_id=parts[0])
+            await callback.answer()
+            return
+        if action == 'v':
+            await _edit_order_queue(callback, before_id=parts[0])
+            await callback.answer()
+            return
+        if action == 't':
+            selected ^= {parts[0]}
+        elif action == 'a':
+            _, _, page = await db_user.get_order_queue_page(after_id=start - 1)
+            selected.update(order['order_id'] for order in page.get('orders', ()))
+        elif action == 'A':
+            selected.update(await db_user.get_open_order_ids())
+        elif action == 'c':
+            selected.clear()
+        elif action in ('ok', 'x'):
+            if not selected:
+                await callback.answer("Ничего не выбрано.", show_alert=True)
+                return
+            order_ids = sorted(selected)
+            actor = f"admin:{admin_id}"
+            if action == 'ok':
+                success, notice, delivered = await db_user.confirm_orders(order_ids, actor=actor)
+                if delivered:
+                    notice += " Ключи рассылаются в фоне."
+            else:
+                success, notice, _ = await db_user.cancel_orders(order_ids, actor=actor)
+            # При ошибке выбор остаётся — админ может повторить
+            if success:
+                selected.difference_update(order_ids)
+
+        try:
+            await _edit_order_queue(callback, after_id=start - 1)
+            if notice:
+                await callback.answer(notice[:200], show_alert=True)
+            else:
+                await callback.answer()
+        finally:
+            # Рассылка — после ответа на нажатие (ни callback, ни очередь её не ждут)
+            # и даже если ответить не вышло: заказы уже подтверждены
+            if delivered:
+                task = asyncio.create_task(_deliver_keys(bot, admin_id, delivered), name="key-delivery")
+                _delivery_tasks.add(task)
+                task.add_done_callback(_delivery_tasks.discard)
+    except ValueError:
+        await callback.answer("Кнопка устарела, откройте очередь заново.", show_alert=True)
+    except Exception as e:
+        logger.error(f"Ошибка в очереди заказов: {e}", exc_info=True)
+        await callback.answer("Произошла ошибка.", show_alert=True)
+
+
 @rt.callback_query(F.data.startswith("cancel_order_"))
 async def cancel_order_callback(callback: CallbackQuery):
     """Обработчик отмены заказа."""
@@ -491,7 +625,7 @@ async def cancel_order_callback(callback: CallbackQuery):
             await callback.answer("Эта команда доступна только администратору.", show_alert=True)
             return
         order_id = int(callback.data.replace("cancel_order_", ""))
-        success, msg = await db_user.cancel_order(order_id)
+        success, msg = await db_user.cancel_order(order_id, actor=f"admin:{callback.from_user.id}")
         await callback.message.answer(
             html.escape(msg),
             parse_mode='HTML'
@@ -520,25 +654,7 @@ async def pending_orders(message: Message):
                 parse_mode='HTML'
             )
             return
-        success, msg, orders = await db_user.get_pending_orders()
-        if success and orders:
-            for order in orders:
-                await message.answer(
-                    html.escape(
-                        f"*Заказ ID*: {order['order_id']}\n"
-                        f"*Пользователь*: {order['user_id']}\n"
-                        f"*Игра*: {order['game_name']}\n"
-                        f"*Дата*: {order['order_date']}"
-                    ),
-                    reply_markup=kb.get_order_actions_keyboard(order['order_id']),
-                    parse_mode='HTML'
-                )
-        else:
-            await message.answer(
-                html.escape(msg),
-                reply_markup=kb.get_main_menu(),
-                parse_mode='HTML'
-            )
+        await _send_order_queue(message, message.from_user.id)
     except Exception as e:
         logger.error(f"Ошибка в обработчике /pending_orders: {e}", exc_info=True)
         await message.answer("Произошла ошибка при получении заказов.")
@@ -605,6 +721,13 @@ async def handle_payment_screenshot(message: Message, bot: Bot):
 
 
 
+# Остаток товара — число переданных ключей, отдельного количества нет
+ADD_PRODUCT_USAGE = (
+    "Формат: /add_product 'название игры' 'цена' 'жанр' 'страна' 'ключи' ['URL1,URL2,URL3']\n"
+    "Несколько ключей — в одних кавычках через запятую или с новой строки."
+)
+
+
 @rt.message(Command('add_product'))
 async def add_product(message: Message):
     """Обработчик команды /add_product."""
@@ -618,42 +741,168 @@ async def add_product(message: Message):
         return
     try:
         args = shlex.split(message.text)[1:]
-        if len(args) < 6:
-            await message.answer(
-                html.escape(
-                    "Формат: /add_product 'название игры' 'цена' 'количество' 'жанр' 'страна' 'ключ' ['URL1,URL2,URL3']"),
-                parse_mode='HTML'
-            )
+        if len(args) < 5:
+            await message.answer(html.escape(ADD_PRODUCT_USAGE), parse_mode='HTML')
             return
-        game_name, price, count, genre, region, st_key = args[:6]
-        image_urls = args[6] if len(args) > 6 else None
+        game_name, price, genre, region, st_key = args[:5]
+        image_urls = args[5] if len(args) > 5 else None
         price = int(price)
-        count = int(count)
         if price < 0:
             await message.answer(
                 html.escape("Цена не может быть отрицательной"),
                 parse_mode='HTML'
             )
             return
-        if count < 1:
+        success, msg = await db_user.add_steam_key_into_db(game_name, st_key, price, genre, region, image_urls)
+        await message.answer(html.escape(msg), parse_mode='HTML')
+    except ValueError:
+        await message.answer(
+            html.escape("Цена должна быть числом"),
+            parse_mode='HTML'
+        )
+    except Exception as e:
+        logger.error(f"Ошибка в обработчике /add_product: {e}", exc_info=True)
+        await message.answer("Произошла ошибка при добавлении продукта.")
+
+
+@rt.message(Command('add_keys'))
+async def add_keys(message: Message):
+    """Обработчик команды /add_keys: докладывает настоящие ключи товару."""
+    logger.info(f"Команда /add_keys от пользователя {message.from_user.id}")
+    if not await db_admin.is_admin(message.from_user.id):
+        await message.answer(
+            html.escape("Эта команда доступна только администратору."),
+            reply_markup=kb.get_main_menu(),
+            parse_mode='HTML'
+        )
+        return
+    try:
+        parts = message.text.split(maxsplit=2)
+        if len(parts) < 3 or not parts[1].isdigit():
             await message.answer(
-                html.escape("Количество ключей должно быть больше 0"),
+                html.escape("Формат: /add_keys <ID товара> <ключ1> <ключ2> ... (через пробел, запятую или с новой строки)"),
                 parse_mode='HTML'
             )
             return
-        success, msg = await db_user.add_steam_key_into_db(game_name, st_key, price, count, genre, region, image_urls)
+        success, msg, _ = await db_user.add_product_keys(int(parts[1]), parts[2])
+        await message.answer(html.escape(msg), parse_mode='HTML')
+    except Exception as e:
+        logger.error(f"Ошибка в обработчике /add_keys: {e}", exc_info=True)
+        await message.answer("Произошла ошибка при добавлении ключей.")
+
+
+IMPORT_KEYS_USAGE = (
+    "Загрузка ключей файлом: пришлите TXT/CSV документом с подписью\n"
+    "/import_keys <ID товара> — в файле по ключу на строку,\n"
+    "/import_keys — CSV со столбцами 'ID товара;ключ'."
+)
+# Не чаще этого (секунды) обновляем сообщение с ходом импорта
+IMPORT_PROGRESS_INTERVAL = 1.5
+
+
+@rt.message(Command('import_keys'), F.document)
+async def import_keys_document(message: Message, bot: Bot, command: CommandObject):
+    """Документ с подписью /import_keys: загружает ключи из файла пачками."""
+    logger.info(f"Импорт ключей файлом от пользователя {message.from_user.id}")
+    if not await db_admin.is_admin(message.from_user.id):
         await message.answer(
-            html.escape(msg),
+            html.escape("Эта команда доступна только администратору."),
+            reply_markup=kb.get_main_menu(),
             parse_mode='HTML'
         )
+        return
+    try:
+        args = (command.args or '').strip()
+        if args and not args.isdigit():
+            await message.answer(html.escape(IMPORT_KEYS_USAGE), parse_mode='HTML')
+            return
+        product_id = int(args) if args else None
+        if product_id is not None and await catalog_cache.get(product_id) is None:
+            await message.answer(html.escape(f"Товар с ID {product_id} не найден."), parse_mode='HTML')
+            return
+        if (message.document.file_size or 0) > key_import.MAX_FILE_SIZE:
+            await message.answer(html.escape("Файл больше 20 МБ — разбейте его на части."), parse_mode='HTML')
+            return
+
+        status = await message.answer(html.escape("Загружаю файл…"), parse_mode='HTML')
+        last_edit = time.monotonic()
+
+        async def progress(stats):
+            nonlocal last_edit
+            if time.monotonic() - last_edit < IMPORT_PROGRESS_INTERVAL:
+                return
+            last_edit = time.monotonic()
+            try:
+                await status.edit_text(html.escape(key_import.describe_progress(stats)), parse_mode='HTML')
+            except TelegramBadRequest as e:
+                logger.debug(f"Не удалось обновить ход импорта: {e}")
+
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'keys.txt')
+            await bot.download(message.document, destination=path)
+            with open(path, encoding='utf-8-sig', errors='replace', newline='') as file:
+                stats = await key_import.import_lines(file, product_id, progress)
+
+        logger.info(f"Импорт ключей: добавлено {stats.added} из {stats.total}, товары {sorted(stats.products)}")
+        await status.edit_text(html.escape(key_import.describe(stats)), parse_mode='HTML')
+    except Exception as e:
+        logger.error(f"Ошибка в обработчике импорта ключей: {e}", exc_info=True)
+        await message.answer("Произошла ошибка при импорте ключей.")
+
+
+@rt.message(Command('import_keys'))
+async def import_keys_usage(message: Message):
+    """/import_keys без файла — подсказка по формату."""
+    if not await db_admin.is_admin(message.from_user.id):
+        await message.answer(
+            html.escape("Эта команда доступна только администратору."),
+            reply_markup=kb.get_main_menu(),
+            parse_mode='HTML'
+        )
+        return
+    await message.answer(html.escape(IMPORT_KEYS_USAGE), parse_mode='HTML')
+
+
+ADD_OS_KEY_USAGE = "Ключи Windows/Office: /add_os_key windows|office 'название' 'цена' 'регион' 'ключи' ['версия']"
+
+
+@rt.message(Command('add_os_key'))
+async def add_os_key(message: Message):
+    """Обработчик команды /add_os_key: товар-ключ Windows или Office в общий каталог."""
+    logger.info(f"Команда /add_os_key от пользователя {message.from_user.id}")
+    if not await db_admin.is_admin(message.from_user.id):
+        await message.answer(
+            html.escape("Эта команда доступна только администратору."),
+            reply_markup=kb.get_main_menu(),
+            parse_mode='HTML'
+        )
+        return
+    try:
+        args = shlex.split(message.text)[1:]
+        if len(args) < 5 or args[0] not in ('windows', 'office'):
+            await message.answer(html.escape(f"Формат: {ADD_OS_KEY_USAGE}"), parse_mode='HTML')
+            return
+        product_type, name, price, region, key_text = args[:5]
+        attributes = {'version': args[5]} if len(args) > 5 else None
+        price = float(price)
+        if price < 0:
+            await message.answer(
+                html.escape("Цена не может быть отрицательной"),
+                parse_mode='HTML'
+            )
+            return
+        success, msg = await db_user.add_steam_key_into_db(
+            name, key_text, price, region=region, product_type=product_type, attributes=attributes
+        )
+        await message.answer(html.escape(msg), parse_mode='HTML')
     except ValueError:
         await message.answer(
-            html.escape("Цена и количество должны быть числами"),
+            html.escape("Цена должна быть числом"),
             parse_mode='HTML'
         )
     except Exception as e:
-        logger.error(f"Ошибка в обработчике /add_product: {e}", exc_info=True)
-        await message.answer("Произошла ошибка при добавлении продукта.")
+        logger.error(f"Ошибка в обработчике /add_os_key: {e}", exc_info=True)
+        await message.answer("Произошла ошибка при добавлении ключа.")
 
 
 @rt.message(Command('edit_product'))
@@ -737,6 +986,45 @@ async def delete_product(message: Message):
         await message.answer("Произошла ошибка при удалении продукта.")
 
 
+@rt.message(Command('add_alias'))
+async def add_alias(message: Message):
+    """Обработчик команды /add_alias — ещё одно название игры для поиска."""
+    logger.info(f"Команда /add_alias от пользователя {message.from_user.id}")
+    if not await db_admin.is_admin(message.from_user.id):
+        await message.answer(
+            html.escape("Эта команда доступна только администратору."),
+            reply_markup=kb.get_main_menu(),
+            parse_mode='HTML'
+        )
+        return
+    try:
+        args = shlex.split(message.text)[1:]
+        if len(args) < 2:
+            await message.answer(
+                html.escape("Формат: /add_alias 'ID' 'название' (например: /add_alias 2 'Ведьмак 3')"),
+                parse_mode='HTML'
+            )
+            return
+        game_id = int(args[0])
+        alias = " ".join(args[1:]).strip()
+        if await catalog_cache.get(game_id) is None:
+            await message.answer(html.escape(f"Игра с ID {game_id} не найдена."), parse_mode='HTML')
+            return
+        if await fuzzy_search.add_alias(game_id, alias):
+            msg = f"Алиас '{alias}' добавлен к игре {game_id}."
+        else:
+            msg = f"У игры {game_id} уже есть алиас '{alias}'."
+        await message.answer(html.escape(msg), parse_mode='HTML')
+    except ValueError:
+        await message.answer(
+            html.escape("ID должен быть числом"),
+            parse_mode='HTML'
+        )
+    except Exception as e:
+        logger.error(f"Ошибка в обработчике /add_alias: {e}", exc_info=True)
+        await message.answer("Произошла ошибка при добавлении алиаса.")
+
+
 @rt.message(Command('set_discount'))
 async def set_discount(message: Message):
     """Обработчик команды /set_discount."""
@@ -790,25 +1078,7 @@ async def orders(message: Message):
         )
         return
     try:
-        success, msg, orders = await db_user.get_pending_orders()
-        if success and orders:
-            for order in orders:
-                await message.answer(
-                    html.escape(
-                        f"*Заказ ID*: {order['order_id']}\n"
-                        f"*Пользователь*: {order['user_id']}\n"
-                        f"*Игра*: {order['game_name']}\n"
-                        f"*Дата*: {order['order_date']}"
-                    ),
-                    reply_markup=kb.get_order_actions_keyboard(order['order_id']),
-                    parse_mode='HTML'
-                )
-        else:
-            await message.answer(
-                html.escape(msg),
-                reply_markup=kb.get_main_menu(),
-                parse_mode='HTML'
-            )
+        await _send_order_queue(message, message.from_user.id)
     except Exception as e:
         logger.error(f"Ошибка в обработчике /orders: {e}", exc_info=True)
         await message.answer("Произошла ошибка при получении заказов.")
@@ -967,26 +1237,18 @@ async def analytics(message: Message):
 
 
 @rt.message(Command("start"))
-async def cmd_start(message: Message):
+async def cmd_start(message: Message, bot: Bot, command: CommandObject):
     user_id = message.from_user.id
     username = message.from_user.username or ""
     first_name = message.from_user.first_name or "Без имени"
 
-    async with aiosqlite.connect('tg_bot.db') as db:
-        # Проверяем/добавляем пользователя
-        cursor = await db.execute("SELECT 1 FROM users WHERE tg_id = ?", (user_id,))
-        if not await cursor.fetchone():
-            await db.execute("""
-                INSERT INTO users 
-                (tg_id, username, first_name, balance, referrals, registration_date) 
-                VALUES (?, ?, ?, 0, 0, datetime('now'))
-            """, (user_id, username, first_name))
-            await db.commit()
-        else:
-            await db.execute("""
-                UPDATE users SET username = ?, first_name = ? WHERE tg_id = ?
-            """, (username, first_name, user_id))
-            await db.commit()
+    # Добавляем пользователя или обновляем его имя — одной командой
+    await writer.execute("""
+        INSERT INTO users
+        (tg_id, username, first_name, balance, referrals, registration_date)
+        VALUES (?, ?, ?, 0, 0, datetime('now'))
+        ON CONFLICT(tg_id) DO UPDATE SET username = excluded.username, first_name = excluded.first_name
+    """, (user_id, username, first_name))
 
     # === Основное приветствие ===
     text = "Привет! Добро пожаловать в лучший магазин ключей!\n\nКаталог внизу ↓"
@@ -1003,14 +1265,22 @@ async def cmd_start(message: Message):
             reply_markup=kb.get_main_menu()
         )
 
+    # Deep link из inline-карточки: t.me/<бот>?start=buy_<ID>
+    if command.args and command.args.startswith("buy_"):
+        try:
+            game_id = int(command.args.removeprefix("buy_"))
+        except ValueError:
+            return
+        await _place_order(message, bot, game_id)
+
 @rt.message(F.text == 'Каталог')
 async def catalog(message: Message):
     """Обработчик кнопки 'Каталог'."""
     logger.info(f"Нажата кнопка 'Каталог' от пользователя {message.from_user.id}")
     try:
         await message.answer(
-            html.escape("Выберите способ отображения каталога:"),
-            reply_markup=kb.get_catalog_choice_keyboard(),
+            html.escape("Выберите раздел каталога:"),
+            reply_markup=kb.get_catalog_menu(),
             parse_mode='HTML'
         )
     except Exception as e:
@@ -1018,51 +1288,151 @@ async def catalog(message: Message):
         await message.answer("Произошла ошибка при загрузке каталога.")
 
 
+@rt.callback_query(F.data == "catalog_steam_games")
+async def catalog_steam_games_callback(callback: CallbackQuery):
+    """Раздел Steam игр: весь список или фильтры."""
+    try:
+        await callback.message.edit_text(
+            html.escape("Выберите способ отображения каталога:"),
+            reply_markup=kb.get_catalog_choice_keyboard(),
+            parse_mode='HTML'
+        )
+        await callback.answer()
+    except TelegramBadRequest as e:
+        if "not modified" not in str(e):
+            logger.error(f"Ошибка в обработчике catalog_steam_games: {e}", exc_info=True)
+        await callback.answer()
+    except Exception as e:
+        logger.error(f"Ошибка в обработчике catalog_steam_games: {e}", exc_info=True)
+        await callback.answer("Произошла ошибка при загрузке каталога.", show_alert=True)
+
+
+# Разделы каталога, которые сразу открываются списком: callback -> product_type
+CATALOG_KEY_SECTIONS = {
+    "catalog_windows_keys": "windows",
+    "catalog_office_keys": "office",
+}
+
+
+@rt.callback_query(F.data.in_(CATALOG_KEY_SECTIONS))
+async def catalog_keys_section_callback(callback: CallbackQuery):
+    """Разделы ключей Windows/Office: первая страница того же листинга, что и у игр."""
+    try:
+        product_type = CATALOG_KEY_SECTIONS[callback.data]
+        success, msg, page = await db_user.get_catalog_page(product_type=product_type)
+        if not success:
+            await callback.answer("В этом разделе пока нет товаров.", show_alert=True)
+            return
+        await callback.message.edit_text(
+            _catalog_page_text(msg, page),
+            reply_markup=kb.get_catalog_page_keyboard(page),
+            parse_mode='HTML'
+        )
+        await callback.answer()
+    except Exception as e:
+        logger.error(f"Ошибка в обработчике {callback.data}: {e}", exc_info=True)
+        await callback.answer("Произошла ошибка при загрузке каталога.", show_alert=True)
+
+
+def _catalog_page_text(msg: str, page: dict) -> str:
+    lines = [msg]
+    for card in page['items']:
+        if card.sale_text:
+            lines.append(f"🔥 {card.game_name}: {card.sale_text}")
+    lines.append("Нажмите на игру, чтобы открыть карточку.")
+    return html.escape("\n".join(lines))
+
+
+# Telegram принимает в альбом от 2 до 10 элементов
+MEDIA_GROUP_LIMIT = 10
+
+
+async def _remember_photo(game_id: int, url: str, sent: Message):
+    if sent.photo:
+        await media_cache.remember(game_id, url, sent.photo[-1].file_id, sent.photo[-1].file_unique_id)
+
+
+async def _send_photo(message: Message, game_id: int, url: str, **kwargs) -> Message:
+    """answer_photo по сохранённому file_id, а если его нет или он протух — по ссылке."""
+    file_id = await media_cache.get_file_id(game_id, url)
+    if file_id:
+        try:
+            return await message.answer_photo(photo=file_id, **kwargs)
+        except TelegramBadRequest as e:
+            logger.warning(f"file_id картинки {url} игры {game_id} не принят, шлём по ссылке: {e}")
+            await media_cache.forget(game_id, url)
+    sent = await message.answer_photo(photo=url, **kwargs)
+    await _remember_photo(game_id, url, sent)
+    return sent
+
+
+async def _send_game_card(message: Message, card: cards.Card):
+    """
+    Отправляет карточку игры. Несколько картинок уходят одним альбомом
+    (send_media_group, подпись на первой), кнопка 'Купить' — следующим сообщением,
+    потому что к альбому клавиатуру не прикрепить.
+    """
+    game_id = card.id
+    image_urls = card.image_urls
+    caption = card.caption
+    markup = card.markup
+
+    if len(image_urls) == 1:
+        try:
+            await _send_photo(message, game_id, image_urls[0], caption=caption, reply_markup=markup, parse_mode='HTML')
+            return
+        except TelegramBadRequest as e:
+            logger.error(f"Ошибка отправки изображения {image_urls[0]}: {e}")
+    elif image_urls:
+        sent_any = False
+        for start in range(0, len(image_urls), MEDIA_GROUP_LIMIT):
+            chunk = image_urls[start:start + MEDIA_GROUP_LIMIT]
+            with_caption = not sent_any
+            if len(chunk) > 1:
+                sources = [await media_cache.get_file_id(game_id, url) or url for url in chunk]
+                try:
+                    sent = await message.answer_media_group(media=[
+                        InputMediaPhoto(media=source, caption=caption if with_caption and i == 0 else None,
+                                        parse_mode='HTML')
+                        for i, source in enumerate(sources)
+                    ])
+                    for url, source, sent_message in zip(chunk, sources, sent):
+                        if source == url:
+                            await _remember_photo(game_id, url, sent_message)
+                    sent_any = True
+                    continue
+                except TelegramBadRequest as e:
+                    # Альбом отклоняется целиком из-за одной плохой ссылки — шлём по одной
+                    logger.error(f"Альбом игры {game_id} не отправлен, шлём картинки по одной: {e}")
+            for url in chunk:
+                try:
+                    await _send_photo(message, game_id, url, caption=caption if not sent_any else None,
+                                      parse_mode='HTML')
+                    sent_any = True
+                except TelegramBadRequest as e:
+                    logger.error(f"Ошибка отправки изображения {url}: {e}")
+        if sent_any:
+            await message.answer("👆 Купить эту игру:", reply_markup=markup)
+            return
+
+    await message.answer(caption, reply_markup=markup, parse_mode='HTML')
+
+
+async def _send_game_cards(message: Message, game_cards: list[cards.Card]):
+    for card in game_cards:
+        await _send_game_card(message, card)
+
+
 @rt.callback_query(F.data == "show_all_games")
 async def show_all_games_callback(callback: CallbackQuery):
-    """Обработчик выбора 'Весь список' в каталоге."""
+    """Обработчик выбора 'Весь список' в каталоге: первая страница одним сообщением."""
     logger.info(f"Нажата кнопка 'Весь список' от пользователя {callback.from_user.id}")
     try:
-        success, msg, games = await db_user.show_all_games()
-        logger.debug(f"Результат catalog: success={success}, msg={msg}, games_count={len(games)}")
-        if success and games:
-            for game in games:
-                game_id = int(game['text'].split("\n")[0].replace("*ID*: ", ""))
-                image_urls = game['image_urls'].split(',') if game['image_urls'] else []
-                if image_urls:
-                    for image_url in image_urls:
-                        if image_url.strip():
-                            try:
-                                await callback.message.answer_photo(
-                                    photo=image_url.strip(),
-                                    caption=html.escape(game['text']) if image_url == image_urls[0] else None,
-                                    reply_markup=kb.get_game_actions_keyboard(game_id, item_type="game") if image_url ==
-                                                                                                            image_urls[
-                                                                                                                0] else None,
-                                    parse_mode='HTML'
-                                )
-                            except TelegramBadRequest as e:
-                                logger.error(f"Ошибка отправки изображения {image_url}: {e}")
-                                await callback.message.answer(
-                                    html.escape(game['text']),
-                                    reply_markup=kb.get_game_actions_keyboard(game_id, item_type="game"),
-                                    parse_mode='HTML'
-                                )
-                        else:
-                            await callback.message.answer(
-                                html.escape(game['text']),
-                                reply_markup=kb.get_game_actions_keyboard(game_id, item_type="game"),
-                                parse_mode='HTML'
-                            )
-                else:
-                    await callback.message.answer(
-                        html.escape(game['text']),
-                        reply_markup=kb.get_game_actions_keyboard(game_id, item_type="game"),
-                        parse_mode='HTML'
-                    )
+        success, msg, page = await db_user.get_catalog_page()
+        if success:
             await callback.message.answer(
-                "Каталог игр:",
-                reply_markup=kb.get_main_menu(),
+                _catalog_page_text(msg, page),
+                reply_markup=kb.get_catalog_page_keyboard(page),
                 parse_mode='HTML'
             )
         else:
@@ -1077,6 +1447,55 @@ async def show_all_games_callback(callback: CallbackQuery):
         await callback.answer("Произошла ошибка при загрузке каталога.", show_alert=True)
 
 
+@rt.callback_query(F.data.startswith("catalog_prev_") | F.data.startswith("catalog_next_"))
+async def catalog_page_callback(callback: CallbackQuery):
+    """Листание каталога: редактирует то же сообщение, новых не шлёт."""
+    try:
+        # catalog_next_<вид>_<id>; у старых кнопок вида нет — это игры
+        direction, _, rest = callback.data.removeprefix("catalog_").partition("_")
+        product_type, _, key = rest.rpartition("_")
+        product_type = product_type or 'steam'
+        key = int(key)
+        if direction == "next":
+            success, msg, page = await db_user.get_catalog_page(after_id=key, product_type=product_type)
+        else:
+            success, msg, page = await db_user.get_catalog_page(before_id=key, product_type=product_type)
+
+        if not success:
+            await callback.answer(msg, show_alert=True)
+            return
+        try:
+            await callback.message.edit_text(
+                _catalog_page_text(msg, page),
+                reply_markup=kb.get_catalog_page_keyboard(page),
+                parse_mode='HTML'
+            )
+        except TelegramBadRequest as e:
+            # "message is not modified" — двойное нажатие, страница та же
+            if "not modified" not in str(e):
+                raise
+        await callback.answer()
+    except Exception as e:
+        logger.error(f"Ошибка при листании каталога: {e}", exc_info=True)
+        await callback.answer("Произошла ошибка при загрузке каталога.", show_alert=True)
+
+
+@rt.callback_query(F.data.startswith("game_"))
+async def game_card_callback(callback: CallbackQuery):
+    """Открывает карточку игры со страницы каталога."""
+    try:
+        game_id = int(callback.data.replace("game_", ""))
+        success, msg, card = await db_user.get_game_card(game_id)
+        if not success:
+            await callback.answer(msg, show_alert=True)
+            return
+        await _send_game_card(callback.message, card)
+        await callback.answer()
+    except Exception as e:
+        logger.error(f"Ошибка при открытии карточки {callback.data}: {e}", exc_info=True)
+        await callback.answer("Произошла ошибка при загрузке игры.", show_alert=True)
+
+
 @rt.callback_query(F.data == "show_filters")
 async def show_filters_callback(callback: CallbackQuery):
     """Обработчик выбора 'По фильтру' в каталоге."""
@@ -1104,9 +1523,13 @@ async def filter_by_price_callback(callback: CallbackQuery):
     """Обработчик выбора фильтра по цене."""
     logger.info(f"Нажата кнопка 'Фильтр по цене' от пользователя {callback.from_user.id}")
     try:
+        await catalog_cache.ensure_loaded()
+        buckets = price_index.buckets()
+        if not buckets:
+            return await callback.answer("Сейчас нет игр в наличии.", show_alert=True)
         await callback.message.edit_text(
-            html.escape("Выберите ценовой диапазон:"),
-            reply_markup=kb.get_price_filter_keyboard(),
+            html.escape("Выберите ценовой диапазон (в скобках — сколько игр):"),
+            reply_markup=kb.get_price_filter_keyboard(buckets),
             parse_mode='HTML'
         )
         await callback.answer()
@@ -1126,9 +1549,12 @@ async def filter_by_genre_callback(callback: CallbackQuery):
     """Обработчик выбора фильтра по жанру."""
     logger.info(f"Нажата кнопка 'Фильтр по жанру' от пользователя {callback.from_user.id}")
     try:
+        facets = await db_user.get_genre_facets()
+        if not facets:
+            return await callback.answer("Сейчас нет игр в наличии.", show_alert=True)
         await callback.message.edit_text(
             html.escape("Выберите жанр:"),
-            reply_markup=kb.get_genre_filter_keyboard(),
+            reply_markup=kb.get_genre_filter_keyboard(facets),
             parse_mode='HTML'
         )
         await callback.answer()
@@ -1145,64 +1571,36 @@ async def filter_by_genre_callback(callback: CallbackQuery):
 
 @rt.callback_query(F.data.startswith("filter_price_"))
 async def filter_price_callback(callback: CallbackQuery):
-    """Обработчик фильтров по цене."""
+    """
+    Ценовая корзина: страницы фильтра по цене (как у конструктора, flt:) в том же
+    сообщении. "Без фильтра" — обычный постраничный каталог.
+    """
     logger.info(f"Нажата кнопка фильтра {callback.data} от пользователя {callback.from_user.id}")
     try:
-        price_limit = callback.data.replace("filter_price_", "")
-        if price_limit == "none":
-            success, msg, games = await db_user.show_all_games()
-        else:
-            price_limit = int(price_limit)
-            success, msg, games = await db_user.filter_games_by_price(price_limit)
+        price_range = callback.data.replace("filter_price_", "")
+        if price_range == "none":
+            success, msg, page = await db_user.get_catalog_page()
+            if not success:
+                return await callback.answer(msg, show_alert=True)
+            try:
+                await callback.message.edit_text(
+                    _catalog_page_text(msg, page),
+                    reply_markup=kb.get_catalog_page_keyboard(page),
+                    parse_mode='HTML'
+                )
+            except TelegramBadRequest as e:
+                if "not modified" not in str(e):
+                    raise
+            await callback.answer()
+            return
 
-        logger.debug(f"Результат фильтра: success={success}, msg={msg}, games_count={len(games)}")
-        if success and games:
-            for game in games:
-                game_id = int(game['text'].split("\n")[0].replace("*ID*: ", ""))
-                image_urls = game['image_urls'].split(',') if game['image_urls'] else []
-                if image_urls:
-                    for image_url in image_urls:
-                        if image_url.strip():
-                            try:
-                                await callback.message.answer_photo(
-                                    photo=image_url.strip(),
-                                    caption=html.escape(game['text']) if image_url == image_urls[0] else None,
-                                    reply_markup=kb.get_game_actions_keyboard(game_id, item_type="game") if image_url ==
-                                                                                                            image_urls[
-                                                                                                                0] else None,
-                                    parse_mode='HTML'
-                                )
-                            except TelegramBadRequest as e:
-                                logger.error(f"Ошибка отправки изображения {image_url}: {e}")
-                                await callback.message.answer(
-                                    html.escape(game['text']),
-                                    reply_markup=kb.get_game_actions_keyboard(game_id, item_type="game"),
-                                    parse_mode='HTML'
-                                )
-                        else:
-                            await callback.message.answer(
-                                html.escape(game['text']),
-                                reply_markup=kb.get_game_actions_keyboard(game_id, item_type="game"),
-                                parse_mode='HTML'
-                            )
-                else:
-                    await callback.message.answer(
-                        html.escape(game['text']),
-                        reply_markup=kb.get_game_actions_keyboard(game_id, item_type="game"),
-                        parse_mode='HTML'
-                    )
-            await callback.message.answer(
-                f"Игры с ценой до ${price_limit if price_limit != 'none' else 'без ограничений'}:",
-                reply_markup=kb.get_main_menu(),
-                parse_mode='HTML'
-            )
+        if "_" in price_range:
+            min_price, max_price = map(float, price_range.split("_", 1))
+            spec = catalog_filter.FilterSpec(price_min=min_price, price_max=max_price)
         else:
-            await callback.message.answer(
-                html.escape(f"{msg} Попробуйте изменить фильтр или добавить игры с помощью /add_product"),
-                reply_markup=kb.get_main_menu(),
-                parse_mode='HTML'
-            )
-        await callback.answer()
+            # Кнопки старого вида "filter_price_20" в уже отправленных сообщениях
+            spec = catalog_filter.FilterSpec(price_max=float(price_range))
+        await _show_filter_page(callback, catalog_filter.token_for(spec))
     except Exception as e:
         logger.error(f"Ошибка в обработчике filter_price: {e}", exc_info=True)
         await callback.answer("Произошла ошибка при применении фильтра.", show_alert=True)
@@ -1210,65 +1608,101 @@ async def filter_price_callback(callback: CallbackQuery):
 
 @rt.callback_query(F.data.startswith("filter_genre_"))
 async def filter_genre_callback(callback: CallbackQuery):
-    """Обработчик фильтров по жанру."""
+    """Жанр: страницы фильтра по этому жанру (flt:) в том же сообщении."""
     logger.info(f"Нажата кнопка фильтра {callback.data} от пользователя {callback.from_user.id}")
     try:
-        genre = callback.data.replace("filter_genre_", "")
-        success, msg, games = await db_user.filter_games_by_genre(genre)
-
-        logger.debug(f"Результат фильтра: success={success}, msg={msg}, games_count={len(games)}")
-        if success and games:
-            for game in games:
-                game_id = int(game['text'].split("\n")[0].replace("*ID*: ", ""))
-                image_urls = game['image_urls'].split(',') if game['image_urls'] else []
-                if image_urls:
-                    for image_url in image_urls:
-                        if image_url.strip():
-                            try:
-                                await callback.message.answer_photo(
-                                    photo=image_url.strip(),
-                                    caption=html.escape(game['text']) if image_url == image_urls[0] else None,
-                                    reply_markup=kb.get_game_actions_keyboard(game_id, item_type="game") if image_url ==
-                                                                                                            image_urls[
-                                                                                                                0] else None,
-                                    parse_mode='HTML'
-                                )
-                            except TelegramBadRequest as e:
-                                logger.error(f"Ошибка отправки изображения {image_url}: {e}")
-                                await callback.message.answer(
-                                    html.escape(game['text']),
-                                    reply_markup=kb.get_game_actions_keyboard(game_id, item_type="game"),
-                                    parse_mode='HTML'
-                                )
-                        else:
-                            await callback.message.answer(
-                                html.escape(game['text']),
-                                reply_markup=kb.get_game_actions_keyboard(game_id, item_type="game"),
-                                parse_mode='HTML'
-                            )
-                else:
-                    await callback.message.answer(
-                        html.escape(game['text']),
-                        reply_markup=kb.get_game_actions_keyboard(game_id, item_type="game"),
-                        parse_mode='HTML'
-                    )
-            await callback.message.answer(
-                f"Игры жанра '{genre}':",
-                reply_markup=kb.get_main_menu(),
-                parse_mode='HTML'
-            )
-        else:
-            await callback.message.answer(
-                html.escape(f"{msg} Попробуйте изменить фильтр или добавить игры с помощью /add_product"),
-                reply_markup=kb.get_main_menu(),
-                parse_mode='HTML'
-            )
-        await callback.answer()
+        genre_id = callback.data.replace("filter_genre_", "")
+        if not genre_id.isdigit():
+            return await callback.answer("Этот фильтр устарел, откройте список жанров заново.", show_alert=True)
+        spec = catalog_filter.FilterSpec(genre_ids=frozenset({int(genre_id)}))
+        await _show_filter_page(callback, catalog_filter.token_for(spec))
     except Exception as e:
         logger.error(f"Ошибка в обработчике filter_genre: {e}", exc_info=True)
         await callback.answer("Произошла ошибка при применении фильтра.", show_alert=True)
 
 
+async def _edit_filter_builder(callback: CallbackQuery, spec):
+    """Показывает конструктор фильтра в том же сообщении."""
+    token = catalog_filter.token_for(spec)
+    facets = await db_user.get_genre_facets()
+    genre_names = {facet.id: facet.name for facet in facets}
+    text = (f"Фильтр: {catalog_filter.describe(spec, genre_names)}\n"
+            "Настройте условия и нажмите «Показать».")
+    try:
+        await callback.message.edit_text(
+            html.escape(text),
+            reply_markup=kb.get_filter_builder_keyboard(token, spec, facets),
+            parse_mode='HTML'
+        )
+    except TelegramBadRequest as e:
+        if "not modified" not in str(e):
+            raise
+
+
+@rt.callback_query(F.data == "flt_new")
+async def filter_new_callback(callback: CallbackQuery):
+    """Новый комбинированный фильтр (цена + жанры + регион + скидка)."""
+    try:
+        await _edit_filter_builder(callback, catalog_filter.FilterSpec())
+        await callback.answer()
+    except Exception as e:
+        logger.error(f"Ошибка в обработчике flt_new: {e}", exc_info=True)
+        await callback.answer("Произошла ошибка.", show_alert=True)
+
+
+@rt.callback_query(F.data.startswith("flt_e:"))
+async def filter_edit_callback(callback: CallbackQuery):
+    """Кнопка конструктора фильтра: flt_e:<токен>:<действие>."""
+    try:
+        _, token, action = callback.data.split(":", 2)
+        spec = catalog_filter.get_spec(token)
+        if spec is None:
+            return await callback.answer("Фильтр устарел, настройте его заново.", show_alert=True)
+        if action:
+            spec = await catalog_filter.apply_action(spec, action)
+        await _edit_filter_builder(callback, spec)
+        await callback.answer()
+    except Exception as e:
+        logger.error(f"Ошибка в обработчике {callback.data}: {e}", exc_info=True)
+        await callback.answer("Произошла ошибка.", show_alert=True)
+
+
+async def _show_filter_page(callback: CallbackQuery, token: str, after=None, before=None):
+    """Страница каталога по фильтру с токеном token — в том же сообщении, новых не шлёт."""
+    success, msg, page = await db_user.filter_catalog(token, after=after, before=before)
+    if not success and 'token' not in page:
+        await callback.answer(msg, show_alert=True)
+        return
+    text = _catalog_page_text(msg, page) if success else html.escape(msg)
+    try:
+        await callback.message.edit_text(
+            text,
+            reply_markup=kb.get_filter_page_keyboard(page),
+            parse_mode='HTML'
+        )
+    except TelegramBadRequest as e:
+        if "not modified" not in str(e):
+            raise
+    await callback.answer()
+
+
+@rt.callback_query(F.data.startswith("flt:"))
+async def filter_page_callback(callback: CallbackQuery):
+    """
+    Страница по фильтру: flt:<токен>:n (первая), n<курсор> (после), p<курсор> (перед);
+    курсор — ключ сортировки крайней игры (catalog_filter.encode_cursor).
+    """
+    try:
+        _, token, cursor = callback.data.split(":", 2)
+        if cursor.startswith("p") and cursor[1:]:
+            await _show_filter_page(callback, token, before=cursor[1:])
+        else:
+            await _show_filter_page(callback, token, after=cursor[1:] or None)
+    except Exception as e:
+        logger.error(f"Ошибка при листании фильтра {callback.data}: {e}", exc_info=True)
+        await callback.answer("Произошла ошибка при загрузке каталога.", show_alert=True)
+
+
 @rt.message(F.text == 'Поиск')
 async def search_button(message: Message):
     """Обработчик кнопки 'Поиск'."""
@@ -1280,71 +1714,127 @@ async def search_button(message: Message):
 
 
 @rt.message(Command('search'))
-async def search(message: Message):
-    """Обработчик команды /search."""
+async def search(message: Message, command: CommandObject):
+    """Обработчик команды /search [запрос]."""
     logger.info(f"Команда /search от пользователя {message.from_user.id}")
+    if command.args and command.args.strip():
+        await _reply_search_results(message, command.args.strip())
+        return
     await message.answer(
         "Введите название игры для поиска:",
         reply_markup=kb.get_main_menu()
     )
 
 
-# ---------- SUPPORT: БЛОК ПОДДЕРЖКИ ----------
+# ---------- INLINE-РЕЖИМ: @бот запрос ----------
+
+# Telegram сам кэширует ответ на одинаковый запрос столько секунд
+INLINE_CACHE_TIME = 60
+
+
+def _inline_result(card: cards.Card, file_id: str | None, bot_username: str, with_photo: bool = True):
+    markup = kb.get_inline_card_keyboard(card.id, bot_username)
+    # Вторая и дальше строки карточки (цена, акция, жанр) — в описание результата
+    description = ", ".join(line.replace("*", "") for line in card.text.split("\n")[2:])
+
+    if with_photo and file_id:
+        return InlineQueryResultCachedPhoto(
+            id=str(card.id), photo_file_id=file_id, title=card.game_name, description=description,
+            caption=card.caption, parse_mode='HTML', reply_markup=markup
+        )
+    if with_photo and card.image_urls:
+        return InlineQueryResultPhoto(
+            id=str(card.id), photo_url=card.image_urls[0], thumbnail_url=card.image_urls[0],
+            title=card.game_name, description=description,
+            caption=card.caption, parse_mode='HTML', reply_markup=markup
+        )
+    return InlineQueryResultArticle(
+        id=str(card.id), title=card.game_name, description=description,
+        thumbnail_url=card.image_urls[0] if card.image_urls else None,
+        input_message_content=InputTextMessageContent(message_text=card.caption, parse_mode='HTML'),
+        reply_markup=markup
+    )
 
-# Инициализация таблицы tickets (вызывается при старте в main.py -> init_support_db())
-async def init_support_db():
-    try:
-        async with aiosqlite.connect('tg_bot.db') as db:
-            await db.execute("""
-                CREATE TABLE IF NOT EXISTS tickets (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    user_id INTEGER NOT NULL,
-                    admin_id INTEGER,
-                    status TEXT NOT NULL,
-                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-                );
-            """)
-            await db.commit()
-        logger.info("init_support_db: таблица tickets готова")
+
+@rt.inline_query()
+async def inline_catalog_search(inline_query: InlineQuery, bot: Bot):
+    """Поиск по каталогу в inline-режиме: один ответ со страницей карточек."""
+    try:
+        offset = int(inline_query.offset) if inline_query.offset else 0
+    except ValueError:
+        offset = 0
+    try:
+        game_cards, next_offset = await db_user.inline_search(inline_query.query, offset)
+        bot_username = (await bot.me()).username
+
+        entries = []
+        for card in game_cards:
+            file_id = await media_cache.get_file_id(card.id, card.image_urls[0]) if card.image_urls else None
+            entries.append((card, file_id))
+
+        answer = dict(
+            cache_time=INLINE_CACHE_TIME,
+            is_personal=False,
+            next_offset=str(next_offset) if next_offset is not None else "",
+        )
+        try:
+            await inline_query.answer(
+                [_inline_result(card, file_id, bot_username) for card, file_id in entries], **answer
+            )
+        except TelegramBadRequest as e:
+            # Одна битая ссылка на картинку валит весь ответ — отвечаем без фото
+            logger.error(f"Inline-ответ с фото отклонён, отправляем текстом: {e}")
+            await inline_query.answer(
+                [_inline_result(card, None, bot_username, with_photo=False) for card, _ in entries], **answer
+            )
     except Exception as e:
-        logger.exception(f"init_support_db error: {e}")
+        logger.error(f"Ошибка в inline-поиске '{inline_query.query}': {e}", exc_info=True)
+
 
+# ---------- SUPPORT: БЛОК ПОДДЕРЖКИ ----------
 
 # Утилиты для работы с тикетами
+ACTIVE_TICKET_BY_USER_SQL = (
+    "SELECT id, admin_id FROM tickets "
+    "WHERE user_id = ? AND status = 'accepted' "
+    "ORDER BY id DESC LIMIT 1"
+)
+ACTIVE_TICKET_BY_ADMIN_SQL = (
+    "SELECT id, user_id FROM tickets "
+    "WHERE admin_id = ? AND status = 'accepted' "
+    "ORDER BY id DESC LIMIT 1"
+)
+OPEN_TICKET_BY_USER_SQL = (
+    "SELECT id, status FROM tickets "
+    "WHERE user_id = ? AND status IN ('open', 'accepted') "
+    "ORDER BY id DESC LIMIT 1"
+)
+
+
 async def create_ticket(user_id: int) -> int:
-    async with aiosqlite.connect('tg_bot.db') as db:
-        db.row_factory = aiosqlite.Row
-        cur = await db.execute(
-            "INSERT INTO tickets (user_id, status) VALUES (?, ?)",
-            (user_id, "open")
-        )
-        await db.commit()
-        return cur.lastrowid
+    result = await writer.execute(
+        "INSERT INTO tickets (user_id, status) VALUES (?, ?)",
+        (user_id, "open")
+    )
+    return result.lastrowid
 
 
 async def set_ticket_admin(ticket_id: int, admin_id: int):
-    async with aiosqlite.connect('tg_bot.db') as db:
-        db.row_factory = aiosqlite.Row
-        await db.execute(
-            "UPDATE tickets SET admin_id = ?, status = 'accepted' WHERE id = ?",
-            (admin_id, ticket_id)
-        )
-        await db.commit()
+    await writer.execute(
+        "UPDATE tickets SET admin_id = ?, status = 'accepted' WHERE id = ?",
+        (admin_id, ticket_id)
+    )
 
 
 async def close_ticket(ticket_id: int):
-    async with aiosqlite.connect('tg_bot.db') as db:
-        db.row_factory = aiosqlite.Row
-        await db.execute(
-            "UPDATE tickets SET status = 'closed' WHERE id = ?",
-            (ticket_id,)
-        )
-        await db.commit()
+    await writer.execute(
+        "UPDATE tickets SET status = 'closed' WHERE id = ?",
+        (ticket_id,)
+    )
 
 
 async def get_ticket(ticket_id: int):
-    async with aiosqlite.connect('tg_bot.db') as db:
-        db.row_factory = aiosqlite.Row
+    async with pool.connection() as db:
         cur = await db.execute(
             "SELECT * FROM tickets WHERE id = ?",
             (ticket_id,)
@@ -1353,43 +1843,22 @@ async def get_ticket(ticket_id: int):
 
 
 async def find_active_ticket_by_user(user_id: int):
-    async with aiosqlite.connect('tg_bot.db') as db:
-        db.row_factory = aiosqlite.Row
-        cur = await db.execute(
-            "SELECT id, admin_id FROM tickets "
-            "WHERE user_id = ? AND status = 'accepted' "
-            "ORDER BY id DESC LIMIT 1",
-            (user_id,)
-        )
+    async with pool.connection() as db:
+        cur = await db.execute(ACTIVE_TICKET_BY_USER_SQL, (user_id,))
         row = await cur.fetchone()
         return (row['id'], row['admin_id']) if row else None
 
 
-
-
-
 async def find_active_ticket_by_admin(admin_id: int):
-    async with aiosqlite.connect('tg_bot.db') as db:
-        db.row_factory = aiosqlite.Row
-        cur = await db.execute(
-            "SELECT id, user_id FROM tickets "
-            "WHERE admin_id = ? AND status = 'accepted' "
-            "ORDER BY id DESC LIMIT 1",
-            (admin_id,)
-        )
+    async with pool.connection() as db:
+        cur = await db.execute(ACTIVE_TICKET_BY_ADMIN_SQL, (admin_id,))
         row = await cur.fetchone()
         return (row['id'], row['user_id']) if row else None
 
 
 async def find_open_ticket_by_user(user_id: int):
-    async with aiosqlite.connect('tg_bot.db') as db:
-        db.row_factory = aiosqlite.Row
-        cur = await db.execute(
-            "SELECT id, status FROM tickets "
-            "WHERE user_id = ? AND status IN ('open', 'accepted') "
-            "ORDER BY id DESC LIMIT 1",
-            (user_id,)
-        )
+    async with pool.connection() as db:
+        cur = await db.execute(OPEN_TICKET_BY_USER_SQL, (user_id,))
         return await cur.fetchone()
 
 # ---------- ХЕНДЛЕРЫ ПОДДЕРЖКИ ----------
@@ -1767,49 +2236,20 @@ async def search_query(message: Message):
     if query in ['Каталог', 'Поиск', 'Поддержка']:
         logger.info(f"Сообщение '{query}' является командой меню, игнорируем")
         return
+    await _reply_search_results(message, query)
+
+
+async def _reply_search_results(message: Message, query: str):
     try:
         success, msg, games = await db_user.search_games(query)
         logger.debug(f"Результат search_games: success={success}, msg={msg}, games_count={len(games)}")
         if success and games:
-            for game in games:
-                game_id = int(game['text'].split("\n")[0].replace("*ID*: ", ""))
-                image_urls = game['image_urls'].split(',') if game['image_urls'] else []
-                if image_urls:
-                    for image_url in image_urls:
-                        if image_url.strip():
-                            try:
-                                await message.answer_photo(
-                                    photo=image_url.strip(),
-                                    caption=html.escape(game['text']) if image_url == image_urls[0] else None,
-                                    reply_markup=kb.get_game_actions_keyboard(game_id, item_type="game") if image_url ==
-                                                                                                            image_urls[
-                                                                                                                0] else None,
-                                    parse_mode='HTML'
-                                )
-                            except TelegramBadRequest as e:
-                                logger.error(f"Ошибка отправки изображения {image_url}: {e}")
-                                await message.answer(
-                                    html.escape(game['text']),
-                                    reply_markup=kb.get_game_actions_keyboard(game_id, item_type="game"),
-                                    parse_mode='HTML'
-                                )
-                        else:
-                            await message.answer(
-                                html.escape(game['text']),
-                                reply_markup=kb.get_game_actions_keyboard(game_id, item_type="game"),
-                                parse_mode='HTML'
-                            )
-                else:
-                    await message.answer(
-                        html.escape(game['text']),
-                        reply_markup=kb.get_game_actions_keyboard(game_id, item_type="game"),
-                        parse_mode='HTML'
-                    )
             await message.answer(
-                "Результаты поиска:",
+                html.escape(msg),
                 reply_markup=kb.get_main_menu(),
                 parse_mode='HTML'
             )
+            await _send_game_cards(message, games)
         else:
             await message.answer(
                 html.escape(f"{msg} Попробуйте изменить запрос или добавить игры с помощью /add_product"),
@@ -2036,19 +2476,8 @@ async def cmd_sale(message: Message, command: CommandObject):
         await message.answer("Неверный формат.")
         return
 
-    try:
-        async with aiosqlite.connect('tg_bot.db') as db:
-            await db.execute(
-                """UPDATE steam_keys 
-                   SET sale_active = 1, sale_not = ?, sale_ends_at = ?
-                   WHERE id = ?""",
-                (sale_text, ends_at, game_id)
-            )
-            await db.commit()
-            await message.answer(f"Акция на игру {game_id} включена!\n{sale_text} до {ends_at}")
-    except Exception as e:
-        await message.answer("Ошибка.")
-        logger.error(e)
+    success, msg = await db_user.set_sale(game_id, sale_text, ends_at)
+    await message.answer(msg)
 
 @rt.message(Command("sale_off"))
 async def cmd_sale_off(message: Message, command: CommandObject):
@@ -2059,13 +2488,8 @@ async def cmd_sale_off(message: Message, command: CommandObject):
 
     try:
         game_id = int(command.args.strip())
-        async with aiosqlite.connect('tg_bot.db') as db:
-            await db.execute(
-                "UPDATE steam_keys SET sale_active = 0, sale_not = NULL, sale_ends_at = NULL WHERE id = ?",
-                (game_id,)
-            )
-            await db.commit()
-            await message.answer(f"Акция на игру {game_id} отключена.")
+        success, msg = await db_user.clear_sale(game_id)
+        await message.answer(msg)
     except:
         await message.answer("Использование: /sale_off <ID>")
 @rt.callback_query(F.data == "admin_sales")
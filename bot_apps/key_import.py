@@ -0,0 +1,159 @@
+# bot_apps/key_import.py
+"""
+Загрузка ключей поставщика одним файлом (TXT/CSV) — документ с подписью /import_keys.
+
+    /import_keys <ID>  — каждая строка файла: ключи этого товара (как в /add_keys);
+                         строки вида "число;ключ" отклоняются — это CSV для
+                         режима без ID, а не два ключа
+    /import_keys       — CSV "ID товара;ключ" (разделитель ; , или табуляция),
+                         строка заголовка пропускается
+
+Файл читается и разбирается кусками по READ_CHUNK строк в отдельном потоке
+(asyncio.to_thread), в память целиком не попадает. Ключи уходят пачками
+по IMPORT_BATCH через writer.executemany — одна операция писателя на пачку.
+Повторы внутри файла отбрасываются на лету, уже загруженные ключи (у этого
+или любого другого товара) — при вставке: INSERT OR IGNORE и триггер v013.
+Кэш каталога обновляется в конце.
+"""
+import asyncio
+import csv
+import itertools
+import re
+from dataclasses import dataclass, field
+
+from bot_apps import catalog_cache, writer
+from bot_apps.db_user import INSERT_KEY_SQL, split_keys
+
+# Больше 20 МБ Bot API боту не отдаёт
+MAX_FILE_SIZE = 20 * 1024 * 1024
+IMPORT_BATCH = 1000
+# Столько строк разбора за один заход в поток чтения
+READ_CHUNK = 5000
+# Сколько ошибочных строк показать в отчёте
+MAX_ERRORS_SHOWN = 10
+
+KEY_RE = re.compile(r'[^\s,;"]{1,128}')
+DELIMITERS = (';', '\t', ',')
+# Строка CSV "ID товара;ключ" — в режиме одного товара её нельзя принять за два ключа
+CSV_ROW_RE = re.compile(r'\s*\d{1,9}\s*[;\t,]\s*\S')
+
+
+@dataclass(slots=True)
+class ImportStats:
+    total: int = 0          # ключей прочитано из файла (строки без ключа не в счёт)
+    added: int = 0
+    duplicates: int = 0     # повторы в файле и уже загруженные ключи
+    invalid: int = 0
+    errors: list[str] = field(default_factory=list)
+    products: set[int] = field(default_factory=set)
+
+    def error(self, line_no: int, reason: str):
+        self.invalid += 1
+        if len(self.errors) < MAX_ERRORS_SHOWN:
+            self.errors.append(f"строка {line_no}: {reason}")
+
+
+def _parse(lines, product_id: int | None):
+    """(номер строки, id товара, ключ, ошибка) по строкам файла; ошибка — None или причина."""
+    if product_id is not None:
+        for line_no, line in enumerate(lines, 1):
+            if CSV_ROW_RE.match(line):
+                yield line_no, None, None, "похоже на CSV 'ID товара;ключ' — отправьте файл с подписью /import_keys без ID"
+                continue
+            for key in split_keys(line):
+                yield line_no, product_id, key, None
+        return
+
+    lines = iter(lines)
+    head = list(itertools.islice(lines, 1))
+    if not head:
+        return
+    delimiter = next((d for d in DELIMITERS if d in head[0]), ',')
+    reader = csv.reader(itertools.chain(head, lines), delimiter=delimiter)
+    for fields in reader:
+        fields = [value.strip() for value in fields]
+        if not any(fields):
+            continue
+        if len(fields) < 2:
+            yield reader.line_num, None, None, "нужны два столбца: ID товара и ключ"
+        elif not fields[0].isdigit():
+            if reader.line_num > 1:
+                yield reader.line_num, None, None, f"ID товара не число: {fields[0][:20]}"
+        else:
+            yield reader.line_num, int(fields[0]), fields[1], None
+
+
+async def _parse_chunks(lines, product_id: int | None):
+    """_parse кусками по READ_CHUNK: чтение файла и разбор идут в потоке."""
+    parsed = _parse(lines, product_id)
+    while rows := await asyncio.to_thread(list, itertools.islice(parsed, READ_CHUNK)):
+        for row in rows:
+            yield row
+
+
+async def _flush(batch: list[tuple[int, str]], stats: ImportStats):
+    result = await writer.executemany(INSERT_KEY_SQL, batch)
+    stats.added += result.rowcount
+    stats.duplicates += len(batch) - result.rowcount
+
+
+async def import_lines(lines, product_id: int | None = None, progress=None) -> ImportStats:
+    """
+    Загружает ключи из строк файла (итератор по открытому файлу читается в
+    потоке, не в цикле событий). progress — async progress(stats),
+    вызывается после каждой записанной пачки.
+    """
+    stats = ImportStats()
+    known: dict[int, bool] = {}
+    seen: set[str] = set()
+    batch: list[tuple[int, str]] = []
+
+    async for line_no, pid, key, error in _parse_chunks(lines, product_id):
+        if error is not None:
+            stats.error(line_no, error)
+            continue
+        stats.total += 1
+        if not KEY_RE.fullmatch(key):
+            stats.error(line_no, "пустой или некорректный ключ")
+            continue
+        if pid not in known:
+            known[pid] = await catalog_cache.get(pid) is not None
+        if not known[pid]:
+            stats.error(line_no, f"товар с ID {pid} не найден")
+            continue
+        if key in seen:
+            stats.duplicates += 1
+            continue
+        seen.add(key)
+        stats.products.add(pid)
+        batch.append((pid, key))
+        if len(batch) >= IMPORT_BATCH:
+            await _flush(batch, stats)
+            batch = []
+            if progress is not None:
+                await progress(stats)
+
+    if batch:
+        await _flush(batch, stats)
+    for pid in stats.products:
+        await catalog_cache.refresh(pid)
+    return stats
+
+
+def describe_progress(stats: ImportStats) -> str:
+    return f"Импорт ключей… прочитано {stats.total}, добавлено {stats.added}"
+
+
+def describe(stats: ImportStats) -> str:
+    """Итоговый отчёт для админа."""
+    text = (
+        f"Импорт завершён: прочитано ключей {stats.total}, товаров {len(stats.products)}.\n"
+        f"Добавлено: {stats.added}\n"
+        f"Повторы (в файле и уже в базе): {stats.duplicates}\n"
+        f"С ошибками: {stats.invalid}"
+    )
+    if stats.errors:
+        text += "\n" + "\n".join(stats.errors)
+        if stats.invalid > len(stats.errors):
+            text += f"\n… и ещё {stats.invalid - len(stats.errors)}"
+    return text
@@ -1,6 +1,8 @@
 # bot_apps/keyboards.py
 from aiogram.types import ReplyKeyboardMarkup, KeyboardButton, InlineKeyboardMarkup, InlineKeyboardButton
 
+from bot_apps import catalog_filter
+
 
 def get_main_menu() -> ReplyKeyboardMarkup:
     keyboard = [
@@ -35,33 +37,98 @@ def get_catalog_choice_keyboard() -> InlineKeyboardMarkup:
     return InlineKeyboardMarkup(inline_keyboard=keyboard)
 
 
+def get_catalog_page_keyboard(page: dict) -> InlineKeyboardMarkup:
+    """Кнопки игр страницы каталога + навигация ← / →"""
+    keyboard = [
+        [InlineKeyboardButton(text=f"{card.game_name} — ${card.final_price:.2f}",
+                              callback_data=f"game_{card.id}")]
+        for card in page['items']
+    ]
+    product_type = page.get('product_type', 'steam')
+    nav = []
+    if page['has_prev']:
+        nav.append(InlineKeyboardButton(text="← Назад",
+                                        callback_data=f"catalog_prev_{product_type}_{page['first_id']}"))
+    if page['has_next']:
+        nav.append(InlineKeyboardButton(text="Вперёд →",
+                                        callback_data=f"catalog_next_{product_type}_{page['last_id']}"))
+    if nav:
+        keyboard.append(nav)
+    return InlineKeyboardMarkup(inline_keyboard=keyboard)
+
+
 def get_filter_type_keyboard() -> InlineKeyboardMarkup:
     keyboard = [
         [InlineKeyboardButton(text="По цене", callback_data="filter_by_price")],
-        [InlineKeyboardButton(text="По жанру", callback_data="filter_by_genre")]
+        [InlineKeyboardButton(text="По жанру", callback_data="filter_by_genre")],
+        [InlineKeyboardButton(text="Несколько условий", callback_data="flt_new")]
     ]
     return InlineKeyboardMarkup(inline_keyboard=keyboard)
 
 
-def get_price_filter_keyboard() -> InlineKeyboardMarkup:
-    keyboard = [
-        [InlineKeyboardButton(text="Цена до 10$", callback_data="filter_price_10"),
-         InlineKeyboardButton(text="Цена до 20$", callback_data="filter_price_20")],
-        [InlineKeyboardButton(text="Цена до 50$", callback_data="filter_price_50"),
-         InlineKeyboardButton(text="Без фильтра", callback_data="filter_price_none")]
+def get_filter_builder_keyboard(token: str, spec, facets) -> InlineKeyboardMarkup:
+    """Конструктор фильтра: каждая кнопка меняет одно условие (flt_e:<токен>:<действие>)"""
+    def edit(text, action):
+        return InlineKeyboardButton(text=text, callback_data=f"flt_e:{token}:{action}")
+
+    genres = [
+        edit(f"{'✅ ' if facet.id in spec.genre_ids else ''}{facet.name} ({facet.count})", f"g{facet.id}")
+        for facet in facets
+    ]
+    keyboard = [[edit(f"Цена: {catalog_filter.describe_price(spec)}", "p")]]
+    keyboard += [genres[i:i + 2] for i in range(0, len(genres), 2)]
+    keyboard += [
+        [edit(f"Регион: {spec.region or 'любой'}", "r"),
+         edit(f"Со скидкой: {'да' if spec.on_sale else 'нет'}", "s")],
+        [edit(f"Сортировка: {catalog_filter.SORTS[spec.sort][1]}", "o")],
+        [InlineKeyboardButton(text="Показать", callback_data=f"flt:{token}:n"),
+         InlineKeyboardButton(text="Сбросить", callback_data="flt_new")],
     ]
     return InlineKeyboardMarkup(inline_keyboard=keyboard)
 
 
-def get_genre_filter_keyboard() -> InlineKeyboardMarkup:
+def get_filter_page_keyboard(page: dict) -> InlineKeyboardMarkup:
+    """Страница отфильтрованного каталога: игры, ← / → по курсору, возврат к фильтру"""
+    token = page['token']
     keyboard = [
-        [InlineKeyboardButton(text="Экшн", callback_data="filter_genre_Экшн"),
-         InlineKeyboardButton(text="Приключение", callback_data="filter_genre_Приключение")],
-        [InlineKeyboardButton(text="Симулятор", callback_data="filter_genre_Симулятор"),
-         InlineKeyboardButton(text="Головоломка", callback_data="filter_genre_Головоломка")],
-        [InlineKeyboardButton(text="Стратегия", callback_data="filter_genre_Стратегия"),
-         InlineKeyboardButton(text="Ролевые игры", callback_data="filter_genre_Ролевые игры")]
+        [InlineKeyboardButton(text=f"{card.game_name} — ${card.final_price:.2f}",
+                              callback_data=f"game_{card.id}")]
+        for card in page.get('items', ())
+    ]
+    nav = []
+    if page.get('has_prev'):
+        nav.append(InlineKeyboardButton(text="← Назад", callback_data=f"flt:{token}:p{page['first_cursor']}"))
+    if page.get('has_next'):
+        nav.append(InlineKeyboardButton(text="Вперёд →", callback_data=f"flt:{token}:n{page['last_cursor']}"))
+    if nav:
+        keyboard.append(nav)
+    keyboard.append([InlineKeyboardButton(text="Изменить фильтр", callback_data=f"flt_e:{token}:")])
+    return InlineKeyboardMarkup(inline_keyboard=keyboard)
+
+
+def get_price_filter_keyboard(buckets) -> InlineKeyboardMarkup:
+    """Ценовые корзины из price_index.buckets(): в каждой примерно поровну игр в наличии"""
+    buttons = []
+    for bucket in buckets:
+        if bucket.min_price == bucket.max_price:
+            text = f"${bucket.min_price:.2f} ({bucket.count})"
+        else:
+            text = f"${bucket.min_price:.2f} – ${bucket.max_price:.2f} ({bucket.count})"
+        buttons.append(InlineKeyboardButton(
+            text=text, callback_data=f"filter_price_{bucket.min_price!r}_{bucket.max_price!r}"
+        ))
+    keyboard = [buttons[i:i + 2] for i in range(0, len(buttons), 2)]
+    keyboard.append([InlineKeyboardButton(text="Без фильтра", callback_data="filter_price_none")])
+    return InlineKeyboardMarkup(inline_keyboard=keyboard)
+
+
+def get_genre_filter_keyboard(facets) -> InlineKeyboardMarkup:
+    """Жанры с играми в наличии (db_user.get_genre_facets), по две кнопки в ряд"""
+    buttons = [
+        InlineKeyboardButton(text=f"{facet.name} ({facet.count})", callback_data=f"filter_genre_{facet.id}")
+        for facet in facets
     ]
+    keyboard = [buttons[i:i + 2] for i in range(0, len(buttons), 2)]
     return InlineKeyboardMarkup(inline_keyboard=keyboard)
 
 
@@ -70,6 +137,12 @@ def get_game_actions_keyboard(game_id: int, item_type: str = "game") -> InlineKe
     return InlineKeyboardMarkup(inline_keyboard=keyboard)
 
 
+def get_inline_card_keyboard(game_id: int, bot_username: str) -> InlineKeyboardMarkup:
+    """Кнопка для карточки из inline-режима: покупка в личке с ботом (deep link /start buy_ID)"""
+    keyboard = [[InlineKeyboardButton(text="Купить в боте", url=f"https://t.me/{bot_username}?start=buy_{game_id}")]]
+    return InlineKeyboardMarkup(inline_keyboard=keyboard)
+
+
 def get_order_actions_keyboard(order_id: int) -> InlineKeyboardMarkup:
     keyboard = [
         [InlineKeyboardButton(text="Подтвердить", callback_data=f"confirm_order_{order_id}")],
@@ -78,6 +151,38 @@ def get_order_actions_keyboard(order_id: int) -> InlineKeyboardMarkup:
     return InlineKeyboardMarkup(inline_keyboard=keyboard)
 
 
+def get_order_queue_keyboard(page: dict, selected: set[int]) -> InlineKeyboardMarkup:
+    """
+    Очередь заказов: кнопка на заказ (выбрать/снять), навигация, выбор и массовые действия.
+    oq:<действие>:<id>[:<первый id страницы>] — страница перерисовывается с того же места.
+    """
+    start = page['first_id']
+    keyboard = [
+        [InlineKeyboardButton(text=f"{'☑' if order['order_id'] in selected else '☐'} #{order['order_id']} "
+                                   f"{order['game_name'][:28]}",
+                              callback_data=f"oq:t:{order['order_id']}:{start}")]
+        for order in page['orders']
+    ]
+    nav = []
+    if page['has_prev']:
+        nav.append(InlineKeyboardButton(text="← Назад", callback_data=f"oq:v:{page['first_id']}"))
+    nav.append(InlineKeyboardButton(text="⟳", callback_data=f"oq:r:{start}"))
+    if page['has_next']:
+        nav.append(InlineKeyboardButton(text="Вперёд →", callback_data=f"oq:n:{page['last_id']}"))
+    keyboard.append(nav)
+    keyboard.append([
+        InlineKeyboardButton(text="Выбрать страницу", callback_data=f"oq:a:{start}"),
+        InlineKeyboardButton(text=f"Выбрать все ({page['total']})", callback_data=f"oq:A:{start}"),
+    ])
+    if selected:
+        keyboard.append([InlineKeyboardButton(text="Снять выбор", callback_data=f"oq:c:{start}")])
+        keyboard.append([
+            InlineKeyboardButton(text=f"✅ Подтвердить ({len(selected)})", callback_data=f"oq:ok:{start}"),
+            InlineKeyboardButton(text=f"❌ Отменить ({len(selected)})", callback_data=f"oq:x:{start}"),
+        ])
+    return InlineKeyboardMarkup(inline_keyboard=keyboard)
+
+
 def get_admin_menu() -> InlineKeyboardMarkup:
     """Главное админ-меню"""
     keyboard = [
@@ -0,0 +1,65 @@
+# bot_apps/media_cache.py
+"""
+Кэш file_id картинок товаров (таблица product_media + копия в памяти).
+
+Перед отправкой фото по ссылке смотрим, нет ли уже file_id для пары
+(id товара, ссылка). После первой удачной отправки запоминаем file_id,
+который вернул Telegram. При смене image_urls или удалении товара
+записи товара сбрасываются через forget().
+"""
+import asyncio
+import logging
+
+from bot_apps import pool, writer
+
+logger = logging.getLogger(__name__)
+
+_file_ids: dict[tuple[int, str], str] = {}   # (product_id, url) -> file_id
+_loaded = False
+_load_lock = asyncio.Lock()
+
+
+async def load():
+    global _loaded
+    async with _load_lock:
+        async with pool.connection() as db:
+            cursor = await db.execute('SELECT product_id, url, file_id FROM product_media')
+            rows = await cursor.fetchall()
+
+        _file_ids.clear()
+        for row in rows:
+            _file_ids[(row['product_id'], row['url'])] = row['file_id']
+        _loaded = True
+        logger.info(f"file_id картинок загружены: {len(_file_ids)}")
+
+
+async def get_file_id(product_id: int, url: str) -> str | None:
+    if not _loaded:
+        await load()
+    return _file_ids.get((product_id, url))
+
+
+async def remember(product_id: int, url: str, file_id: str, file_unique_id: str | None = None):
+    """Сохраняет file_id, полученный после отправки картинки по ссылке."""
+    if _file_ids.get((product_id, url)) == file_id:
+        return
+    _file_ids[(product_id, url)] = file_id
+    try:
+        await writer.execute(
+            'INSERT OR REPLACE INTO product_media (product_id, url, file_id, file_unique_id) VALUES (?, ?, ?, ?)',
+            (product_id, url, file_id, file_unique_id)
+        )
+    except Exception as e:
+        # Не критично: в худшем случае картинка ещё раз уйдёт по ссылке
+        logger.error(f"Не удалось сохранить file_id для игры {product_id}: {e}", exc_info=True)
+
+
+async def forget(product_id: int, url: str | None = None):
+    """Сбрасывает file_id товара (все или для одной ссылки)."""
+    if url is None:
+        for key in [key for key in _file_ids if key[0] == product_id]:
+            del _file_ids[key]
+        await writer.execute('DELETE FROM product_media WHERE product_id = ?', (product_id,))
+    else:
+        _file_ids.pop((product_id, url), None)
+        await writer.execute('DELETE FROM product_media WHERE product_id = ? AND url = ?', (product_id, url))
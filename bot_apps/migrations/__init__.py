@@ -0,0 +1,81 @@
+# bot_apps/migrations/__init__.py
+"""
+Версионные миграции схемы.
+
+Номер схемы хранится в PRAGMA user_version. Каждая миграция — модуль
+с VERSION и async upgrade(db). Новые миграции добавляются в конец MIGRATIONS.
+"""
+import logging
+
+from bot_apps import pool
+from bot_apps.pool import DB_NAME
+from bot_apps.migrations import (
+    v001_baseline,
+    v002_indexes,
+    v003_product_media,
+    v004_search_fts,
+    v005_product_aliases,
+    v006_structured_sales,
+    v007_genres,
+    v008_product_types,
+    v009_product_keys,
+    v010_order_expiry,
+    v011_order_events,
+    v012_catalog_price_index,
+    v013_unique_key_text,
+)
+
+logger = logging.getLogger(__name__)
+
+MIGRATIONS = [
+    v001_baseline,
+    v002_indexes,
+    v003_product_media,
+    v004_search_fts,
+    v005_product_aliases,
+    v006_structured_sales,
+    v007_genres,
+    v008_product_types,
+    v009_product_keys,
+    v010_order_expiry,
+    v011_order_events,
+    v012_catalog_price_index,
+    v013_unique_key_text,
+]
+
+LATEST_VERSION = MIGRATIONS[-1].VERSION
+
+
+async def get_version(db) -> int:
+    cursor = await db.execute("PRAGMA user_version")
+    return (await cursor.fetchone())[0]
+
+
+async def migrate(db_name: str = DB_NAME) -> int:
+    """Применяет недостающие миграции одной транзакцией, возвращает версию схемы."""
+    db = await pool.open_connection(db_name, isolation_level=None)
+    try:
+        current = await get_version(db)
+        if current >= LATEST_VERSION:
+            logger.info(f"Схема БД актуальна (версия {current})")
+            return current
+
+        await db.execute("BEGIN IMMEDIATE")
+        try:
+            for migration in MIGRATIONS:
+                if migration.VERSION <= current:
+                    continue
+                await migration.upgrade(db)
+                logger.info(f"Применена миграция {migration.VERSION}: {migration.__name__}")
+            # user_version меняется в той же транзакции, что и сама схема
+            await db.execute(f"PRAGMA user_version = {LATEST_VERSION}")
+            await db.execute("COMMIT")
+        except Exception:
+            await db.execute("ROLLBACK")
+            raise
+
+        logger.info(f"Схема БД обновлена: {current} -> {LATEST_VERSION}")
+        return LATEST_VERSION
+    finally:
+        await db.close()
+
@@ -0,0 +1,13 @@
+# bot_apps/migrations/helpers.py
+async def get_columns(db, table: str) -> list[str]:
+    # table_xinfo, а не table_info: иначе не видно генерируемых колонок
+    cursor = await db.execute(f"PRAGMA table_xinfo({table})")
+    return [row[1] for row in await cursor.fetchall()]
+
+
+async def add_missing_columns(db, table: str, columns: dict):
+    """Добавляет колонки {имя: определение}, которых ещё нет в таблице."""
+    existing = await get_columns(db, table)
+    for name, definition in columns.items():
+        if name not in existing:
+            await db.execute(f"ALTER TABLE {table} ADD COLUMN {name} {definition}")
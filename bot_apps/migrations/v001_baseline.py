@@ -0,0 +1,133 @@
+# bot_apps/migrations/v001_baseline.py
+"""
+Базовая схема: то, что раньше делали init_db, ensure_full_database_structure,
+ensure_sale_columns и init_support_db. Написана так, чтобы привести к одному
+виду и новую, и любую из уже "разъехавшихся" баз.
+"""
+from bot_apps.migrations.helpers import get_columns, add_missing_columns
+
+VERSION = 1
+
+DEFAULT_ADMIN = (1155154067, 'YourName')
+
+
+async def upgrade(db):
+    await db.execute('''
+        CREATE TABLE IF NOT EXISTS users (
+            tg_id INTEGER PRIMARY KEY,
+            first_name TEXT,
+            username TEXT,
+            balance INTEGER DEFAULT 0,
+            referrals INTEGER DEFAULT 0,
+            registration_date TEXT
+        )
+    ''')
+    await db.execute('''
+        CREATE TABLE IF NOT EXISTS admins (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            tg_id INTEGER UNIQUE NOT NULL,
+            name TEXT NOT NULL
+        )
+    ''')
+    await db.execute('''
+        CREATE TABLE IF NOT EXISTS steam_keys (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            game_name TEXT NOT NULL,
+            st_key TEXT NOT NULL,
+            price INTEGER NOT NULL,
+            count INTEGER NOT NULL,
+            discount INTEGER NOT NULL DEFAULT 0,
+            genre TEXT,
+            region TEXT,
+            image_urls TEXT,
+            sale_active INTEGER DEFAULT 0,
+            sale_not TEXT,
+            sale_ends_at TEXT
+        )
+    ''')
+    await db.execute('''
+        CREATE TABLE IF NOT EXISTS orders (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER NOT NULL,
+            key_id INTEGER,
+            status TEXT NOT NULL,
+            order_date TEXT NOT NULL,
+            FOREIGN KEY (user_id) REFERENCES users(tg_id),
+            FOREIGN KEY (key_id) REFERENCES steam_keys(id)
+        )
+    ''')
+    await db.execute('''
+        CREATE TABLE IF NOT EXISTS tickets (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER NOT NULL,
+            admin_id INTEGER,
+            status TEXT NOT NULL DEFAULT 'open',
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            last_message TEXT
+        )
+    ''')
+
+    await _fix_users(db)
+
+    await add_missing_columns(db, 'steam_keys', {
+        'discount': "INTEGER NOT NULL DEFAULT 0",
+        'image_urls': "TEXT",
+        'sale_active': "INTEGER DEFAULT 0",
+        'sale_not': "TEXT",
+        'sale_ends_at': "TEXT",
+    })
+    # В части баз текст акции успели записать в колонку sale_note
+    if 'sale_note' in await get_columns(db, 'steam_keys'):
+        await db.execute('''
+            UPDATE steam_keys SET sale_not = sale_note
+            WHERE sale_not IS NULL AND sale_note IS NOT NULL AND sale_note != ''
+        ''')
+
+    await add_missing_columns(db, 'tickets', {
+        'updated_at': "TIMESTAMP",
+        'last_message': "TEXT",
+    })
+
+    await db.execute('INSERT OR IGNORE INTO admins (tg_id, name) VALUES (?, ?)', DEFAULT_ADMIN)
+
+
+async def _fix_users(db):
+    """
+    Старый init_db создавал users(tg_id, name NOT NULL), а /start пишет
+    first_name — такие таблицы пересобираем, остальным добавляем колонки.
+    """
+    cursor = await db.execute("PRAGMA table_info(users)")
+    columns = {row[1]: row for row in await cursor.fetchall()}
+
+    if 'name' in columns and columns['name'][3]:  # [3] — notnull
+        has_first_name = 'first_name' in columns
+        # Порядок как в документации SQLite: новая таблица -> копия -> drop -> rename,
+        # чтобы внешний ключ orders.user_id продолжал указывать на users
+        await db.execute('''
+            CREATE TABLE users_new (
+                tg_id INTEGER PRIMARY KEY,
+                first_name TEXT,
+                username TEXT,
+                balance INTEGER DEFAULT 0,
+                referrals INTEGER DEFAULT 0,
+                registration_date TEXT
+            )
+        ''')
+        first_name = "COALESCE(first_name, name)" if has_first_name else "name"
+        copy_cols = [c for c in ('username', 'balance', 'referrals', 'registration_date') if c in columns]
+        await db.execute(
+            f"INSERT INTO users_new (tg_id, first_name{''.join(', ' + c for c in copy_cols)}) "
+            f"SELECT tg_id, {first_name}{''.join(', ' + c for c in copy_cols)} FROM users"
+        )
+        await db.execute('DROP TABLE users')
+        await db.execute('ALTER TABLE users_new RENAME TO users')
+        return
+
+    await add_missing_columns(db, 'users', {
+        'first_name': "TEXT",
+        'username': "TEXT",
+        'balance': "INTEGER DEFAULT 0",
+        'referrals': "INTEGER DEFAULT 0",
+        'registration_date': "TEXT",
+    })
@@ -0,0 +1,27 @@
+# bot_apps/migrations/v002_indexes.py
+"""
+Индексы под горячие запросы заказов, тикетов и каталога.
+Проверка планов запросов: python -m bot_apps.check_query_plans
+"""
+VERSION = 2
+
+INDEXES = {
+    # очередь заказов админа, выручка по подтверждённым
+    'idx_orders_status': "ON orders(status)",
+    # get_user_order_stats, get_users_overview
+    'idx_orders_user_status': "ON orders(user_id, status)",
+    # get_daily_order_stats
+    'idx_orders_day': "ON orders(date(order_date), status)",
+    # find_active_ticket_by_user, find_open_ticket_by_user
+    'idx_tickets_user_status': "ON tickets(user_id, status)",
+    # find_active_ticket_by_admin
+    'idx_tickets_admin_status': "ON tickets(admin_id, status)",
+    # каталог: только игры в наличии
+    'idx_steam_keys_in_stock': "ON steam_keys(id) WHERE count > 0",
+    'idx_steam_keys_price': "ON steam_keys(price) WHERE count > 0",
+}
+
+
+async def upgrade(db):
+    for name, definition in INDEXES.items():
+        await db.execute(f"CREATE INDEX IF NOT EXISTS {name} {definition}")
@@ -0,0 +1,19 @@
+# bot_apps/migrations/v003_product_media.py
+"""
+file_id картинок товаров, которые Telegram вернул при первой отправке.
+Повторная отправка по file_id не скачивает картинку с чужого сервера заново.
+"""
+VERSION = 3
+
+
+async def upgrade(db):
+    await db.execute('''
+        CREATE TABLE IF NOT EXISTS product_media (
+            product_id INTEGER NOT NULL,
+            url TEXT NOT NULL,
+            file_id TEXT NOT NULL,
+            file_unique_id TEXT,
+            PRIMARY KEY (product_id, url),
+            FOREIGN KEY (product_id) REFERENCES steam_keys(id)
+        )
+    ''')
@@ -0,0 +1,40 @@
+# bot_apps/migrations/v004_search_fts.py
+"""
+Полнотекстовый индекс FTS5 по названию и жанру игр для search_games.
+Внешнее содержимое (content='steam_keys'): сам текст хранится только в
+steam_keys, индекс поддерживают триггеры.
+"""
+VERSION = 4
+
+
+async def upgrade(db):
+    await db.execute('''
+        CREATE VIRTUAL TABLE IF NOT EXISTS steam_keys_fts USING fts5(
+            game_name, genre,
+            content='steam_keys', content_rowid='id',
+            tokenize='unicode61 remove_diacritics 2'
+        )
+    ''')
+    await db.execute('''
+        CREATE TRIGGER IF NOT EXISTS steam_keys_fts_ai AFTER INSERT ON steam_keys BEGIN
+            INSERT INTO steam_keys_fts (rowid, game_name, genre) VALUES (new.id, new.game_name, new.genre);
+        END
+    ''')
+    await db.execute('''
+        CREATE TRIGGER IF NOT EXISTS steam_keys_fts_ad AFTER DELETE ON steam_keys BEGIN
+            INSERT INTO steam_keys_fts (steam_keys_fts, rowid, game_name, genre)
+            VALUES ('delete', old.id, old.game_name, old.genre);
+        END
+    ''')
+    # Только на смену индексируемых колонок — списание count при продаже индекс не трогает
+    await db.execute('''
+        CREATE TRIGGER IF NOT EXISTS steam_keys_fts_au AFTER UPDATE OF game_name, genre ON steam_keys BEGIN
+            INSERT INTO steam_keys_fts (steam_keys_fts, rowid, game_name, genre)
+            VALUES ('delete', old.id, old.game_name, old.genre);
+            INSERT INTO steam_keys_fts (rowid, game_name, genre) VALUES (new.id, new.game_name, new.genre);
+        END
+    ''')
+    # rank = bm25 с весами: совпадение в названии важнее совпадения в жанре
+    await db.execute("INSERT INTO steam_keys_fts (steam_keys_fts, rank) VALUES ('rank', 'bm25(10.0, 1.0)')")
+    # Заполняем индекс по уже существующим играм
+    await db.execute("INSERT INTO steam_keys_fts (steam_keys_fts) VALUES ('rebuild')")
@@ -0,0 +1,17 @@
+# bot_apps/migrations/v005_product_aliases.py
+"""
+Альтернативные названия игр для нечёткого поиска ("Ведьмак" -> The Witcher 3).
+"""
+VERSION = 5
+
+
+async def upgrade(db):
+    await db.execute('''
+        CREATE TABLE IF NOT EXISTS product_aliases (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            product_id INTEGER NOT NULL,
+            alias TEXT NOT NULL,
+            UNIQUE (product_id, alias),
+            FOREIGN KEY (product_id) REFERENCES steam_keys(id)
+        )
+    ''')
@@ -0,0 +1,63 @@
+# bot_apps/migrations/v006_structured_sales.py
+"""
+Акция в виде полей, а не текста: процент и начало/конец в epoch-секундах.
+effective_price — генерируемая колонка с ценой, которую платит покупатель
+(акция важнее обычной скидки), с частичным индексом для фильтра по цене.
+"""
+import re
+from datetime import datetime
+
+from bot_apps.migrations.helpers import add_missing_columns
+
+VERSION = 6
+
+EFFECTIVE_PRICE = '''
+    REAL GENERATED ALWAYS AS (
+        CASE
+            WHEN sale_active = 1 AND sale_percent IS NOT NULL THEN price * (100 - sale_percent) / 100.0
+            WHEN discount > 0 THEN price * (100 - discount) / 100.0
+            ELSE price
+        END
+    ) VIRTUAL
+'''
+
+
+def _parse_end(sale_ends_at):
+    try:
+        if len(sale_ends_at) <= 10:
+            return datetime.strptime(sale_ends_at, "%Y-%m-%d")
+        return datetime.strptime(sale_ends_at[:19], "%Y-%m-%d %H:%M:%S")
+    except ValueError:
+        return None
+
+
+async def upgrade(db):
+    await add_missing_columns(db, 'steam_keys', {
+        'sale_percent': "INTEGER",
+        'sale_start_ts': "INTEGER",
+        'sale_end_ts': "INTEGER",
+        'effective_price': EFFECTIVE_PRICE,
+    })
+
+    # Переносим уже заведённые акции: процент из текста, конец из строки даты
+    cursor = await db.execute(
+        "SELECT id, sale_not, sale_ends_at FROM steam_keys WHERE sale_not IS NOT NULL AND sale_not != ''"
+    )
+    for row in await cursor.fetchall():
+        match = re.search(r'(\d+)%', row[1])
+        percent = min(int(match.group(1)), 100) if match else None
+        end_dt = _parse_end(row[2]) if row[2] else None
+        await db.execute(
+            "UPDATE steam_keys SET sale_percent = ?, sale_end_ts = ? WHERE id = ?",
+            (percent, int(end_dt.timestamp()) if end_dt else None, row[0])
+        )
+
+    # Фильтр по цене теперь идёт по effective_price
+    await db.execute("DROP INDEX IF EXISTS idx_steam_keys_price")
+    await db.execute(
+        "CREATE INDEX IF NOT EXISTS idx_steam_keys_effective_price ON steam_keys(effective_price) WHERE count > 0"
+    )
+    # Планировщик акций: игры с заведённой акцией
+    await db.execute(
+        "CREATE INDEX IF NOT EXISTS idx_steam_keys_sales ON steam_keys(id) WHERE sale_not IS NOT NULL"
+    )
@@ -0,0 +1,44 @@
+# bot_apps/migrations/v007_genres.py
+"""
+Справочник жанров и связь игра <-> жанр вместо поиска подстроки в steam_keys.genre.
+Колонка genre остаётся как текст для карточки; жанры из неё разбираются по
+запятой/слешу ("Экшн, RPG" -> два жанра).
+"""
+import re
+
+VERSION = 7
+
+
+async def upgrade(db):
+    await db.execute('''
+        CREATE TABLE IF NOT EXISTS genres (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            name TEXT NOT NULL UNIQUE COLLATE NOCASE
+        )
+    ''')
+    await db.execute('''
+        CREATE TABLE IF NOT EXISTS product_genres (
+            product_id INTEGER NOT NULL,
+            genre_id INTEGER NOT NULL,
+            PRIMARY KEY (product_id, genre_id),
+            FOREIGN KEY (product_id) REFERENCES steam_keys(id),
+            FOREIGN KEY (genre_id) REFERENCES genres(id)
+        ) WITHOUT ROWID
+    ''')
+    # Фильтр по жанру и подсчёт фасетов идут от жанра к играм
+    await db.execute(
+        "CREATE INDEX IF NOT EXISTS idx_product_genres_genre ON product_genres(genre_id, product_id)"
+    )
+
+    cursor = await db.execute("SELECT id, genre FROM steam_keys WHERE genre IS NOT NULL AND genre != ''")
+    for product_id, genre_text in await cursor.fetchall():
+        for name in re.split(r'[,/;]', genre_text):
+            name = name.strip()
+            if not name:
+                continue
+            await db.execute("INSERT OR IGNORE INTO genres (name) VALUES (?)", (name,))
+            await db.execute(
+                "INSERT OR IGNORE INTO product_genres (product_id, genre_id) "
+                "SELECT ?, id FROM genres WHERE name = ?",
+                (product_id, name)
+            )
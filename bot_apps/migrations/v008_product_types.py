@@ -0,0 +1,52 @@
+# bot_apps/migrations/v008_product_types.py
+"""
+Единый каталог товаров: steam_keys хранит не только игры, но и ключи
+Windows/Office. product_type — вид товара, attributes — JSON с полями,
+которые есть только у своего вида (версия Office и т. п.).
+
+Доступные ключи из старых таблиц windows_keys/office_keys (если они есть)
+переносятся товарами: один товар на (цена, регион[, версия]) с количеством
+ключей; перенесённые строки помечаются status = 'migrated'.
+"""
+import json
+
+from bot_apps.migrations.helpers import add_missing_columns
+
+VERSION = 8
+
+
+async def _table_exists(db, name: str) -> bool:
+    cursor = await db.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?", (name,))
+    return await cursor.fetchone() is not None
+
+
+async def _import_legacy(db, table: str, product_type: str, title: str, with_version: bool):
+    if not await _table_exists(db, table):
+        return
+    version = "version" if with_version else "NULL"
+    cursor = await db.execute(
+        f"SELECT price, region, {version}, MIN(key_text), COUNT(*) FROM {table} "
+        f"WHERE status = 'available' GROUP BY price, region, {version}"
+    )
+    for price, region, product_version, st_key, count in await cursor.fetchall():
+        name = f"{title} {product_version}" if product_version else f"{title} ({region})"
+        attributes = json.dumps({'version': product_version}, ensure_ascii=False) if product_version else None
+        await db.execute(
+            "INSERT INTO steam_keys (game_name, st_key, price, count, region, product_type, attributes) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?)",
+            (name, st_key, price, count, region, product_type, attributes)
+        )
+    await db.execute(f"UPDATE {table} SET status = 'migrated' WHERE status = 'available'")
+
+
+async def upgrade(db):
+    await add_missing_columns(db, 'steam_keys', {
+        'product_type': "TEXT NOT NULL DEFAULT 'steam'",
+        'attributes': "TEXT",
+    })
+    # Листинг одного вида товаров в наличии
+    await db.execute(
+        "CREATE INDEX IF NOT EXISTS idx_steam_keys_type ON steam_keys(product_type, id) WHERE count > 0"
+    )
+    await _import_legacy(db, 'windows_keys', 'windows', "Windows", with_version=False)
+    await _import_legacy(db, 'office_keys', 'office', "Microsoft Office", with_version=True)
@@ -0,0 +1,105 @@
+# bot_apps/migrations/v009_product_keys.py
+"""
+Склад ключей: по строке на каждый настоящий ключ товара со статусом
+available / reserved (за заказом, ждёт оплаты) / sold.
+
+steam_keys.count теперь — число доступных ключей товара; его ведут триггеры
+на product_keys, так что резерв, продажа, отмена и загрузка ключей не
+обязаны помнить про count.
+
+Перенос: st_key товара становится одним его ключом, ключи из старых
+windows_keys/office_keys (status = 'migrated') — ключами своих товаров.
+Раньше всем покупателям уходил один и тот же st_key, а count мог быть
+больше числа реальных ключей или уйти в минус. Поэтому st_key, который уже
+выдавался по подтверждённому заказу, или st_key товара с count <= 0
+переносится как проданный (order_id — последний заказ этого товара), а не
+доступный. Общий st_key, выданный по заказу любого товара, проданным
+считается у всех товаров с этим ключом. Так товар не возвращается в
+продажу и выданный ключ не продаётся повторно; такие товары остаются
+с count = 0, пока админ не загрузит ключи.
+"""
+VERSION = 9
+
+
+async def _table_exists(db, name: str) -> bool:
+    cursor = await db.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?", (name,))
+    return await cursor.fetchone() is not None
+
+
+async def upgrade(db):
+    await db.execute('''
+        CREATE TABLE IF NOT EXISTS product_keys (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            product_id INTEGER NOT NULL,
+            key_text TEXT NOT NULL,
+            status TEXT NOT NULL DEFAULT 'available',
+            order_id INTEGER,
+            reserved_at TEXT,
+            UNIQUE (product_id, key_text),
+            FOREIGN KEY (product_id) REFERENCES steam_keys(id),
+            FOREIGN KEY (order_id) REFERENCES orders(id)
+        )
+    ''')
+    # Резерв: первый доступный ключ товара
+    await db.execute(
+        "CREATE INDEX IF NOT EXISTS idx_product_keys_product_status ON product_keys(product_id, status)"
+    )
+    # Подтверждение/отмена: ключ заказа
+    await db.execute(
+        "CREATE INDEX IF NOT EXISTS idx_product_keys_order ON product_keys(order_id) WHERE order_id IS NOT NULL"
+    )
+
+    # Переносим ключи до триггеров, count выставим один раз в конце
+    await db.execute('''
+        INSERT OR IGNORE INTO product_keys (product_id, key_text, status, order_id)
+        SELECT s.id, s.st_key,
+               CASE WHEN s.count > 0 AND NOT EXISTS (
+                   SELECT 1 FROM orders o JOIN steam_keys k ON k.id = o.key_id
+                   WHERE k.st_key = s.st_key AND o.status IN ('confirmed', 'delivered')
+               ) THEN 'available' ELSE 'sold' END,
+               (SELECT MAX(o.id) FROM orders o
+                WHERE o.key_id = s.id AND o.status IN ('confirmed', 'delivered'))
+        FROM steam_keys s
+        WHERE s.st_key IS NOT NULL AND s.st_key != ''
+    ''')
+    if await _table_exists(db, 'windows_keys'):
+        await db.execute('''
+            INSERT OR IGNORE INTO product_keys (product_id, key_text)
+            SELECT s.id, w.key_text FROM windows_keys w
+            JOIN steam_keys s ON s.product_type = 'windows' AND s.price = w.price AND s.region = w.region
+            WHERE w.status = 'migrated'
+        ''')
+    if await _table_exists(db, 'office_keys'):
+        await db.execute('''
+            INSERT OR IGNORE INTO product_keys (product_id, key_text)
+            SELECT s.id, o.key_text FROM office_keys o
+            JOIN steam_keys s ON s.product_type = 'office' AND s.price = o.price AND s.region = o.region
+                AND json_extract(s.attributes, '$.version') = o.version
+            WHERE o.status = 'migrated'
+        ''')
+    await db.execute('''
+        UPDATE steam_keys SET count = (
+            SELECT COUNT(*) FROM product_keys k WHERE k.product_id = steam_keys.id AND k.status = 'available'
+        )
+    ''')
+
+    await db.execute('''
+        CREATE TRIGGER IF NOT EXISTS product_keys_count_ai AFTER INSERT ON product_keys
+        WHEN new.status = 'available' BEGIN
+            UPDATE steam_keys SET count = count + 1 WHERE id = new.product_id;
+        END
+    ''')
+    await db.execute('''
+        CREATE TRIGGER IF NOT EXISTS product_keys_count_ad AFTER DELETE ON product_keys
+        WHEN old.status = 'available' BEGIN
+            UPDATE steam_keys SET count = count - 1 WHERE id = old.product_id;
+        END
+    ''')
+    await db.execute('''
+        CREATE TRIGGER IF NOT EXISTS product_keys_count_au AFTER UPDATE OF status ON product_keys
+        WHEN (old.status = 'available') != (new.status = 'available') BEGIN
+            UPDATE steam_keys
+            SET count = count + CASE WHEN new.status = 'available' THEN 1 ELSE -1 END
+            WHERE id = new.product_id;
+        END
+    ''')
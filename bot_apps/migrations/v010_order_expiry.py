@@ -0,0 +1,25 @@
+# bot_apps/migrations/v010_order_expiry.py
+"""
+Срок брони неоплаченного заказа: orders.expires_at (epoch-секунды).
+После него order_reaper переводит заказ в 'expired' и возвращает ключ в продажу.
+Уже висящим заказам срок считается от даты заказа.
+"""
+from bot_apps.migrations.helpers import add_missing_columns
+
+VERSION = 10
+
+# То же, что db_user.ORDER_RESERVATION_TTL на момент миграции
+LEGACY_TTL = 30 * 60
+
+
+async def upgrade(db):
+    await add_missing_columns(db, 'orders', {'expires_at': "INTEGER"})
+    await db.execute(
+        "UPDATE orders SET expires_at = CAST(strftime('%s', order_date) AS INTEGER) + ? "
+        "WHERE status = 'pending' AND expires_at IS NULL",
+        (LEGACY_TTL,)
+    )
+    # Поиск просроченных: только по ожидающим заказам, их немного
+    await db.execute(
+        "CREATE INDEX IF NOT EXISTS idx_orders_pending_expiry ON orders(expires_at) WHERE status = 'pending'"
+    )
@@ -0,0 +1,68 @@
+# bot_apps/migrations/v011_order_events.py
+"""
+Журнал переходов заказов (см. bot_apps/order_states): строка на каждый
+переход — откуда, куда, кто (actor), когда (epoch) и сумма для 'delivered'.
+Журнал только дописывается: UPDATE и DELETE запрещены триггерами.
+
+Статус 'confirmed' становится 'delivered' (оплата и выдача ключа).
+Для старых заказов журнал восстанавливается: создание — по order_date,
+дальнейшие переходы — тем же временем, actor 'migration'.
+
+Сумма выдачи для старых заказов приблизительная: цена на момент продажи
+нигде не хранилась, поэтому берётся effective_price товара на момент
+миграции (NULL, если товар удалён). Выручка по событиям с actor
+'migration' — оценка; точные суммы пишутся только для новых выдач.
+"""
+VERSION = 11
+
+
+async def upgrade(db):
+    await db.execute('''
+        CREATE TABLE IF NOT EXISTS order_events (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            order_id INTEGER NOT NULL,
+            from_status TEXT,
+            to_status TEXT NOT NULL,
+            actor TEXT NOT NULL,
+            amount REAL,
+            created_at INTEGER NOT NULL,
+            FOREIGN KEY (order_id) REFERENCES orders(id)
+        )
+    ''')
+    # История одного заказа и выборки "что произошло за период"
+    await db.execute("CREATE INDEX IF NOT EXISTS idx_order_events_order ON order_events(order_id, id)")
+    await db.execute("CREATE INDEX IF NOT EXISTS idx_order_events_status_time ON order_events(to_status, created_at)")
+    await db.execute('''
+        CREATE TRIGGER IF NOT EXISTS order_events_no_update BEFORE UPDATE ON order_events BEGIN
+            SELECT RAISE(ABORT, 'order_events: журнал только дописывается');
+        END
+    ''')
+    await db.execute('''
+        CREATE TRIGGER IF NOT EXISTS order_events_no_delete BEFORE DELETE ON order_events BEGIN
+            SELECT RAISE(ABORT, 'order_events: журнал только дописывается');
+        END
+    ''')
+
+    await db.execute("UPDATE orders SET status = 'delivered' WHERE status = 'confirmed'")
+
+    created_at = "COALESCE(CAST(strftime('%s', o.order_date) AS INTEGER), 0)"
+    await db.execute(f'''
+        INSERT INTO order_events (order_id, from_status, to_status, actor, created_at)
+        SELECT o.id, NULL, 'pending', 'user:' || o.user_id, {created_at} FROM orders o ORDER BY o.id
+    ''')
+    await db.execute(f'''
+        INSERT INTO order_events (order_id, from_status, to_status, actor, created_at)
+        SELECT o.id, 'pending', 'paid', 'migration', {created_at} FROM orders o
+        WHERE o.status = 'delivered' ORDER BY o.id
+    ''')
+    await db.execute(f'''
+        INSERT INTO order_events (order_id, from_status, to_status, actor, amount, created_at)
+        SELECT o.id, 'paid', 'delivered', 'migration', s.effective_price, {created_at}
+        FROM orders o LEFT JOIN steam_keys s ON s.id = o.key_id
+        WHERE o.status = 'delivered' ORDER BY o.id
+    ''')
+    await db.execute(f'''
+        INSERT INTO order_events (order_id, from_status, to_status, actor, created_at)
+        SELECT o.id, 'pending', o.status, 'migration', {created_at} FROM orders o
+        WHERE o.status IN ('cancelled', 'expired') ORDER BY o.id
+    ''')
@@ -0,0 +1,14 @@
+# bot_apps/migrations/v012_catalog_price_index.py
+"""
+Индекс под страницы каталога с сортировкой по цене: вид товара, цена со
+скидкой, id — ровно ключ курсора catalog_filter. Без него SQLite сортировал
+все товары вида во временном B-дереве на каждой странице.
+"""
+VERSION = 12
+
+
+async def upgrade(db):
+    await db.execute(
+        "CREATE INDEX IF NOT EXISTS idx_steam_keys_type_price "
+        "ON steam_keys(product_type, effective_price, id) WHERE count > 0"
+    )
@@ -0,0 +1,25 @@
+# bot_apps/migrations/v013_unique_key_text.py
+"""
+Один ключ — один товар. UNIQUE(product_id, key_text) ловил повторы только
+внутри товара: тот же ключ, загруженный под другой товар, продавался
+второй раз. Теперь триггер молча пропускает вставку ключа, который уже
+есть на складе у любого товара (RAISE(IGNORE) — строка не вставляется и не
+попадает в rowcount, так что загрузки считают её повтором). Индекс по
+key_text — под проверку триггера.
+
+Уже лежащие в базе одинаковые ключи (общий st_key старых товаров,
+перенесённый v009 как проданный) не трогаем — это история заказов.
+"""
+VERSION = 13
+
+
+async def upgrade(db):
+    await db.execute("CREATE INDEX IF NOT EXISTS idx_product_keys_key_text ON product_keys(key_text)")
+    await db.execute('''
+        CREATE TRIGGER IF NOT EXISTS product_keys_unique_text
+        BEFORE INSERT ON product_keys
+        WHEN EXISTS (SELECT 1 FROM product_keys WHERE key_text = NEW.key_text)
+        BEGIN
+            SELECT RAISE(IGNORE);
+        END
+    ''')
@@ -0,0 +1,54 @@
+# bot_apps/models.py
+"""
+Типы данных каталога.
+
+Product — неизменяемая запись об игре из steam_keys, без ключа (st_key в
+память не попадает). Строится прямо из кортежа строки: запрос выбирает
+PRODUCT_COLUMNS в порядке полей, а product_factory ставится курсору вместо
+aiosqlite.Row — ни Row, ни dict на строку не создаются.
+Текст, цена со скидкой и кнопки карточки строятся в cards.
+"""
+import json
+from dataclasses import dataclass, fields
+
+# Виды товаров (steam_keys.product_type) -> название раздела каталога
+PRODUCT_TYPES = {
+    'steam': "Steam игры",
+    'windows': "Windows ключи",
+    'office': "Office ключи",
+}
+
+
+@dataclass(frozen=True, slots=True)
+class Product:
+    id: int
+    game_name: str
+    price: float
+    count: int
+    discount: int
+    genre: str | None
+    region: str | None
+    image_urls: str | None
+    sale_active: int
+    sale_not: str | None
+    sale_percent: int | None
+    sale_start_ts: int | None
+    sale_end_ts: int | None
+    effective_price: float
+    product_type: str
+    attributes: str | None   # JSON с полями своего вида товара
+
+    @property
+    def in_stock(self) -> bool:
+        return self.count > 0
+
+    def attribute_map(self) -> dict:
+        return json.loads(self.attributes) if self.attributes else {}
+
+
+PRODUCT_COLUMNS = ", ".join(field.name for field in fields(Product))
+
+
+def product_factory(cursor, row) -> Product:
+    """row_factory для запросов вида SELECT PRODUCT_COLUMNS FROM steam_keys."""
+    return Product(*row)
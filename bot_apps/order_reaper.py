@@ -0,0 +1,122 @@
+# bot_apps/order_reaper.py
+"""
+Фоновое снятие неоплаченных заказов с истёкшей бронью.
+
+Заказ при создании получает expires_at (db_user.ORDER_RESERVATION_TTL).
+Задача спит до ближайшего срока (но не дольше REAP_INTERVAL), затем одним
+проходом через писателя переводит просроченные заказы в 'expired'
+(order_states.expire_due, с записью в журнал) и возвращает их ключи в
+продажу — одна транзакция на пачку до REAP_BATCH заказов. После записи
+обновляет кэш каталога и пишет покупателям.
+"""
+import asyncio
+import logging
+from datetime import datetime
+
+from bot_apps import catalog_cache, order_states, pool, writer
+
+logger = logging.getLogger(__name__)
+
+# Дольше этого не спим: заказы могли добавиться, пока ждали
+REAP_INTERVAL = 60
+REAP_BATCH = 500
+# Пауза между уведомлениями, чтобы не упереться в лимиты Telegram
+NOTIFY_DELAY = 0.05
+
+NEXT_EXPIRY_SQL = "SELECT MIN(expires_at) FROM orders WHERE status = 'pending'"
+RELEASE_EXPIRED_KEY_SQL = (
+    "UPDATE product_keys SET status = 'available', order_id = NULL, reserved_at = NULL "
+    "WHERE order_id = ? AND status = 'reserved'"
+)
+
+_bot = None
+_task: asyncio.Task | None = None
+_stopping = False
+
+
+async def _next_expiry() -> int | None:
+    async with pool.connection() as db:
+        cursor = await db.execute(NEXT_EXPIRY_SQL)
+        row = await cursor.fetchone()
+    return row[0]
+
+
+async def _notify(expired: list[tuple[int, int, int]]):
+    if _bot is None:
+        return
+    for order_id, user_id, product_id in expired:
+        game = await catalog_cache.get(product_id)
+        name = f" на '{game.game_name}'" if game else ""
+        try:
+            await _bot.send_message(
+                user_id,
+                f"Заказ #{order_id}{name} не был оплачен вовремя и отменён, бронь ключа снята. "
+                f"Если игра ещё нужна — оформите заказ заново."
+            )
+        except Exception as e:
+            logger.warning(f"Не удалось уведомить пользователя {user_id} о заказе #{order_id}: {e}")
+        await asyncio.sleep(NOTIFY_DELAY)
+
+
+async def reap(now: int | None = None) -> list[tuple[int, int, int]]:
+    """
+    Один проход: снимает до REAP_BATCH просроченных заказов и освобождает их ключи
+    одной транзакцией. Возвращает [(id заказа, user_id, id товара)].
+    """
+    now = int(datetime.now().timestamp()) if now is None else now
+
+    async def op(db):
+        rows = await order_states.expire_due(db, now, REAP_BATCH)
+        if rows:
+            await db.executemany(RELEASE_EXPIRED_KEY_SQL, [(order_id,) for order_id, _, _ in rows])
+        return rows
+
+    expired = await writer.submit(op)
+    if expired:
+        for product_id in {product_id for _, _, product_id in expired}:
+            await catalog_cache.refresh(product_id)
+        logger.info(f"Снято просроченных заказов: {len(expired)} ({[order_id for order_id, _, _ in expired]})")
+    return expired
+
+
+async def _reaper_loop():
+    # Как в sale_scheduler: wait_for/sleep в 3.11 может проглотить cancel(), поэтому флаг
+    while not _stopping:
+        try:
+            expired = await reap()
+            await _notify(expired)
+            if len(expired) == REAP_BATCH:
+                continue   # остались ещё — следующая пачка сразу
+
+            now = int(datetime.now().timestamp())
+            next_expiry = await _next_expiry()
+            timeout = REAP_INTERVAL if next_expiry is None else max(0, min(next_expiry - now, REAP_INTERVAL))
+            await asyncio.sleep(timeout)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error(f"Ошибка при снятии просроченных заказов: {e}", exc_info=True)
+            await asyncio.sleep(5)
+
+
+async def start_reaper(bot=None):
+    """Запускает задачу (после open_db); bot нужен для уведомлений покупателей."""
+    global _bot, _task, _stopping
+    if _task is not None and not _task.done():
+        return
+    _bot = bot
+    _stopping = False
+    _task = asyncio.create_task(_reaper_loop(), name="order-reaper")
+
+
+async def stop_reaper():
+    global _task, _stopping
+    if _task is None:
+        return
+    _stopping = True
+    _task.cancel()
+    try:
+        await _task
+    except asyncio.CancelledError:
+        pass
+    _task = None
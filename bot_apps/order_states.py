@@ -0,0 +1,113 @@
+# bot_apps/order_states.py
+"""
+Состояния заказа и единственное место, где они меняются:
+
+    pending -> paid -> delivered
+    pending -> cancelled | expired
+    paid    -> cancelled
+
+Каждый переход — compare-and-set по текущему статусу (UPDATE ... WHERE status = ?)
+и строка в order_events: откуда, куда, кто и когда. Оплатить (pending -> paid)
+можно только заказ с неистёкшей бронью, даже если order_reaper его ещё не
+снял. Функции принимают соединение писателя и вызываются внутри op(db) —
+переход и его событие коммитятся вместе. Журнал читает аналитика (db_admin) — по id, с того места,
+где остановилась.
+"""
+from datetime import datetime
+
+PENDING = 'pending'      # ждёт оплаты, ключ забронирован
+PAID = 'paid'            # оплата подтверждена админом, ключ ещё не выдан
+DELIVERED = 'delivered'  # ключ отправлен покупателю
+CANCELLED = 'cancelled'
+EXPIRED = 'expired'      # не оплачен вовремя (order_reaper)
+
+TRANSITIONS = {
+    PENDING: frozenset({PAID, CANCELLED, EXPIRED}),
+    PAID: frozenset({DELIVERED, CANCELLED}),
+    DELIVERED: frozenset(),
+    CANCELLED: frozenset(),
+    EXPIRED: frozenset(),
+}
+# Заказы, с которыми админу ещё есть что делать
+OPEN_STATUSES = (PENDING, PAID)
+
+ORDER_STATE_SQL = "SELECT status, user_id, key_id, expires_at FROM orders WHERE id = ?"
+SET_STATUS_SQL = "UPDATE orders SET status = ? WHERE id = ? AND status = ? RETURNING user_id, key_id"
+PAY_SQL = (
+    "UPDATE orders SET status = 'paid' "
+    "WHERE id = ? AND status = 'pending' AND (expires_at IS NULL OR expires_at > ?) "
+    "RETURNING user_id, key_id"
+)
+EXPIRE_DUE_SQL = (
+    "UPDATE orders SET status = 'expired' WHERE id IN ("
+    "SELECT id FROM orders WHERE status = 'pending' AND expires_at <= ? ORDER BY expires_at LIMIT ?"
+    ") RETURNING id, user_id, key_id"
+)
+INSERT_EVENT_SQL = (
+    "INSERT INTO order_events (order_id, from_status, to_status, actor, amount, created_at) "
+    "VALUES (?, ?, ?, ?, ?, ?)"
+)
+
+
+def _now() -> int:
+    return int(datetime.now().timestamp())
+
+
+def can_transition(from_status: str, to_status: str) -> bool:
+    return to_status in TRANSITIONS.get(from_status, ())
+
+
+def is_expired(state, now: int | None = None) -> bool:
+    """Бронь заказа в статусе pending уже истекла (строка get_state)."""
+    now = _now() if now is None else now
+    return state['status'] == PENDING and state['expires_at'] is not None and state['expires_at'] <= now
+
+
+async def get_state(db, order_id: int):
+    """Строка (status, user_id, key_id, expires_at) заказа или None."""
+    cursor = await db.execute(ORDER_STATE_SQL, (order_id,))
+    return await cursor.fetchone()
+
+
+async def log_created(db, order_id: int, actor: str):
+    """Первое событие заказа (вставка в orders — у создателя заказа)."""
+    await db.execute(INSERT_EVENT_SQL, (order_id, None, PENDING, actor, None, _now()))
+
+
+async def transition(db, order_id: int, to_status: str, actor: str, amount: float | None = None,
+                     from_status: str | None = None):
+    """
+    Переводит заказ в to_status, если это разрешено из его текущего статуса
+    (или из from_status, если он передан). Возвращает (user_id, key_id) заказа
+    или None — заказа нет, переход запрещён, статус уже сменили или
+    (для pending -> paid) бронь истекла.
+    """
+    if from_status is None:
+        state = await get_state(db, order_id)
+        if state is None:
+            return None
+        from_status = state['status']
+    if not can_transition(from_status, to_status):
+        return None
+
+    now = _now()
+    if from_status == PENDING and to_status == PAID:
+        cursor = await db.execute(PAY_SQL, (order_id, now))
+    else:
+        cursor = await db.execute(SET_STATUS_SQL, (to_status, order_id, from_status))
+    order = await cursor.fetchone()
+    if order is not None:
+        await db.execute(INSERT_EVENT_SQL, (order_id, from_status, to_status, actor, amount, now))
+    return order
+
+
+async def expire_due(db, now: int, limit: int, actor: str = 'reaper') -> list[tuple[int, int, int]]:
+    """pending -> expired для заказов с истёкшей бронью, до limit штук: [(id, user_id, key_id)]."""
+    cursor = await db.execute(EXPIRE_DUE_SQL, (now, limit))
+    rows = [tuple(row) for row in await cursor.fetchall()]
+    if rows:
+        await db.executemany(
+            INSERT_EVENT_SQL,
+            [(order_id, PENDING, EXPIRED, actor, None, now) for order_id, _, _ in rows]
+        )
+    return rows
@@ -0,0 +1,98 @@
+# bot_apps/pool.py
+import asyncio
+import logging
+from contextlib import asynccontextmanager
+
+import aiosqlite
+
+logger = logging.getLogger(__name__)
+
+DB_NAME = 'tg_bot.db'
+POOL_SIZE = 5
+
+# Настройки, которые применяются к каждому соединению один раз при открытии
+PRAGMAS = (
+    "PRAGMA journal_mode = WAL",
+    "PRAGMA synchronous = NORMAL",
+    "PRAGMA busy_timeout = 5000",
+    "PRAGMA temp_store = MEMORY",
+    "PRAGMA cache_size = -8000",
+)
+
+_idle: asyncio.Queue | None = None
+_connections: list[aiosqlite.Connection] = []
+_open_lock = asyncio.Lock()
+
+
+async def open_connection(db_name: str = DB_NAME, **kwargs) -> aiosqlite.Connection:
+    """Открывает соединение и выполняет PRAGMA-настройку."""
+    conn = await aiosqlite.connect(db_name, **kwargs)
+    conn.row_factory = aiosqlite.Row
+    for pragma in PRAGMAS:
+        await conn.execute(pragma)
+    return conn
+
+
+async def open_pool(size: int = POOL_SIZE, db_name: str = DB_NAME):
+    """Открывает пул из size долгоживущих соединений."""
+    global _idle
+    async with _open_lock:
+        if _idle is not None:
+            return
+        if size < 1:
+            raise ValueError("Размер пула должен быть больше 0")
+
+        queue = asyncio.Queue()
+        for _ in range(size):
+            conn = await open_connection(db_name)
+            _connections.append(conn)
+            queue.put_nowait(conn)
+        _idle = queue
+        logger.info(f"Пул соединений открыт: {size} соединений к {db_name}")
+
+
+async def close_pool():
+    """Закрывает все соединения пула."""
+    global _idle
+    if _idle is None:
+        return
+    _idle = None
+    for conn in _connections:
+        try:
+            await conn.close()
+        except Exception as e:
+            logger.error(f"Ошибка при закрытии соединения: {e}", exc_info=True)
+    _connections.clear()
+    logger.info("Пул соединений закрыт")
+
+
+async def acquire() -> aiosqlite.Connection:
+    """Берёт свободное соединение из пула (ждёт, если все заняты)."""
+    if _idle is None:
+        # Скрипты (check_db и т.п.) могут не открывать пул явно
+        await open_pool()
+    return await _idle.get()
+
+
+async def release(conn: aiosqlite.Connection):
+    """Возвращает соединение в пул, откатывая незавершённую транзакцию."""
+    try:
+        if conn.in_transaction:
+            await conn.rollback()
+    except Exception as e:
+        logger.error(f"Ошибка при откате транзакции: {e}", exc_info=True)
+
+    if _idle is None or conn not in _connections:
+        # Пул уже закрыт — соединение больше никому не нужно
+        return
+    _idle.put_nowait(conn)
+
+
+@asynccontextmanager
+async def connection():
+    """async with pool.connection() as db: ..."""
+    conn = await acquire()
+    try:
+        yield conn
+    finally:
+        await release(conn)
@@ -0,0 +1,91 @@
+# bot_apps/price_index.py
+"""
+Распределение цен товаров в наличии: по каждому виду товара отсортированный
+список (effective_price, id) и квантильные корзины поверх него для клавиатуры
+фильтра по цене.
+
+Список ведёт catalog_cache (rebuild при загрузке, put/remove при каждой
+записи), так что корзины всегда делят именно то, что сейчас есть в наличии.
+Страницы корзины отдаёт catalog_filter (фильтр по цене).
+"""
+import bisect
+from collections import namedtuple
+
+# На сколько примерно равных частей делить товары в наличии
+PRICE_BUCKETS = 4
+
+PriceBucket = namedtuple('PriceBucket', ['min_price', 'max_price', 'count'])
+
+_entries: dict[str, list[tuple[float, int]]] = {}   # вид товара -> (effective_price, id) по возрастанию
+_prices: dict[int, tuple[str, float]] = {}          # id -> (вид, effective_price), что лежит в _entries
+_buckets: dict[str, list[PriceBucket]] = {}         # вид товара -> корзины (сбрасываются при изменениях)
+
+
+def _insert(product_type: str, product_id: int, price: float):
+    bisect.insort(_entries.setdefault(product_type, []), (price, product_id))
+    _prices[product_id] = (product_type, price)
+    _buckets.pop(product_type, None)
+
+
+def _delete(product_id: int):
+    listed = _prices.pop(product_id, None)
+    if listed is None:
+        return
+    product_type, price = listed
+    entries = _entries[product_type]
+    pos = bisect.bisect_left(entries, (price, product_id))
+    if pos < len(entries) and entries[pos] == (price, product_id):
+        del entries[pos]
+    _buckets.pop(product_type, None)
+
+
+def rebuild(products):
+    """Полная перестройка по товарам каталога — вызывается из catalog_cache.load()."""
+    _entries.clear()
+    _prices.clear()
+    _buckets.clear()
+    for product in products:
+        if product.in_stock:
+            _entries.setdefault(product.product_type, []).append((product.effective_price, product.id))
+            _prices[product.id] = (product.product_type, product.effective_price)
+    for entries in _entries.values():
+        entries.sort()
+
+
+def put(product):
+    """Товар изменился: убирает старую цену и, если товар в наличии, ставит новую."""
+    if product.in_stock and _prices.get(product.id) == (product.product_type, product.effective_price):
+        return
+    _delete(product.id)
+    if product.in_stock:
+        _insert(product.product_type, product.id, product.effective_price)
+
+
+def remove(product_id: int):
+    _delete(product_id)
+
+
+def buckets(product_type: str = 'steam') -> list[PriceBucket]:
+    """
+    До PRICE_BUCKETS корзин с примерно равным числом товаров вида product_type.
+    Одинаковые цены никогда не попадают в разные корзины, так что корзин бывает и меньше.
+    """
+    cached = _buckets.get(product_type)
+    if cached is not None:
+        return cached
+
+    entries = _entries.get(product_type, [])
+    total = len(entries)
+    result = []
+    start = 0
+    for part in range(1, PRICE_BUCKETS + 1):
+        end = part * total // PRICE_BUCKETS
+        if end <= start:
+            continue
+        # Дотягиваем конец корзины до последнего товара с той же ценой
+        end = bisect.bisect_right(entries, (entries[end - 1][0], float('inf')))
+        result.append(PriceBucket(entries[start][0], entries[end - 1][0], end - start))
+        start = end
+    _buckets[product_type] = result
+    return result
+
@@ -0,0 +1,145 @@
+# bot_apps/sale_scheduler.py
+"""
+Фоновое включение и снятие акций по расписанию.
+
+Держит min-кучу (время, id игры) из начал и окончаний заведённых акций и
+спит до ближайшего события. Все события, наступившие к моменту пробуждения,
+применяются одной транзакцией через писателя. /sale и /sale_off вызывают
+reload() — куча перечитывается из базы. Чтения каталога ничего не пишут.
+"""
+import asyncio
+import heapq
+import logging
+from datetime import datetime
+
+from bot_apps import catalog_cache, pool, writer
+
+logger = logging.getLogger(__name__)
+
+SCHEDULED_SALES_SQL = (
+    "SELECT id, sale_active, sale_start_ts, sale_end_ts FROM steam_keys "
+    "WHERE sale_not IS NOT NULL"
+)
+
+_heap: list[tuple[float, int]] = []
+_wakeup: asyncio.Event | None = None
+_task: asyncio.Task | None = None
+_reload_needed = True
+_stopping = False
+
+
+def parse_sale_end(sale_ends_at) -> datetime | None:
+    """'YYYY-MM-DD' или 'YYYY-MM-DD HH:MM:SS' -> datetime, иначе None."""
+    if not sale_ends_at:
+        return None
+    try:
+        if len(sale_ends_at) <= 10:
+            return datetime.strptime(sale_ends_at, "%Y-%m-%d")
+        return datetime.strptime(sale_ends_at[:19], "%Y-%m-%d %H:%M:%S")
+    except ValueError:
+        return None
+
+
+async def _load_heap():
+    async with pool.connection() as db:
+        cursor = await db.execute(SCHEDULED_SALES_SQL)
+        rows = await cursor.fetchall()
+
+    heap = []
+    for row in rows:
+        if not row['sale_active'] and row['sale_start_ts'] is not None:
+            heap.append((row['sale_start_ts'], row['id']))
+        if row['sale_end_ts'] is not None:
+            heap.append((row['sale_end_ts'], row['id']))
+    heapq.heapify(heap)
+    _heap[:] = heap
+    logger.info(f"Планировщик акций: событий в расписании — {len(heap)}")
+
+
+async def _apply_due(game_ids: list[int], now: int):
+    """Снимает закончившиеся и включает начавшиеся акции одной транзакцией."""
+    placeholders = ", ".join("?" * len(game_ids))
+
+    async def op(db):
+        ended = await db.execute(
+            f"UPDATE steam_keys SET sale_active = 0, sale_not = NULL, sale_ends_at = NULL, "
+            f"sale_percent = NULL, sale_start_ts = NULL, sale_end_ts = NULL "
+            f"WHERE id IN ({placeholders}) AND sale_end_ts <= ?",
+            (*game_ids, now)
+        )
+        started = await db.execute(
+            f"UPDATE steam_keys SET sale_active = 1 "
+            f"WHERE id IN ({placeholders}) AND sale_active = 0 AND sale_start_ts <= ? "
+            f"AND (sale_end_ts IS NULL OR sale_end_ts > ?)",
+            (*game_ids, now, now)
+        )
+        return ended.rowcount, started.rowcount
+
+    ended, started = await writer.submit(op)
+    for game_id in set(game_ids):
+        await catalog_cache.refresh(game_id)
+    logger.info(f"Акции по расписанию: снято {ended}, включено {started} ({sorted(set(game_ids))})")
+
+
+async def _scheduler_loop():
+    global _reload_needed
+    # wait_for в 3.11 может проглотить cancel(), если событие пришло одновременно, — поэтому флаг
+    while not _stopping:
+        try:
+            # Сбрасываем до проверки флага: reload() во время шага разбудит следующее ожидание
+            _wakeup.clear()
+            if _reload_needed:
+                _reload_needed = False
+                await _load_heap()
+
+            now = int(datetime.now().timestamp())
+            due = []
+            while _heap and _heap[0][0] <= now:
+                due.append(heapq.heappop(_heap)[1])
+            if due:
+                await _apply_due(due, now)
+
+            timeout = _heap[0][0] - now if _heap else None
+            try:
+                await asyncio.wait_for(_wakeup.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error(f"Ошибка в планировщике акций: {e}", exc_info=True)
+            _reload_needed = True
+            await asyncio.sleep(5)
+
+
+async def start_scheduler():
+    """Запускает задачу планировщика (после open_db)."""
+    global _task, _wakeup, _reload_needed, _stopping
+    if _task is not None and not _task.done():
+        return
+    _wakeup = asyncio.Event()
+    _reload_needed = True
+    _stopping = False
+    _task = asyncio.create_task(_scheduler_loop(), name="sale-scheduler")
+
+
+async def stop_scheduler():
+    global _task, _stopping
+    if _task is None:
+        return
+    _stopping = True
+    _wakeup.set()
+    _task.cancel()
+    try:
+        await _task
+    except asyncio.CancelledError:
+        pass
+    _task = None
+
+
+async def reload():
+    """Акции изменились (/sale, /sale_off) — перечитать кучу при следующем шаге."""
+    global _reload_needed
+    _reload_needed = True
+    if _wakeup is not None:
+        _wakeup.set()
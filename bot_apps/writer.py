@@ -0,0 +1,141 @@
+# bot_apps/writer.py
+import asyncio
+import logging
+from collections import namedtuple
+
+from bot_apps import pool
+from bot_apps.pool import DB_NAME
+
+logger = logging.getLogger(__name__)
+
+# Сколько ждём "попутные" записи после первой, прежде чем закоммитить пачку
+BATCH_WINDOW = 0.003
+MAX_BATCH = 200
+
+WriteResult = namedtuple('WriteResult', ['lastrowid', 'rowcount'])
+
+_queue: asyncio.Queue | None = None
+_task: asyncio.Task | None = None
+_STOP = object()
+
+
+async def start_writer(db_name: str = DB_NAME):
+    """Запускает единственную задачу-писателя со своим соединением."""
+    global _queue, _task
+    if _task is not None and not _task.done():
+        return
+    # isolation_level=None — транзакциями управляем сами (BEGIN/COMMIT)
+    conn = await pool.open_connection(db_name, isolation_level=None)
+    _queue = asyncio.Queue()
+    _task = asyncio.create_task(_writer_loop(conn, _queue), name="db-writer")
+    logger.info("Писатель БД запущен")
+
+
+async def stop_writer():
+    """Дописывает всё, что в очереди, и останавливает писателя."""
+    global _queue, _task
+    if _task is None:
+        return
+    _queue.put_nowait(_STOP)
+    try:
+        await _task
+    finally:
+        _queue = None
+        _task = None
+    logger.info("Писатель БД остановлен")
+
+
+async def submit(op):
+    """
+    Ставит операцию записи в очередь и ждёт её результата.
+    op — async функция op(db), которая выполняет запросы и возвращает результат.
+    Коммитить внутри op нельзя — это делает писатель для всей пачки.
+    """
+    if _task is None or _task.done():
+        await start_writer()
+    future = asyncio.get_running_loop().create_future()
+    _queue.put_nowait((op, future))
+    return await future
+
+
+async def execute(sql: str, params=()) -> WriteResult:
+    """Одна команда записи (INSERT/UPDATE/DELETE)."""
+    async def op(db):
+        cursor = await db.execute(sql, params)
+        return WriteResult(cursor.lastrowid, cursor.rowcount)
+
+    return await submit(op)
+
+
+async def executemany(sql: str, seq_of_params) -> WriteResult:
+    """Одна команда записи для множества наборов параметров."""
+    async def op(db):
+        cursor = await db.executemany(sql, seq_of_params)
+        return WriteResult(cursor.lastrowid, cursor.rowcount)
+
+    return await submit(op)
+
+
+async def _writer_loop(conn, queue: asyncio.Queue):
+    loop = asyncio.get_running_loop()
+    stopping = False
+    try:
+        while not stopping:
+            item = await queue.get()
+            if item is _STOP:
+                break
+            batch = [item]
+
+            # Групповой коммит: собираем всё, что успело прийти за окно
+            deadline = loop.time() + BATCH_WINDOW
+            while len(batch) < MAX_BATCH:
+                try:
+                    item = queue.get_nowait()
+                except asyncio.QueueEmpty:
+                    timeout = deadline - loop.time()
+                    if timeout <= 0:
+                        break
+                    try:
+                        item = await asyncio.wait_for(queue.get(), timeout)
+                    except asyncio.TimeoutError:
+                        break
+                if item is _STOP:
+                    stopping = True
+                    break
+                batch.append(item)
+
+            await _commit_batch(conn, batch)
+    finally:
+        await conn.close()
+
+
+async def _commit_batch(conn, batch):
+    """Выполняет пачку операций в одной транзакции, каждую — в своём SAVEPOINT."""
+    results = []
+    try:
+        await conn.execute("BEGIN IMMEDIATE")
+        for op, future in batch:
+            await conn.execute("SAVEPOINT op")
+            try:
+                result = await op(conn)
+                await conn.execute("RELEASE op")
+                results.append((future, result, None))
+            except Exception as e:
+                # Ошибка одной операции не должна откатывать соседние
+                await conn.execute("ROLLBACK TO op")
+                await conn.execute("RELEASE op")
+                results.append((future, None, e))
+        await conn.execute("COMMIT")
+    except Exception as e:
+        logger.error(f"Ошибка группового коммита ({len(batch)} операций): {e}", exc_info=True)
+        if conn.in_transaction:
+            await conn.execute("ROLLBACK")
+        results = [(future, None, e) for _, future in batch]
+
+    for future, result, error in results:
+        if future.done():
+            continue
+        if error is not None:
+            future.set_exception(error)
+        else:
+            future.set_result(result)